@@ -0,0 +1,341 @@
+import itertools
+import json
+import os
+import platform
+import random
+import queue
+import sys
+import time
+from array import array
+from collections import defaultdict
+
+from trading_arena import (MatchingEngine, OrderBatch, LimitOrder, IOCOrder, MarketOrder, OrderSide, OrderType,
+                           Exchange, ActionType, Trader, Runtime)
+from sharded_exchange import ShardedExchange
+
+
+# Benchmarks for the matching engine. Run this file directly to print the results.
+
+def random_flow(n, seed=0):
+    # n new orders around a mid price of 100: mostly limit orders, with some IOC and market orders
+    rng = random.Random(seed)
+    sides = array('b', [rng.randint(1, 2) for _ in range(n)])
+    types = array('b', [rng.choice((1, 1, 1, 1, 1, 1, 1, 1, 2, 3)) for _ in range(n)])
+    prices = array('d', [rng.randint(95, 105) for _ in range(n)])
+    quantities = array('q', [rng.randint(1, 100) for _ in range(n)])
+    return sides, types, prices, quantities
+
+
+def run_sequential(sides, types, prices, quantities):
+    # one order object and one handle_order call per order, as the exchange does today
+    matching_engine = MatchingEngine()
+    for i in range(len(sides)):
+        side = OrderSide(sides[i])
+        if types[i] == OrderType.LIMIT.value:
+            order = LimitOrder(None, 'AAPL', quantities[i], prices[i], side, 0.0)
+        elif types[i] == OrderType.IOC.value:
+            order = IOCOrder(None, 'AAPL', quantities[i], prices[i], side, 0.0)
+        else:
+            order = MarketOrder(None, 'AAPL', quantities[i], side, 0.0)
+        matching_engine.handle_order(order)
+    return matching_engine
+
+
+def run_batched(sides, types, prices, quantities, batch_size):
+    matching_engine = MatchingEngine()
+    for start in range(0, len(sides), batch_size):
+        end = start + batch_size
+        matching_engine.handle_orders(OrderBatch(None, sides[start:end], types[start:end], prices[start:end],
+                                                 quantities[start:end], 'AAPL'))
+    return matching_engine
+
+
+def bench_batch(total=200000, batch_sizes=(1, 10, 100, 1000, 10000, 100000)):
+    # throughput of handle_orders at different batch sizes against one handle_order call per order
+    flow = random_flow(total)
+    start = time.perf_counter()
+    run_sequential(*flow)
+    sequential = total / (time.perf_counter() - start)
+    print('%-12s %14s %8s' % ('batch size', 'orders/sec', 'speedup'))
+    print('%-12s %14.0f %8.2f' % ('sequential', sequential, 1.0))
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        run_batched(*flow, batch_size)
+        batched = total / (time.perf_counter() - start)
+        print('%-12d %14.0f %8.2f' % (batch_size, batched, batched / sequential))
+
+
+def multi_symbol_requests(n, symbols=64, traders=100, seed=0):
+    # n place-order requests spread evenly over the given number of symbols
+    rng = random.Random(seed)
+    names = ['SYM%d' % i for i in range(symbols)]
+    return [(ActionType.PLACE_ORDER.value, rng.randrange(traders),
+             LimitOrder(None, names[i % symbols], rng.randint(1, 100), rng.randint(95, 105),
+                        OrderSide(rng.randint(1, 2)), 0.0))
+            for i in range(n)]
+
+
+def bench_sharded(total=200000, symbols=64, shard_counts=None):
+    # requests/sec of one in-process Exchange against a ShardedExchange with 1, 2, 4, ... workers
+    if shard_counts is None:
+        shard_counts = [1]
+        while shard_counts[-1] * 2 <= os.cpu_count():
+            shard_counts.append(shard_counts[-1] * 2)
+    requests = multi_symbol_requests(total, symbols)
+    exchange = Exchange()
+    exchange.mailboxes = defaultdict(queue.SimpleQueue)
+    start = time.perf_counter()
+    for request in requests:
+        exchange.handle_request(request)
+    single = total / (time.perf_counter() - start)
+    print('%-12s %14s %8s' % ('shards', 'requests/sec', 'speedup'))
+    print('%-12s %14.0f %8.2f' % ('in-process', single, 1.0))
+    for shards in shard_counts:
+        requests = multi_symbol_requests(total, symbols)
+        sharded = ShardedExchange(shards, mailboxes=defaultdict(queue.SimpleQueue))
+        sharded.start()
+        start = time.perf_counter()
+        for request in requests:
+            sharded.submit(request)
+        sharded.stop()
+        throughput = total / (time.perf_counter() - start)
+        print('%-12d %14.0f %8.2f' % (shards, throughput, throughput / single))
+
+
+def bench_async_traders(trader_counts=(100, 1000, 10000, 50000), steps=10):
+    # requests/sec of the asyncio Runtime as the number of simulated traders grows, with every
+    # trader a task on one event loop
+    print('%-12s %14s %10s' % ('traders', 'requests/sec', 'seconds'))
+    for traders in trader_counts:
+        exchange = Exchange(traders)
+        population = [Trader(i) for i in range(traders)]
+        start = time.perf_counter()
+        Runtime(exchange, population, 'asyncio').run(steps)
+        elapsed = time.perf_counter() - start
+        print('%-12d %14.0f %10.2f' % (traders, traders * steps / elapsed, elapsed))
+
+
+# Per-operation micro-benchmarks. Every scenario builds a book with depth resting orders split
+# evenly between bids and asks and spread over levels price levels per side, then times one
+# operation at a time against it. Operations that take orders out of the book put equivalent ones
+# back after each sample, outside the timed part, so the book keeps its shape for the whole run.
+# Latencies include the cost of two perf_counter_ns calls (roughly 0.1us).
+
+MID_PRICE = 100000
+RESTING_QUANTITY = 1000000
+# resting orders are large enough that amending one down by 1 each sample never runs it out
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p99.9', 0.999))
+
+
+def build_book(depth, levels, seed=0):
+    # a MatchingEngine with depth resting limit orders: bids at the levels just under MID_PRICE,
+    # asks at the levels just over it
+    matching_engine = MatchingEngine("BENCH")
+    rng = random.Random(seed)
+    for i in range(depth):
+        level = rng.randrange(levels) + 1
+        if i % 2 == 0:
+            side, price = OrderSide.BUY, MID_PRICE - level
+        else:
+            side, price = OrderSide.SELL, MID_PRICE + level
+        matching_engine.insert_limit_order(LimitOrder.unchecked(matching_engine.next_order_id(), "BENCH",
+                                                                RESTING_QUANTITY, side, 0.0, price))
+    return matching_engine
+
+
+def replace_fills(matching_engine, reports, side):
+    # puts back a resting order on side for every one the reports filled completely
+    for report in reports:
+        if matching_engine.orders.get(report.passive_id) is None:
+            matching_engine.insert_limit_order(LimitOrder.unchecked(matching_engine.next_order_id(), "BENCH",
+                                                                    report.quantity, side, 0.0, report.price))
+
+
+def time_operation(samples, operation, restore=None, prepare=None):
+    # latencies in ns of samples calls of operation(i), or of operation(prepare(i)) when prepare is
+    # given; prepare(i) runs just before each call and restore(i, result) just after it, both
+    # outside the timing
+    clock = time.perf_counter_ns
+    latencies = array('q', bytes(8 * samples))
+    for i in range(samples):
+        argument = i if prepare is None else prepare(i)
+        start = clock()
+        result = operation(argument)
+        latencies[i] = clock() - start
+        if restore is not None:
+            restore(i, result)
+    return latencies
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    summary = {'samples': len(ordered), 'ops_per_sec': round(len(ordered) * 1e9 / sum(ordered))}
+    for name, quantile in PERCENTILES:
+        summary[name + '_ns'] = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+    summary['max_ns'] = ordered[-1]
+    return summary
+
+
+def bench_operations_on(matching_engine, levels, samples, sweep_depths, cancel_ratios, seed=0):
+    # {(operation, parameter): latencies} for every operation against a book from build_book
+    rng = random.Random(seed)
+    results = {}
+    orders = matching_engine.orders
+
+    def new_order(side, price, quantity=RESTING_QUANTITY):
+        return LimitOrder.unchecked(matching_engine.next_order_id(), "BENCH", quantity, side, 0.0, price)
+
+    def random_price(side):
+        level = rng.randrange(levels) + 1
+        return MID_PRICE - level if side == OrderSide.BUY else MID_PRICE + level
+
+    # a non-crossing limit order joining a random level, removed again afterwards
+    sides = [OrderSide(rng.randint(1, 2)) for _ in range(samples)]
+    inserted = [new_order(side, random_price(side)) for side in sides]
+    results['insert_limit_order', None] = time_operation(
+        samples, lambda i: matching_engine.insert_limit_order(inserted[i]),
+        lambda i, result: matching_engine.cancel_order(inserted[i].id))
+
+    # a limit order filling the oldest order at the best opposite price exactly
+    def crossing(order_class):
+        def prepare(i):
+            book = matching_engine.asks if sides[i] == OrderSide.BUY else matching_engine.bids
+            price = book.best_price()
+            resting = next(iter(book.levels[price].values()))
+            return order_class.unchecked(matching_engine.next_order_id(), "BENCH", resting.quantity, sides[i], 0.0,
+                                         price)
+        return prepare
+
+    def restore_fills(i, reports):
+        replace_fills(matching_engine, reports, OrderSide.SELL if sides[i] == OrderSide.BUY else OrderSide.BUY)
+
+    results['handle_limit_order', None] = time_operation(samples, matching_engine.handle_limit_order, restore_fills,
+                                                         crossing(LimitOrder))
+    results['handle_ioc_order', None] = time_operation(samples, matching_engine.handle_ioc_order, restore_fills,
+                                                       crossing(IOCOrder))
+
+    # a market order exactly as large as the sweep_depth orders at the front of the opposite side,
+    # across as many levels as they take up
+    for sweep_depth in sweep_depths:
+        def sweep(i):
+            book = matching_engine.asks if sides[i] == OrderSide.BUY else matching_engine.bids
+            quantity = sum(order.quantity for order in itertools.islice(book, sweep_depth))
+            return MarketOrder.unchecked(matching_engine.next_order_id(), "BENCH", quantity, sides[i], 0.0)
+        results['handle_market_order', sweep_depth] = time_operation(samples, matching_engine.handle_market_order,
+                                                                     restore_fills, sweep)
+
+    # amending a random resting order down by 1
+    ids = list(orders)
+    picks = [rng.randrange(len(ids)) for _ in range(samples)]
+    results['amend_quantity', None] = time_operation(
+        samples, lambda i: matching_engine.amend_quantity(ids[picks[i]], orders[ids[picks[i]]].quantity - 1))
+
+    # cancelling a random resting order, which is replaced by a new one at the same price
+    def cancel(i):
+        order = orders[ids[picks[i]]]
+        matching_engine.cancel_order(order.id)
+        return order
+
+    def replace(i, order):
+        replacement = new_order(order.side, order.price)
+        matching_engine.insert_limit_order(replacement)
+        ids[picks[i]] = replacement.id
+
+    results['cancel_order', None] = time_operation(samples, cancel, replace)
+
+    # a flow of new orders and cancels of random resting orders, cancel_ratio of them cancels
+    for cancel_ratio in cancel_ratios:
+        ids = list(orders)
+        cancels = [rng.random() < cancel_ratio for _ in range(samples)]
+
+        def next_request(i):
+            # the id to cancel, or the new order to insert
+            if cancels[i] and ids:
+                j = rng.randrange(len(ids))
+                ids[j], ids[-1] = ids[-1], ids[j]
+                return ids.pop()
+            order = new_order(sides[i], random_price(sides[i]))
+            ids.append(order.id)
+            return order
+
+        def mixed(request):
+            if type(request) is int:
+                return matching_engine.cancel_order(request)
+            return matching_engine.insert_limit_order(request)
+        results['mixed', cancel_ratio] = time_operation(samples, mixed, prepare=next_request)
+    return results
+
+
+def bench_operations(depths=(10, 1000, 100000, 1000000), level_counts=(10, 1000), sweep_depths=(1, 10),
+                     cancel_ratios=(0.5, 0.9), samples=10000):
+    # one result dict per scenario and operation, ready for json
+    results = []
+    for depth in depths:
+        for levels in level_counts:
+            if levels * 2 > depth and levels != level_counts[0]:
+                # more levels than orders to put in them; the smallest level count still runs
+                continue
+            matching_engine = build_book(depth, levels)
+            timings = bench_operations_on(matching_engine, levels, samples, sweep_depths, cancel_ratios)
+            for (operation, parameter), latencies in timings.items():
+                result = {'operation': operation, 'depth': depth, 'levels': levels,
+                          'sweep_depth': parameter if operation == 'handle_market_order' else None,
+                          'cancel_ratio': parameter if operation == 'mixed' else None}
+                result.update(summarize(latencies))
+                results.append(result)
+                print('%-20s depth %-8d levels %-5d %-6s %10d ops/sec  p50 %7dns  p99 %8dns  max %9dns' %
+                      (operation, depth, levels, '' if parameter is None else parameter, result['ops_per_sec'],
+                       result['p50_ns'], result['p99_ns'], result['max_ns']))
+    return results
+
+
+def scenario(result):
+    return result['operation'], result['depth'], result['levels'], result['sweep_depth'], result['cancel_ratio']
+
+
+def compare(results, baseline, tolerance=0.1, tail_tolerance=0.25):
+    # prints each scenario's throughput and p99 against the baseline run and returns the scenarios
+    # that got slower than allowed: throughput down by more than the fraction tolerance, or p99 up
+    # by more than tail_tolerance (tail latency is the noisier of the two)
+    previous = {scenario(result): result for result in baseline['results']}
+    regressions = []
+    print('%-20s %-8s %-6s %-6s %12s %12s' % ('operation', 'depth', 'levels', 'param', 'throughput', 'p99'))
+    for result in results['results']:
+        before = previous.get(scenario(result))
+        if before is None:
+            continue
+        throughput = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        p99 = result['p99_ns'] / before['p99_ns'] - 1
+        regressed = throughput < -tolerance or p99 > tail_tolerance
+        parameter = result['sweep_depth'] if result['sweep_depth'] is not None else result['cancel_ratio']
+        print('%-20s %-8d %-6d %-6s %+11.1f%% %+11.1f%%%s' %
+              (result['operation'], result['depth'], result['levels'], '' if parameter is None else parameter,
+               100 * throughput, 100 * p99, '  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(result)
+    return regressions
+
+
+if __name__ == "__main__":
+    # python benchmarks.py
+    #     batch, sharded and asyncio trader benchmarks
+    # python benchmarks.py operations RESULTS.json [BASELINE.json]
+    #     per-operation micro-benchmarks, saved to RESULTS.json and compared against BASELINE.json;
+    #     exits with status 1 if any scenario regressed
+    if len(sys.argv) > 1 and sys.argv[1] == 'operations':
+        results = {'python': platform.python_version(), 'machine': platform.platform(), 'time': time.time(),
+                   'results': bench_operations()}
+        with open(sys.argv[2], 'w') as f:
+            json.dump(results, f, indent=1)
+        if len(sys.argv) > 3:
+            with open(sys.argv[3]) as f:
+                baseline = json.load(f)
+            print()
+            if compare(results, baseline):
+                sys.exit(1)
+    else:
+        bench_batch()
+        print()
+        bench_sharded()
+        print()
+        bench_async_traders()
@@ -0,0 +1,254 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import defaultdict
+
+from trading_arena import (Exchange, Trader, Runtime, ActionType, OrderSide, OrderType, LimitOrder, MarketOrder,
+                           IOCOrder, UndefinedTraderAction, tick_digits)
+
+
+# A write-ahead journal of the requests an Exchange handles, and a replay that rebuilds the books,
+# balances and positions from it.
+#
+# Every request is one fixed-width little endian record of RECORD.size (48) bytes:
+#   action       B   ActionType value, or ADD_TRADER or REMOVE_TRADER for the exchange's registry,
+#                    or ADD_SYMBOL for a book the exchange was told to create
+#   order type   B   OrderType value of a placed order, 0 otherwise
+#   side         B   OrderSide value of a placed order, 0 otherwise
+#   flags        B   INTEGER_PRICE if the order's price was an int; the ladder flags of an ADD_SYMBOL
+#   trader id    I
+#   quantity     q   quantity of a placed order, the new quantity of an amend, or the highest tick
+#                    of an ADD_SYMBOL's ladder
+#   price        d   0 for market orders; the tick size of an ADD_SYMBOL
+#   time         d   the lowest price of an ADD_SYMBOL
+#   symbol       16s UTF-8, null padded
+# Order ids are not recorded: the engine hands them out in the order requests arrive, so a replay
+# assigns the same ones again. The same goes for the symbol ids in them, which is why books made
+# with Exchange.add_symbol are journaled; those made by a symbol's first order need no record.
+
+RECORD = struct.Struct('<BBBBIqdd16s')
+INTEGER_PRICE = 1
+SYMBOL_SIZE = 16
+ADD_TRADER = 5
+REMOVE_TRADER = 6
+# the registry actions, numbered after the ActionTypes; their records only carry the trader id
+ADD_SYMBOL = 7
+LADDER = 1
+# set in an ADD_SYMBOL's flags if the book is on a price ladder. The next three bits are set for
+# each of the tick size, lowest and highest price that was an int, as in a snapshot's symbol
+# header. The highest price is recorded as its tick index, since the record has only two float
+# fields, and comes back rounded to the tick size's decimal places like every ladder price.
+
+ORDER_CLASSES = (None, LimitOrder, MarketOrder, IOCOrder)
+SIDES = (None, OrderSide.BUY, OrderSide.SELL)
+# indexed by the OrderType and OrderSide values stored in a record
+
+
+class SymbolTooLong(Exception):
+    pass
+
+
+class RequestJournal():
+    # Appends requests to the journal file at path. Records are packed into a buffer of
+    # buffer_size records and written out a whole buffer at a time, so a crash loses at most the
+    # requests since the last flush. Set it as Exchange.journal to record everything the exchange
+    # handles, along with the traders it adds and removes.
+    def __init__(self, path, buffer_size=16384):
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD.size:
+                # a record cut short by a crash is dropped, so the records appended next line up
+                os.truncate(path, size - size % RECORD.size)
+        self.file = open(path, 'ab')
+        self.buffer = bytearray(buffer_size * RECORD.size)
+        self.offset = 0
+        self.symbols = {}
+        # symbol -> encoded bytes, so each symbol is only encoded once
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        # the number of requests in the journal, including those still in the buffer
+        return (self.file.tell() + self.offset) // RECORD.size
+
+    def append(self, request):
+        if self.offset == len(self.buffer):
+            self.flush()
+        action = request[0]
+        if action == ActionType.PLACE_ORDER.value:
+            order = request[2]
+            symbol = self.encode(order.symbol)
+            price = getattr(order, 'price', 0.0)
+            # a market order has no price until its remainder rests, which is after it is journaled
+            RECORD.pack_into(self.buffer, self.offset, action, order.type.value, order.side.value,
+                             INTEGER_PRICE if type(price) is int else 0, request[1], order.quantity, price,
+                             order.time, symbol)
+        elif action == ActionType.AMEND_ORDER.value:
+            RECORD.pack_into(self.buffer, self.offset, action, 0, 0, 0, request[1], request[2], 0.0, 0.0, b'')
+        elif action == ActionType.CANCEL_ORDER.value or action == ActionType.RETURN_POSITION.value:
+            RECORD.pack_into(self.buffer, self.offset, action, 0, 0, 0, request[1], 0, 0.0, 0.0, b'')
+        else:
+            raise UndefinedTraderAction("Undefined Trader Action!")
+        self.offset += RECORD.size
+
+    def append_batch(self, batch, trader_ids):
+        # an OrderBatch as one place record per order, in batch order, with trader_ids giving the
+        # trader behind each; a replay handles them one at a time, which ends up the same
+        symbol = self.encode(batch.symbol)
+        _, sides, types, prices, quantities = batch.columns()
+        market, place, order_time = OrderType.MARKET.value, ActionType.PLACE_ORDER.value, batch.time
+        for trader_id, side, order_type, price, quantity in zip(trader_ids, sides, types, prices, quantities):
+            if self.offset == len(self.buffer):
+                self.flush()
+            if order_type == market:
+                price = 0.0
+            RECORD.pack_into(self.buffer, self.offset, place, order_type, side,
+                             INTEGER_PRICE if type(price) is int else 0, trader_id, quantity, price, order_time, symbol)
+            self.offset += RECORD.size
+
+    def encode(self, symbol):
+        encoded = self.symbols.get(symbol)
+        if encoded is None:
+            encoded = symbol.encode()
+            if len(encoded) > SYMBOL_SIZE:
+                raise SymbolTooLong("Symbol Must Fit In " + str(SYMBOL_SIZE) + " Bytes!")
+            self.symbols[symbol] = encoded
+        return encoded
+
+    def add_trader(self, trader_id):
+        self.append_registry(ADD_TRADER, trader_id)
+
+    def remove_trader(self, trader_id):
+        self.append_registry(REMOVE_TRADER, trader_id)
+
+    def add_symbol(self, symbol, tick_size=None, min_price=None, max_price=None):
+        if self.offset == len(self.buffer):
+            self.flush()
+        if tick_size is None:
+            RECORD.pack_into(self.buffer, self.offset, ADD_SYMBOL, 0, 0, 0, 0, 0, 0.0, 0.0, self.encode(symbol))
+        else:
+            flags = LADDER
+            for i, value in enumerate((tick_size, min_price, max_price)):
+                if type(value) is int:
+                    flags |= 2 << i
+            RECORD.pack_into(self.buffer, self.offset, ADD_SYMBOL, 0, 0, flags, 0, round(max_price / tick_size),
+                             tick_size, min_price, self.encode(symbol))
+        self.offset += RECORD.size
+
+    def append_registry(self, action, trader_id):
+        if self.offset == len(self.buffer):
+            self.flush()
+        RECORD.pack_into(self.buffer, self.offset, action, 0, 0, 0, trader_id, 0, 0.0, 0.0, b'')
+        self.offset += RECORD.size
+
+    def flush(self, sync=False):
+        # write out the buffered records; with sync=True, also wait until they are on disk
+        if self.offset:
+            self.file.write(memoryview(self.buffer)[:self.offset])
+            self.offset = 0
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def decode(record, symbols):
+    # the request a record was made from. symbols caches the decoded symbol of each raw field.
+    action, order_type, side, flags, trader_id, quantity, price, order_time, symbol = record
+    if action == ActionType.PLACE_ORDER.value:
+        name = symbols.get(symbol)
+        if name is None:
+            name = symbols[symbol] = symbol.rstrip(b'\0').decode()
+        if flags & INTEGER_PRICE:
+            price = int(price)
+        # the orders were validated when they were first created, so the checks are skipped
+        order = ORDER_CLASSES[order_type].unchecked(None, name, quantity, SIDES[side], order_time,
+                                                     None if order_type == OrderType.MARKET.value else price)
+        return action, trader_id, order
+    elif action == ActionType.AMEND_ORDER.value:
+        return action, trader_id, quantity
+    elif action == ADD_SYMBOL:
+        name = symbol.rstrip(b'\0').decode()
+        if not flags & LADDER:
+            return action, name, None, None, None
+        # price holds the tick size, order_time the lowest price and quantity the highest tick
+        settings = (price, order_time, round(quantity * price, tick_digits(price)))
+        return (action, name) + tuple(int(value) if flags & 2 << i else value for i, value in enumerate(settings))
+    return action, trader_id
+
+
+def read_journal(path, start=0):
+    # every request in the journal from the start-th on, in the order they were handled. A record
+    # cut short by a crash while it was being written is ignored.
+    if os.path.getsize(path) <= start * RECORD.size:
+        return
+    symbols = {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as journal:
+        with memoryview(journal) as view:
+            with view[start * RECORD.size:len(view) - len(view) % RECORD.size] as records:
+                for record in RECORD.iter_unpack(records):
+                    yield decode(record, symbols)
+
+
+class NullMailbox():
+    # drops the acks of a replayed exchange; no trader is waiting for them
+    def put_nowait(self, response):
+        pass
+
+
+def replay(path, exchange=None, traders=0, start=0):
+    # feeds the requests in the journal from the start-th on through exchange (a new one with
+    # accounts for traders traders by default, opening more as the requests need them) and returns
+    # it, with the books, balances and positions it ended with. The acks are dropped.
+    if exchange is None:
+        exchange = Exchange(traders)
+    mailboxes = exchange.mailboxes
+    exchange.mailboxes = defaultdict(NullMailbox)
+    handle_request = exchange.handle_request
+    try:
+        for request in read_journal(path, start):
+            if request[0] < ADD_TRADER:
+                handle_request(request)
+            elif request[0] == ADD_TRADER:
+                exchange.add_trader(request[1])
+            elif request[0] == REMOVE_TRADER:
+                exchange.remove_trader(request[1])
+            else:
+                exchange.add_symbol(*request[1:])
+    finally:
+        exchange.mailboxes = mailboxes
+    return exchange
+
+
+if __name__ == "__main__":
+    # python journal.py record PATH [backend] [number of traders]
+    #     runs a session of the trading arena, journaling every request to PATH
+    # python journal.py replay PATH [number of traders to open accounts for up front]
+    #     rebuilds the exchange from the journal at PATH and reports how fast it went
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'record':
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'thread'
+        traders = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+        exchange = Exchange(traders)
+        with RequestJournal(path) as exchange.journal:
+            Runtime(exchange, [Trader(i) for i in range(traders)], backend).run(10)
+        print('recorded ', os.path.getsize(path) // RECORD.size, ' requests')
+    elif command == 'replay':
+        traders = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        start = time.perf_counter()
+        exchange = replay(path, traders=traders)
+        elapsed = time.perf_counter() - start
+        events = os.path.getsize(path) // RECORD.size
+        print('replayed ', events, ' requests in ', elapsed, ' seconds (', int(events / elapsed), ' per second)')
+    else:
+        raise ValueError("Command Must Be Either record or replay!")
+    print("Total Money Amount for All Traders: ", str(int(sum(exchange.balance))))
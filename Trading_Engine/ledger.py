@@ -0,0 +1,145 @@
+import sys
+import time
+
+import numpy as np
+
+from trading_arena import OrderSide
+from tape import TradeTape
+
+
+# Trader accounts held as NumPy arrays, for work over many accounts at once: applying a whole
+# batch of fills in one scatter-add, marking every account to market, and risk totals across all
+# of them.
+#
+# positions[trader, symbol] is what the trader holds, long positive. Exchange.position records the
+# exchange's side of the same positions, with the opposite sign.
+
+STARTING_BALANCE = 1000000
+
+
+def net_fills(buyers, sellers, prices, quantities):
+    # a batch of fills netted per trader: the ids of the traders in it, the cash each received
+    # (negative for a net buyer) and the quantity each bought (negative for a net seller), summed
+    # with one bincount per column. Exchange.place_orders settles its batches with this.
+    buyers = np.asarray(buyers, np.int64)
+    sellers = np.asarray(sellers, np.int64)
+    quantities = np.asarray(quantities, np.int64)
+    cash = np.asarray(prices, np.float64) * quantities
+    traders, index = np.unique(np.concatenate((buyers, sellers)), return_inverse=True)
+    received = np.bincount(index, np.concatenate((-cash, cash)), len(traders))
+    bought = np.bincount(index, np.concatenate((quantities, -quantities)), len(traders)).astype(np.int64)
+    return traders, received, bought
+
+
+class AccountLedger():
+    def __init__(self, traders=0, symbols=(), balance=STARTING_BALANCE):
+        self.balance = np.full(traders, balance, np.float64)
+        self.symbols = list(symbols)
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.positions = np.zeros((traders, len(self.symbols)), np.int64)
+        self.last_prices = np.full(len(self.symbols), np.nan)
+        # price of the last trade applied in each symbol, NaN before the first
+
+    @classmethod
+    def from_exchange(cls, exchange):
+        # a ledger with the balances and positions of exchange
+        ledger = cls(len(exchange.balance), exchange.router.symbols)
+        ledger.balance[:] = exchange.balance
+        for trader_id, position in exchange.position.items():
+            for symbol, quantity in position.items():
+                ledger.positions[trader_id, ledger.symbol_ids[symbol]] = -quantity
+        return ledger
+
+    def symbol_id(self, symbol):
+        # the column of symbol in positions, adding one if it is new
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self.positions = np.hstack((self.positions, np.zeros((len(self.balance), 1), np.int64)))
+            self.last_prices = np.append(self.last_prices, np.nan)
+        return symbol_id
+
+    def grow(self, traders, balance=STARTING_BALANCE):
+        # makes room for traders accounts, opening the new ones with balance
+        added = traders - len(self.balance)
+        if added > 0:
+            self.balance = np.concatenate((self.balance, np.full(added, balance, np.float64)))
+            self.positions = np.vstack((self.positions, np.zeros((added, len(self.symbols)), np.int64)))
+
+    def apply_fills(self, buyers, sellers, symbols, prices, quantities):
+        # settles a batch of trades given as equal length columns: the buying and selling trader ids,
+        # symbol columns (as returned by symbol_id), prices and quantities. Trades are applied in
+        # order, so the last one of each symbol sets its last price.
+        buyers = np.asarray(buyers, np.int64)
+        sellers = np.asarray(sellers, np.int64)
+        symbols = np.asarray(symbols, np.int64)
+        prices = np.asarray(prices, np.float64)
+        quantities = np.asarray(quantities, np.int64)
+        if len(quantities) == 0:
+            return
+        self.grow(int(max(buyers.max(), sellers.max())) + 1)
+        cash = prices * quantities
+        np.subtract.at(self.balance, buyers, cash)
+        np.add.at(self.balance, sellers, cash)
+        # positions are scattered into through a flat view, which is much faster than a 2D index
+        positions = self.positions.reshape(-1)
+        width = len(self.symbols)
+        np.add.at(positions, buyers * width + symbols, quantities)
+        np.subtract.at(positions, sellers * width + symbols, quantities)
+        last = np.full(width, -1, np.int64)
+        np.maximum.at(last, symbols, np.arange(len(symbols)))
+        traded = last >= 0
+        self.last_prices[traded] = prices[last[traded]]
+
+    def apply_tape(self, tape, start=0):
+        # settles the trades on a TradeTape from the start-th on, and returns how many there were
+        columns = tape.columns()
+        trades = {name: column[start:] for name, column in columns.items()}
+        symbol_ids = np.array([self.symbol_id(symbol) for symbol in tape.read_symbols()], np.int64)
+        buying = trades['side'] == OrderSide.BUY.value
+        self.apply_fills(np.where(buying, trades['aggressor'], trades['passive']),
+                         np.where(buying, trades['passive'], trades['aggressor']),
+                         symbol_ids[trades['symbol']],
+                         trades['price'], trades['quantity'])
+        return len(trades['quantity'])
+
+    def total_balance(self):
+        return float(self.balance.sum())
+
+    def marks(self, prices=None):
+        # prices to value positions at: the last trade prices unless given, with symbols that have
+        # not traded valued at 0
+        if prices is None:
+            prices = self.last_prices
+        return np.nan_to_num(np.asarray(prices, np.float64))
+
+    def equity(self, prices=None):
+        # every account's balance plus the value of its positions, marked at prices
+        return self.balance + self.positions @ self.marks(prices)
+
+    def exposure(self, prices=None):
+        # (gross, net) value of the positions held in each symbol across all accounts
+        marks = self.marks(prices)
+        return np.abs(self.positions).sum(axis=0) * marks, self.positions.sum(axis=0) * marks
+
+    def below(self, threshold, prices=None):
+        # ids of the traders whose equity is under threshold
+        return np.flatnonzero(self.equity(prices) < threshold)
+
+
+if __name__ == "__main__":
+    # python ledger.py TAPE [number of traders]
+    #     settles every trade on the tape at TAPE into fresh accounts and reports the totals
+    with TradeTape(sys.argv[1]) as tape:
+        ledger = AccountLedger(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+        start = time.perf_counter()
+        trades = ledger.apply_tape(tape)
+        elapsed = time.perf_counter() - start
+    print('settled ', trades, ' trades for ', len(ledger.balance), ' accounts in ', elapsed, ' seconds')
+    gross, net = ledger.exposure()
+    for symbol, last_price, symbol_gross in zip(ledger.symbols, ledger.last_prices, gross):
+        print(symbol, ' last price: ', last_price, ' gross exposure: ', symbol_gross)
+    equity = ledger.equity()
+    print('equity min: ', equity.min(), ' max: ', equity.max())
+    print("Total Money Amount for All Traders: ", str(int(ledger.total_balance())))
@@ -1,6 +1,10 @@
 import time
+import threading
+import struct
+from array import array
 
-from enum import Enum
+from enum import Enum, IntEnum
+from decimal import Decimal
 
 
 class OrderType(Enum):
@@ -14,6 +18,13 @@ class OrderSide(Enum):
     SELL = 2
 
 
+class BookUpdateType(Enum):
+    LEVEL_ADDED = 1
+    LEVEL_CHANGED = 2
+    LEVEL_REMOVED = 3
+    TRADE = 4
+
+
 class NonPositiveQuantity(Exception):
     pass
 
@@ -46,10 +57,64 @@ class UndefinedResponse(Exception):
     pass
 
 
+class DuplicateOrderId(Exception):
+    pass
+
+
+class SequenceGap(Exception):
+    pass
+
+
+class PriceNotOnTick(Exception):
+    pass
+
+
+class PriceOutOfBand(Exception):
+    pass
+
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+
+class LogEvent(IntEnum):
+    # what the trader, order, quantity and value fields of each event hold (unused ones are 0)
+    THREAD_WAITED = 1       # trader: the thread's id, -1 for the exchange
+    ORDER_HANDLED = 2       # order, quantity: left unfilled, value: price
+    FILL_SENT = 3           # trader: the one notified, order, quantity, value: price
+    TRADER_STEP = 4         # trader, quantity: steps taken by all traders so far
+    ACK_RECEIVED = 5        # trader, quantity: the ActionType value of the ack
+    POSITION_RECEIVED = 6   # trader, quantity: position in the trader's symbol, value: balance
+
+
 from abc import ABC
 
 
+ORDER_SIDES = frozenset((OrderSide.BUY, OrderSide.SELL))
+TICK_TOLERANCE = 1e-9
+# how far, in ticks, a float price may be from a multiple of the tick size and still count as on it
+
+
+def off_tick(price, tick_size):
+    ticks = price / tick_size
+    return abs(ticks - round(ticks)) > TICK_TOLERANCE
+
+
+def tick_digits(tick_size):
+    # the decimal places of a float tick size as written (1 for 0.1, 2 for 0.05), or None for an int
+    if type(tick_size) is int:
+        return None
+    return max(0, -Decimal(repr(tick_size)).normalize().as_tuple().exponent)
+
+
+# Orders use __slots__ rather than a per-instance __dict__, which keeps a resting order to a few
+# machine words. The order type is a class attribute since it never changes for a given class.
 class Order(ABC):
+    __slots__ = ('id', 'symbol', 'quantity', 'side', 'time')
+
     def __init__(self, id, symbol, quantity, side, time):
         self.id = id
         self.symbol = symbol
@@ -57,54 +122,649 @@ class Order(ABC):
             self.quantity = quantity
         else:
             raise NonPositiveQuantity("Quantity Must Be Positive!")
-        if side in [OrderSide.BUY, OrderSide.SELL]:
+        if side in ORDER_SIDES:
             self.side = side
         else:
             raise InvalidSide("Side Must Be Either \"Buy\" or \"OrderSide.SELL\"!")
         self.time = time
 
+    @classmethod
+    def unchecked(cls, id, symbol, quantity, side, time, price=None):
+        # builds an order from fields that were already validated in bulk (see OrderBatch),
+        # skipping the checks in __init__
+        order = cls.__new__(cls)
+        order.id = id
+        order.symbol = symbol
+        order.quantity = quantity
+        order.side = side
+        order.time = time
+        if price is not None:
+            order.price = price
+        return order
+
 
 class LimitOrder(Order):
-    def __init__(self, id, symbol, quantity, price, side, time):
+    __slots__ = ('price',)
+    type = OrderType.LIMIT
+
+    def __init__(self, id, symbol, quantity, price, side, time, tick_size=None):
         super().__init__(id, symbol, quantity, side, time)
         if price > 0:
             self.price = price
         else:
             raise NonPositivePrice("Price Must Be Positive!")
-        self.type = OrderType.LIMIT
+        if tick_size is not None and off_tick(price, tick_size):
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
 
 
 class MarketOrder(Order):
+    # price is only set if the remainder of the order comes to rest in the book
+    __slots__ = ('price',)
+    type = OrderType.MARKET
+
     def __init__(self, id, symbol, quantity, side, time):
         super().__init__(id, symbol, quantity, side, time)
-        self.type = OrderType.MARKET
 
 
 class IOCOrder(Order):
-    def __init__(self, id, symbol, quantity, price, side, time):
+    __slots__ = ('price',)
+    type = OrderType.IOC
+
+    def __init__(self, id, symbol, quantity, price, side, time, tick_size=None):
         super().__init__(id, symbol, quantity, side, time)
         if price > 0:
             self.price = price
         else:
             raise NonPositivePrice("Price Must Be Positive!")
-        self.type = OrderType.IOC
+        if tick_size is not None and off_tick(price, tick_size):
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
 
 
 class FilledOrder(Order):
+    # Fills are only ever built by the matching engine from orders that were validated when they
+    # were created, so the checks in Order.__init__ are skipped here.
+    __slots__ = ('price', 'limit')
+
     def __init__(self, id, symbol, quantity, price, side, time, limit=False):
-        super().__init__(id, symbol, quantity, side, time)
+        self.id = id
+        self.symbol = symbol
+        self.quantity = quantity
+        self.side = side
+        self.time = time
         self.price = price
         self.limit = limit
 
 
-from collections import deque
+class RejectedOrder(Order):
+    # Sent back to a trader in place of a fill for the part of an order that was not accepted:
+    # quantity is how much was rejected, type the OrderType of the order, and reason why.
+    __slots__ = ('type', 'reason')
 
+    def __init__(self, id, symbol, quantity, side, time, type, reason):
+        self.id = id
+        self.symbol = symbol
+        self.quantity = quantity
+        self.side = side
+        self.time = time
+        self.type = type
+        self.reason = reason
+
+
+class ExecutionReport():
+    # One record per match between an incoming (aggressor) order and a resting (passive) order.
+    # side is the aggressor's side; the passive order was on the other one. Turning a report into a
+    # fill notice for each of the two traders is left to the exchange gateway.
+    __slots__ = ('sequence', 'aggressor_id', 'passive_id', 'side', 'price', 'quantity')
+
+    def __init__(self, sequence, aggressor_id, passive_id, side, price, quantity):
+        self.sequence = sequence
+        self.aggressor_id = aggressor_id
+        self.passive_id = passive_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+
+
+class OrderBatch():
+    # A block of new orders for MatchingEngine.handle_orders, stored column by column.
+    # Each column is an array.array, a NumPy array or a list with one entry per order. Sides and
+    # types hold the OrderSide/OrderType enum values, and the price of a market order is ignored.
+    # id may be None, in which case the engine assigns ids and stores them in the batch.
+    __slots__ = ('id', 'side', 'type', 'price', 'quantity', 'symbol', 'time')
+
+    def __init__(self, id, side, type, price, quantity, symbol=None, time=0.0):
+        self.id = id
+        self.side = side
+        self.type = type
+        self.price = price
+        self.quantity = quantity
+        self.symbol = symbol
+        self.time = time
+
+    def __len__(self):
+        return len(self.side)
+
+    def columns(self):
+        # the columns as plain lists, which are the cheapest to index one order at a time;
+        # array.array and NumPy arrays both convert in bulk through tolist()
+        return tuple(None if column is None else column.tolist() if hasattr(column, 'tolist') else list(column)
+                     for column in (self.id, self.side, self.type, self.price, self.quantity))
+
+    @staticmethod
+    def validate(sides, types, prices, quantities, tick_size=None, band=None):
+        # the checks the Order constructors make, run once over whole columns. Limit and IOC prices
+        # are also checked against tick_size and the (lowest, highest) price band when given.
+        if not len(sides) == len(types) == len(prices) == len(quantities):
+            raise ValueError("Batch Columns Must Have The Same Length!")
+        if not sides:
+            return
+        if min(quantities) <= 0:
+            raise NonPositiveQuantity("Quantity Must Be Positive!")
+        if not set(sides) <= {OrderSide.BUY.value, OrderSide.SELL.value}:
+            raise InvalidSide("Side Must Be Either \"Buy\" or \"OrderSide.SELL\"!")
+        order_types = set(types)
+        if not order_types <= {OrderType.LIMIT.value, OrderType.MARKET.value, OrderType.IOC.value}:
+            raise UndefinedOrderType("Undefined Order Type!")
+        if OrderType.MARKET.value in order_types:
+            prices = [price for price, order_type in zip(prices, types) if order_type != OrderType.MARKET.value]
+        if not prices:
+            return
+        if min(prices) <= 0:
+            raise NonPositivePrice("Price Must Be Positive!")
+        if tick_size is not None and any(off_tick(price, tick_size) for price in prices):
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
+        if band is not None and (min(prices) < band[0] or max(prices) > band[1]):
+            raise PriceOutOfBand("Price Outside The Price Band!")
+
+
+class ExecutionColumns():
+    # Execution reports stored column by column in typed arrays, as returned by
+    # MatchingEngine.handle_orders. side holds the aggressor's OrderSide value.
+    __slots__ = ('sequence', 'aggressor_id', 'passive_id', 'side', 'price', 'quantity')
 
-class MatchingEngine():
     def __init__(self):
-        self.bid_book = []
-        self.ask_book = []
+        self.sequence = array('q')
+        self.aggressor_id = array('q')
+        self.passive_id = array('q')
+        self.side = array('b')
+        self.price = array('d')
+        self.quantity = array('q')
+
+    def add(self, sequence, aggressor_id, passive_id, side, price, quantity):
+        self.sequence.append(sequence)
+        self.aggressor_id.append(aggressor_id)
+        self.passive_id.append(passive_id)
+        self.side.append(side)
+        self.price.append(price)
+        self.quantity.append(quantity)
+
+    def __len__(self):
+        return len(self.sequence)
+
+
+class BookUpdate():
+    # One incremental market data update from MatchingEngine, numbered by sequence within its
+    # symbol. A level update carries the new total quantity at price on side (0 once the level is
+    # removed); a trade carries the traded price and quantity, with side the aggressor's side.
+    __slots__ = ('sequence', 'type', 'side', 'price', 'quantity')
+
+    def __init__(self, sequence, type, side, price, quantity):
+        self.sequence = sequence
+        self.type = type
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+
+
+EVENT_BLOCK = struct.Struct('<q')
+
+
+class EventLog():
+    # Structured events (a LogEvent and four numeric fields, stamped with perf_counter_ns and a
+    # LogLevel) kept in a ring of preallocated typed columns, and written out by a background thread
+    # once a file is opened, as compact text or binary blocks (see read_event_log).
+    # Events below the log level are dropped by a single comparison; hot paths make it themselves,
+    # as in "if event_log.level <= LogLevel.DEBUG: event_log.log(...)", to skip even the call.
+    # When the writer falls a whole ring behind, new events are counted in dropped rather than
+    # blocking the caller. Each process logs on its own; the writer thread does not survive a fork.
+    def __init__(self, capacity=65536, level=LogLevel.WARNING):
+        self.capacity = capacity
+        self.level = level
+        self.times = array('q', bytes(8 * capacity))
+        self.levels = array('b', bytes(capacity))
+        self.events = array('b', bytes(capacity))
+        self.traders = array('q', bytes(8 * capacity))
+        self.orders = array('q', bytes(8 * capacity))
+        self.quantities = array('q', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.tail = 0
+        # events logged and events written out so far; event i is kept in slot i % capacity
+        self.dropped = 0
+        # events lost because the ring was full
+        self.lock = threading.Lock()
+        self.file = None
+        self.binary = False
+        self.writer = None
+        self.stopping = threading.Event()
+
+    def log(self, level, event, trader=0, order=0, quantity=0, value=0.0):
+        if level < self.level:
+            return
+        with self.lock:
+            head = self.head
+            if head - self.tail >= self.capacity:
+                self.dropped += 1
+                return
+            i = head % self.capacity
+            self.times[i] = time.perf_counter_ns()
+            self.levels[i] = level
+            self.events[i] = event
+            self.traders[i] = trader
+            self.orders[i] = order
+            self.quantities[i] = quantity
+            self.values[i] = value
+            self.head = head + 1
+
+    def open(self, path, level=None, binary=False, interval=0.05):
+        # starts writing events to the end of the file at path, every interval seconds
+        if level is not None:
+            self.level = level
+        self.binary = binary
+        self.file = open(path, 'ab' if binary else 'a')
+        self.stopping.clear()
+        self.writer = threading.Thread(target=self.write_loop, args=(interval,), daemon=True)
+        self.writer.start()
+
+    def write_loop(self, interval):
+        while not self.stopping.wait(interval):
+            self.drain()
+
+    def records(self, start, end):
+        # the columns of events start to end (a stretch of the ring that does not wrap)
+        return (self.times[start:end], self.levels[start:end], self.events[start:end], self.traders[start:end],
+                self.orders[start:end], self.quantities[start:end], self.values[start:end])
+
+    def drain(self):
+        # writes out every event logged so far
+        head, tail = self.head, self.tail
+        if head == tail or self.file is None:
+            return
+        start, end = tail % self.capacity, head % self.capacity
+        if end <= start:
+            stretches = [(start, self.capacity), (0, end)] if end else [(start, self.capacity)]
+        else:
+            stretches = [(start, end)]
+        for start, end in stretches:
+            columns = self.records(start, end)
+            if self.binary:
+                self.file.write(EVENT_BLOCK.pack(end - start))
+                for column in columns:
+                    self.file.write(column.tobytes())
+            else:
+                self.file.write(''.join('%d %s %s %d %d %d %r\n' % (t, LogLevel(l).name, LogEvent(e).name, a, o, q, v)
+                                        for t, l, e, a, o, q, v in zip(*columns)))
+        self.tail = head
+        self.file.flush()
+
+    def close(self):
+        # stops the writer after it has written out everything logged so far
+        if self.writer is not None:
+            self.stopping.set()
+            self.writer.join()
+            self.writer = None
+        self.drain()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_event_log(path):
+    # the (time, level, event, trader, order, quantity, value) records of a binary event log
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        count, = EVENT_BLOCK.unpack_from(data, offset)
+        offset += EVENT_BLOCK.size
+        columns = []
+        for typecode in 'qbbqqqd':
+            column = array(typecode)
+            end = offset + count * column.itemsize
+            column.frombytes(data[offset:end])
+            columns.append(column)
+            offset = end
+        for time_ns, level, event, trader, order, quantity, value in zip(*columns):
+            yield time_ns, LogLevel(level), LogEvent(event), trader, order, quantity, value
+
+
+event_log = EventLog()
+# the log the engine, traders and exchange write their events to
+
+
+from collections import deque, OrderedDict
+import bisect
+import itertools
+import sys
+
+
+class PriceLevelBook():
+    # One side of the order book: a sorted map of price levels, each level a FIFO queue of the
+    # orders resting at that price (time priority is the position in the queue).
+    # A level is an OrderedDict keyed by order id, so an order can also leave the middle of its
+    # queue in O(1) when it is cancelled.
+    # Level keys are kept ascending with the best price last (bids keyed by price, asks by -price),
+    # so the best level is always keys[-1] and clearing it is a pop from the end.
+    # The total quantity resting at each price is kept alongside the levels and updated on every
+    # insert, fill, amend and cancel, so the top of book and the depth never need to add up orders.
+    def __init__(self, side):
+        if side == OrderSide.BUY:
+            self.sign = 1
+        elif side == OrderSide.SELL:
+            self.sign = -1
+        else:
+            raise UndefinedOrderSide("Undefined Order Side!")
+        self.side = side
+        self.levels = {}
+        self.keys = []
+        self.quantities = {}
+        # price -> total quantity of the orders resting at that price
+        self.changed = None
+        # while the engine has market data subscribers: price -> total quantity at that price
+        # before its first change since the engine last published (None if it had no level)
+
+    def touch(self, price):
+        # to be called before the quantity at price changes, while changes are being recorded
+        if price not in self.changed:
+            self.changed[price] = self.quantities.get(price)
+
+    def insert(self, order):
+        if self.changed is not None:
+            self.touch(order.price)
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = OrderedDict()
+            bisect.insort(self.keys, self.sign * order.price)
+            self.quantities[order.price] = order.quantity
+        else:
+            self.quantities[order.price] += order.quantity
+        level[order.id] = order
+
+    def remove(self, order):
+        if self.changed is not None:
+            self.touch(order.price)
+        level = self.levels[order.price]
+        del level[order.id]
+        if not level:
+            del self.levels[order.price]
+            del self.quantities[order.price]
+            del self.keys[bisect.bisect_left(self.keys, self.sign * order.price)]
+        else:
+            self.quantities[order.price] -= order.quantity
+
+    def pop_best_level(self):
+        price = self.sign * self.keys.pop()
+        if self.changed is not None:
+            self.touch(price)
+        del self.levels[price]
+        del self.quantities[price]
+
+    def best_key(self):
+        # sign * the best price, the key the matching loop compares limits against, or None if the
+        # side is empty
+        if self.keys:
+            return self.keys[-1]
+        return None
+
+    def best_price(self):
+        if self.keys:
+            return self.sign * self.keys[-1]
+        return None
+
+    def best(self):
+        # (price, total quantity) of the best level, or None if the side is empty
+        if self.keys:
+            price = self.sign * self.keys[-1]
+            return price, self.quantities[price]
+        return None
+
+    def depth(self, n):
+        # (price, total quantity) of up to n levels, best first
+        sign, quantities = self.sign, self.quantities
+        return [(sign * key, quantities[sign * key]) for key in self.keys[:-n - 1:-1]] if n > 0 else []
+
+    def prices(self):
+        # the prices of the levels, best first
+        for key in reversed(self.keys):
+            yield self.sign * key
+
+    def __iter__(self):
+        # resting orders in priority order: best price first, then oldest first within a level
+        for price in self.prices():
+            yield from self.levels[price].values()
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels.values())
+
+
+class TickLadderBook(PriceLevelBook):
+    # One side of the book of an instrument whose prices are multiples of tick_size within a fixed
+    # band from min_price to max_price. Every price maps to an integer tick index, and which ticks
+    # have orders resting is kept in a bitmap instead of a sorted list of keys: bit i of word i >> 6
+    # of bitmaps[0] is set while tick i has a level, and each further bitmap has a bit set for every
+    # non-zero word of the one below, up to a single word. Adding or clearing a level sets or clears
+    # one bit per bitmap (only carrying on up while a word goes from or to zero), and the next level
+    # behind a given tick is found by scanning one word per bitmap, so neither depends on how many
+    # levels there are. The best tick is kept as well, which makes the top of book a lookup.
+    # The levels and their quantities are kept by price as in PriceLevelBook, so the matching loop,
+    # amends and market data work on either kind of book; prices are stored as tick index times
+    # tick size, and insert rewrites an order's price to that form.
+    def __init__(self, side, tick_size, min_price, max_price):
+        super().__init__(side)
+        if not 0 < min_price <= max_price:
+            raise PriceOutOfBand("Price Band Must Be Positive And Not Empty!")
+        if off_tick(min_price, tick_size) or off_tick(max_price, tick_size):
+            raise PriceNotOnTick("Price Band Must Start And End On A Tick!")
+        self.keys = None
+        self.tick_size = tick_size
+        self.min_price = min_price
+        self.max_price = max_price
+        self.base = round(min_price / tick_size)
+        self.size = round(max_price / tick_size) - self.base + 1
+        self.digits = tick_digits(tick_size)
+        # prices are rounded to this many decimal places (see price_of)
+        self.bitmaps = []
+        length = self.size
+        while True:
+            # one spare bit at the top of every bitmap lets the scans start just past the last tick
+            words = array('Q', bytes(8 * ((length >> 6) + 1)))
+            self.bitmaps.append(words)
+            if len(words) == 1:
+                break
+            length = len(words)
+        self.best_tick = -1
+        self.best_level_price = None
+        # tick index and price of the best level, -1 and None if the side is empty
+        self.worse = self.below if self.sign == 1 else self.above
+        # worse(i) is the next tick behind tick i that has a level
+
+    def tick_of(self, price):
+        # the tick index of price
+        ticks = price / self.tick_size
+        tick = round(ticks)
+        if abs(ticks - tick) > TICK_TOLERANCE:
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
+        tick -= self.base
+        if not 0 <= tick < self.size:
+            raise PriceOutOfBand("Price Outside The Price Band!")
+        return tick
+
+    def price_of(self, tick):
+        # tick index times tick size, rounded to the tick size's decimal places so that a price
+        # comes out as the float it is written as (0.3 rather than 0.30000000000000004)
+        if self.digits is None:
+            return (tick + self.base) * self.tick_size
+        return round((tick + self.base) * self.tick_size, self.digits)
+
+    def mark(self, tick):
+        for words in self.bitmaps:
+            i = tick >> 6
+            word = words[i]
+            words[i] = word | (1 << (tick & 63))
+            if word:
+                break
+            tick = i
+
+    def unmark(self, tick):
+        for words in self.bitmaps:
+            i = tick >> 6
+            word = words[i] & ~(1 << (tick & 63))
+            words[i] = word
+            if word:
+                break
+            tick = i
+
+    def below(self, tick):
+        # the highest tick under tick that has a level, or -1
+        bitmaps = self.bitmaps
+        for level, words in enumerate(bitmaps):
+            word = words[tick >> 6] & ((1 << (tick & 63)) - 1)
+            if word:
+                tick = (tick & ~63) + word.bit_length() - 1
+                break
+            tick >>= 6
+        else:
+            return -1
+        # tick is a set bit of bitmaps[level]; follow the highest set bits down to bitmaps[0]
+        for words in reversed(bitmaps[:level]):
+            tick = (tick << 6) + words[tick].bit_length() - 1
+        return tick
+
+    def above(self, tick):
+        # the lowest tick over tick that has a level, or -1
+        bitmaps = self.bitmaps
+        tick += 1
+        for level, words in enumerate(bitmaps):
+            word = words[tick >> 6] >> (tick & 63)
+            if word:
+                tick += (word & -word).bit_length() - 1
+                break
+            tick = (tick >> 6) + 1
+        else:
+            return -1
+        for words in reversed(bitmaps[:level]):
+            word = words[tick]
+            tick = (tick << 6) + (word & -word).bit_length() - 1
+        return tick
+
+    def insert(self, order):
+        tick = self.tick_of(order.price)
+        price = order.price = self.price_of(tick)
+        if self.changed is not None:
+            self.touch(price)
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = OrderedDict()
+            self.quantities[price] = order.quantity
+            self.mark(tick)
+            best = self.best_tick
+            if best < 0 or (tick > best if self.sign == 1 else tick < best):
+                self.best_tick = tick
+                self.best_level_price = price
+        else:
+            self.quantities[price] += order.quantity
+        level[order.id] = order
+
+    def remove(self, order):
+        if self.changed is not None:
+            self.touch(order.price)
+        level = self.levels[order.price]
+        del level[order.id]
+        if not level:
+            self.clear_level(order.price, self.tick_of(order.price))
+        else:
+            self.quantities[order.price] -= order.quantity
+
+    def clear_level(self, price, tick):
+        del self.levels[price]
+        del self.quantities[price]
+        self.unmark(tick)
+        if tick == self.best_tick:
+            tick = self.best_tick = self.worse(tick)
+            self.best_level_price = None if tick < 0 else self.price_of(tick)
+
+    def pop_best_level(self):
+        price = self.best_level_price
+        if self.changed is not None:
+            self.touch(price)
+        self.clear_level(price, self.best_tick)
+
+    def best_key(self):
+        if self.best_level_price is None:
+            return None
+        return self.sign * self.best_level_price
+
+    def best_price(self):
+        return self.best_level_price
+
+    def best(self):
+        price = self.best_level_price
+        if price is None:
+            return None
+        return price, self.quantities[price]
+
+    def depth(self, n):
+        quantities = self.quantities
+        return [(price, quantities[price]) for price in itertools.islice(self.prices(), max(n, 0))]
+
+    def prices(self):
+        tick = self.best_tick
+        while tick >= 0:
+            yield self.price_of(tick)
+            tick = self.worse(tick)
+
+
+class MatchingEngine():
+    def __init__(self, symbol=None, tick_size=None, min_price=None, max_price=None):
+        # With a tick_size, the symbol trades on a fixed price ladder (see TickLadderBook) and every
+        # limit and IOC price has to be a multiple of tick_size from min_price to max_price.
+        self.symbol = symbol
+        self.tick_size = tick_size
+        if tick_size is None:
+            self.bids = PriceLevelBook(OrderSide.BUY)
+            self.asks = PriceLevelBook(OrderSide.SELL)
+        else:
+            self.bids = TickLadderBook(OrderSide.BUY, tick_size, min_price, max_price)
+            self.asks = TickLadderBook(OrderSide.SELL, tick_size, min_price, max_price)
         # These are the order books you are given and expected to use for matching the orders below
+        self.orders = {}
+        # id -> resting order, kept in step with the books on every insert, fill and cancel
+        self.order_ids = itertools.count(1)
+        self.sequence = itertools.count(1)
+        # sequence numbers of the execution reports, in the order the matches happened
+        self.subscribers = []
+        self.update_sequence = 0
+        # market data subscribers (see subscribe) and the sequence number of the last BookUpdate
+
+    @property
+    def bid_book(self):
+        # flattened snapshot of the bid side in priority order, for inspection only
+        return list(self.bids)
+
+    @property
+    def ask_book(self):
+        return list(self.asks)
+
+    def best_bid(self):
+        # (price, total quantity) of the best bid level, or None if there are no bids
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def depth(self, n):
+        # the n best levels of each side as (bids, asks), each a list of (price, total quantity)
+        return self.bids.depth(n), self.asks.depth(n)
 
     # Note: As you implement the following functions keep in mind that these enums are available:
     #     class OrderType(Enum):
@@ -115,361 +775,484 @@ class MatchingEngine():
     #     class OrderSide(Enum):
     #         BUY = 1
     #         SELL = 2
+    def next_order_id(self):
+        # ids are handed out by the engine so that they are unique across all traders
+        return next(self.order_ids)
+
+    def index(self, order):
+        if order.id in self.orders:
+            raise DuplicateOrderId("Order Id Already Resting In The Book!")
+        self.orders[order.id] = order
+
     def remove(self, order):
+        del self.orders[order.id]
         if order.side == OrderSide.BUY:
-            self.bid_book.remove(order)
-        elif order.side == OrderSide.sell:
-            self.ask_book.remove(order)
+            self.bids.remove(order)
+        elif order.side == OrderSide.SELL:
+            self.asks.remove(order)
+        else:
+            raise UndefinedOrderSide("Undefined Order Side!")
+
+    def check_price(self, order):
+        # raises PriceNotOnTick or PriceOutOfBand if the order's price is not on the book's ladder,
+        # without touching the book, so a caller can turn the order away before it is recorded
+        if self.tick_size is not None and order.type != OrderType.MARKET:
+            self.bids.tick_of(order.price)
 
     def handle_order(self, order):
+        if order.id is None:
+            order.id = self.next_order_id()
+        if self.tick_size is not None and order.type != OrderType.MARKET:
+            # checked before matching, so an order off the ladder is rejected before it trades
+            order.price = self.bids.price_of(self.bids.tick_of(order.price))
         if order.type == OrderType.LIMIT:
-            self.handle_limit_order(order)
-            print('limit order handled')
+            filled_orders = self.handle_limit_order(order)
+            if event_log.level <= LogLevel.DEBUG:
+                event_log.log(LogLevel.DEBUG, LogEvent.ORDER_HANDLED, 0, order.id, order.quantity, order.price)
         elif order.type == OrderType.MARKET:
-            self.handle_market_order(order)
+            filled_orders = self.handle_market_order(order)
         elif order.type == OrderType.IOC:
-            self.handle_ioc_order(order)
+            filled_orders = self.handle_ioc_order(order)
         else:
-            # Implement this function
-            # In this function you need to call different functions from the matching engine
-            # depending on the type of order you are given
-
             # You need to raise the following error if the type of order is ambiguous
             raise UndefinedOrderType("Undefined Order Type!")
+        return filled_orders
 
-    def handle_limit_order(self, order):
-        filled_orders = []
-        # The orders that are filled from the market order need to be inserted into the above list
+    def sweep(self, order, columns=None):
+        # The matching loop shared by the limit, market and IOC handlers.
+        # The order trades against the best opposite level, oldest order first, and every resting
+        # order it fills completely is popped off the front of its level straight away, so the cost
+        # is proportional to the number of fills. Limit and IOC orders stop at their own price,
+        # market orders are unbounded. Both sides of a fill trade at the resting order's price.
+        # Returns one ExecutionReport per match, or records the matches in columns
+        # (an ExecutionColumns) instead when one is given.
         if order.side == OrderSide.BUY:
-            consumed_asks = []
-            for item in self.ask_book:
-                if order.price < item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        consumed_asks.append(item)
-                        order.quantity = 0
-
-                    elif order.quantity < item.quantity:
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                   item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        order.quantity = 0
-                        break
-
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                     order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_asks.append(item)
-
-            for item2 in consumed_asks:
-                self.remove(item2)
-            if order.quantity != 0:
-                self.insert_limit_order(order)
-
+            book = self.asks
         elif order.side == OrderSide.SELL:
-            consumed_bids = []
-            for item in self.bid_book:
-                if order.price > item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        consumed_bids.append(item)
-                        order.quantity = 0
-                    elif order.quantity < item.quantity:
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                   item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                   order.time))
-                        order.quantity = 0
-                        break
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                   order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_bids.append(item)
-
-            for item2 in consumed_bids:
-                self.remove(item2)
-
-            if order.quantity != 0:
-                self.insert_limit_order(order)
-
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
+            book = self.bids
         else:
-            # You need to raise the following error if the side the order is for is ambiguous
             raise UndefinedOrderSide("Undefined Order Side!")
-        # The filled orders are expected to be the return variable (list)
-        return filled_orders
-
-    def handle_market_order(self, order):
-        # Implement this function
+        # levels are keyed so that a larger key is a better price for the aggressor
+        limit_key = None if order.type == OrderType.MARKET else book.sign * order.price
         filled_orders = []
-        # The orders that are filled from the market order need to be inserted into the above list
-        if order.side == OrderSide.BUY:
-            consumed_asks = []
-            for item in self.ask_book:  # should really use while loop here for true functionality
-                if order.quantity == 0:
-                    break
-                if order.quantity == item.quantity:
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(LimitOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                    order.time))
-                    consumed_asks.append(item)
-                    order.quantity = 0
-                    break
-                elif order.quantity < item.quantity:
-                    partial_order = LimitOrder(item.id, item.symbol, order.quantity, item.price, item.side, item.time)
-                    item.quantity -= order.quantity
-                    filled_orders.append(partial_order)
-                    filled_orders.append(LimitOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                    order.time))
-                    order.quantity = 0
-                    break
+        sequence = self.sequence
+        while order.quantity > 0:
+            best_key = book.best_key()
+            if best_key is None or limit_key is not None and best_key < limit_key:
+                break
+            price = book.sign * best_key
+            level = book.levels[price]
+            if book.changed is not None:
+                book.touch(price)
+            traded = 0
+            while order.quantity > 0 and level:
+                item = level[next(iter(level))]
+                quantity = min(order.quantity, item.quantity)
+                if columns is None:
+                    filled_orders.append(ExecutionReport(next(sequence), order.id, item.id, order.side, price,
+                                                         quantity))
                 else:
-                    order.quantity -= item.quantity
-                    fulfilled_order = LimitOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                 order.time)
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(fulfilled_order)
-                    consumed_asks.append(item)
-
-            for item2 in consumed_asks:
-                self.remove(item2)
-
-            if order.quantity != 0:
-                self.insert_market_order(order)
+                    columns.add(next(sequence), order.id, item.id, order.side.value, price, quantity)
+                item.quantity -= quantity
+                order.quantity -= quantity
+                traded += quantity
+                if item.quantity == 0:
+                    level.popitem(last=False)
+                    del self.orders[item.id]
+            if not level:
+                book.pop_best_level()
+            else:
+                book.quantities[price] -= traded
+        return filled_orders
 
-        elif order.side == OrderSide.SELL:
-            consumed_bids = []
-            for item in self.bid_book:
-                if order.quantity == 0:
-                    break
-                if order.quantity == item.quantity:
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                     order.time))
-                    consumed_bids.append(item)
-                    order.quantity = 0
-                    break
-                elif order.quantity < item.quantity:
-
-                    partial_order = LimitOrder(item.id, item.symbol, order.quantity, item.price, item.side, item.time)
-                    item.quantity -= order.quantity
-                    filled_orders.append(partial_order)
-                    filled_orders.append(
-                        LimitOrder(order.id, order.symbol, order.quantity, item.price, order.side, order.time))
-                    order.quantity = 0
-                    break
-                else:
-                    order.quantity -= item.quantity
-                    fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, item.price, order.side,
-                                                  order.time)
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(fulfilled_order)
-                    consumed_bids.append(item)
-            for item2 in consumed_bids:
-                self.remove(item2)
-
-            if order.quantity != 0:
-                self.insert_market_order(order)
-                # should create new insert_market_order functionality, which takes in the price as well
+    def handle_orders(self, batch, next_order_id=None):
+        # Columnar counterpart of calling handle_order on each order of an OrderBatch in turn: the
+        # book and the executions come out exactly the same, but the batch is validated once, no
+        # per-order objects are built for the fills, and orders that cannot cross the best
+        # opposite price skip the sweep altogether. A batch without ids gets them from
+        # next_order_id (the engine's own by default) once it has been validated, so a rejected
+        # batch uses none up. Returns an ExecutionColumns.
+        ids, sides, types, prices, quantities = batch.columns()
+        ladder = self.tick_size is not None
+        if ladder:
+            OrderBatch.validate(sides, types, prices, quantities, self.tick_size,
+                                (self.bids.min_price, self.bids.max_price))
         else:
-            raise UndefinedOrderSide("Undefined Order Side!")
+            OrderBatch.validate(sides, types, prices, quantities)
+        if batch.id is None:
+            next_order_id = next_order_id or self.next_order_id
+            ids = [next_order_id() for _ in sides]
+            batch.id = array('q', ids)
+        elif len(ids) != len(sides):
+            raise ValueError("Batch Columns Must Have The Same Length!")
+        executions = ExecutionColumns()
+        order_sides = (None, OrderSide.BUY, OrderSide.SELL)
+        limit, ioc = OrderType.LIMIT.value, OrderType.IOC.value
+        symbol, now = batch.symbol, batch.time
+        for i in range(len(sides)):
+            side = order_sides[sides[i]]
+            book = self.asks if side == OrderSide.BUY else self.bids
+            order_type = types[i]
+            if order_type == limit or order_type == ioc:
+                price = prices[i]
+                if ladder:
+                    price = book.price_of(book.tick_of(price))
+                if order_type == limit:
+                    order = LimitOrder.unchecked(ids[i], symbol, quantities[i], side, now, price)
+                else:
+                    order = IOCOrder.unchecked(ids[i], symbol, quantities[i], side, now, price)
+                best_key = book.best_key()
+                if best_key is not None and best_key >= book.sign * price:
+                    self.sweep(order, executions)
+                if order.quantity != 0 and order_type == limit:
+                    self.insert_limit_order(order)
+            else:
+                order = MarketOrder.unchecked(ids[i], symbol, quantities[i], side, now)
+                filled = len(executions)
+                self.sweep(order, executions)
+                if order.quantity != 0 and len(executions) > filled:
+                    self.insert_market_order(order, executions.price[-1])
+                # as in handle_market_order, an order that traded nothing is dropped
+        # the batch arrived as one message, so its market data goes out as one batch too
+        self.publish(executions)
+        return executions
+
+    def handle_limit_order(self, order):
+        filled_orders = self.sweep(order)
+        # whatever does not fill immediately rests in the book
+        if order.quantity != 0:
+            self.insert_limit_order(order)
+        self.publish(filled_orders)
         # The filled orders are expected to be the return variable (list)
         return filled_orders
 
-    def handle_ioc_order(self, order):
-        filled_orders = []
-        if order.side == OrderSide.BUY:
-            consumed_asks = []
-            for item in self.ask_book:
-                if order.price < item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(LimitOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        consumed_asks.append(item)
-                        order.quantity = 0
-                        # order gets filled, pop from ask book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    elif order.quantity < item.quantity:
-                        # filled_orders.append(item)
-                        # item.quantity -= order.quantity
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                   item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        order.quantity = 0
-                        break
-                        # order gets filled, pop from ask book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                     order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_asks.append(item)
-            for item2 in consumed_asks:
-                self.remove(item2)
-
-            # if order.quantity != 0:
-            #     self.insert_limit_order(order)
+    def handle_market_order(self, order):
+        filled_orders = self.sweep(order)
+        if order.quantity != 0 and filled_orders:
+            # the remainder rests at the last price it traded at
+            self.insert_market_order(order, filled_orders[-1].price)
+        # an order that traded nothing has no price to rest at, so unlike the original engine (which
+        # queued it with no price) it is dropped, with order.quantity left as the quantity dropped;
+        # the exchange tells the trader with a RejectedOrder
+        self.publish(filled_orders)
+        return filled_orders
 
-        elif order.side == OrderSide.SELL:
-            consumed_bids = []
-            for item in self.bid_book:
-                if order.price > item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        consumed_bids.append(item)
-                        order.quantity = 0
-                        break
-                        # order gets filled, pop from bid book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    elif order.quantity < item.quantity:
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                   item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        order.quantity = 0
-                        break
-                        # order gets filled, pop from ask book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                     order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                        item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_bids.append(item)
-            for item2 in consumed_bids:
-                self.remove(item2)
-            return filled_orders
+    def handle_ioc_order(self, order):
+        # whatever does not fill immediately is discarded
+        filled_orders = self.sweep(order)
+        self.publish(filled_orders)
+        return filled_orders
 
     def insert_limit_order(self, order):
         assert order.type == OrderType.LIMIT
         if order.side == OrderSide.BUY:
-            self.bid_book.append(order)
-            self.bid_book.sort(key=lambda x: x.price, reverse=True)
+            self.index(order)
+            self.bids.insert(order)
         elif order.side == OrderSide.SELL:
-            self.ask_book.append(order)
-            self.ask_book.sort(key=lambda x: x.price)
-        # Implement this function
+            self.index(order)
+            self.asks.insert(order)
         # this function's sole puporse is to place limit orders in the book that are guaranteed
         # to not immediately fill
         else:
             # You need to raise the following error if the side the order is for is ambiguous
             raise UndefinedOrderSide("Undefined Order Side!")
 
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
-    def insert_market_order(self, order):
-        # assert order.type == OrderType.MARKET
+    def insert_market_order(self, order, price):
+        # a market order has no price of its own, so its unfilled remainder is queued at the given price
+        order.price = price
         if order.side == OrderSide.BUY:
-            self.bid_book.append(order)
-            self.bid_book.sort(key=lambda x: x.price, reverse=True)
+            self.index(order)
+            self.bids.insert(order)
         elif order.side == OrderSide.SELL:
-            self.ask_book.append(order)
-            # self.ask_book.sort(key=lambda x: x.price)
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
+            self.index(order)
+            self.asks.insert(order)
         else:
-            # You need to raise the following error if the side the order is for is ambiguous
             raise UndefinedOrderSide("Undefined Order Side!")
 
-
-    def amend_quantity(self, id, quantity):
-        # Implement this function
-        # Hint: Remember that there are two order books, one on the bid side and one on the ask side
-        switch = 0
-        for item in self.ask_book:
-            if item.id == id:
-                if item.quantity > quantity:
-                    item.quantity = quantity
-                    switch = 1
-                    break
+    def amend_quantity(self, id, quantity): # modified to return True or False
+        item = self.orders.get(id)
+        if item is None:
+            return False
+        if item.quantity > quantity:
+            book = self.bids if item.side == OrderSide.BUY else self.asks
+            if book.changed is not None:
+                book.touch(item.price)
+            book.quantities[item.price] -= item.quantity - quantity
+            item.quantity = quantity
+            self.publish()
+            return True
+        else:
+            # You need to raise the following error if the user attempts to modify an order
+            # with a quantity that's greater than given in the existing order
+            raise NewQuantityNotSmaller("Amendment Must Reduce Quantity!")
+
+    def cancel_order(self, id): # modified to return true or false
+        cancelled_order = self.orders.get(id)
+        if cancelled_order is None:
+            return False
+        self.remove(cancelled_order)
+        self.publish()
+        return True
+
+    def subscribe(self, subscriber):
+        # subscriber(symbol, updates) is called with the list of BookUpdates caused by each order,
+        # amend or cancel from now on; l2_snapshot gives the book the first of them applies to
+        if not self.subscribers:
+            self.bids.changed = {}
+            self.asks.changed = {}
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+        if not self.subscribers:
+            self.bids.changed = None
+            self.asks.changed = None
+
+    def l2_snapshot(self):
+        # (sequence of the last update published, bid levels, ask levels), the levels as in depth
+        return self.update_sequence, self.bids.depth(len(self.bids.levels)), self.asks.depth(len(self.asks.levels))
+
+    def publish(self, executions=()):
+        # Sends the trades in executions (ExecutionReports or an ExecutionColumns) and every level
+        # changed since the last publish to the subscribers as one batch. A level that changed more
+        # than once is sent once with its final quantity, and one that ended where it started is
+        # not sent at all.
+        if not self.subscribers:
+            return
+        sequence = self.update_sequence
+        updates = []
+        if isinstance(executions, ExecutionColumns):
+            order_sides = (None, OrderSide.BUY, OrderSide.SELL)
+            for side, price, quantity in zip(executions.side, executions.price, executions.quantity):
+                sequence += 1
+                updates.append(BookUpdate(sequence, BookUpdateType.TRADE, order_sides[side], price, quantity))
+        else:
+            for report in executions:
+                sequence += 1
+                updates.append(BookUpdate(sequence, BookUpdateType.TRADE, report.side, report.price,
+                                          report.quantity))
+        for book in (self.bids, self.asks):
+            for price, before in book.changed.items():
+                after = book.quantities.get(price)
+                if after == before:
+                    continue
+                if before is None:
+                    update_type = BookUpdateType.LEVEL_ADDED
+                elif after is None:
+                    update_type = BookUpdateType.LEVEL_REMOVED
+                    after = 0
                 else:
-                    raise NewQuantityNotSmaller("Amendment Must Reduce Quantity!")
-        if switch == 0:
-            for item in self.bid_book:
-                if item.id == id:
-                    if item.quantity > quantity:
-                        item.quantity = quantity
-                        break
-                    else:
-                        raise NewQuantityNotSmaller("Amendment Must Reduce Quantity!")
-        # You need to raise the following error if the user attempts to modify an order
-        # with a quantity that's greater than given in the existing order
-        return False
+                    update_type = BookUpdateType.LEVEL_CHANGED
+                sequence += 1
+                updates.append(BookUpdate(sequence, update_type, book.side, price, after))
+            book.changed.clear()
+        if updates:
+            self.update_sequence = sequence
+            for subscriber in self.subscribers:
+                subscriber(self.symbol, updates)
+
+
+class BookReplica():
+    # A subscriber's copy of the price levels of one symbol, started from MatchingEngine.l2_snapshot
+    # and kept current by the update batches the engine publishes (pass the replica to subscribe).
+    # Updates the snapshot already includes are skipped; a missing one raises SequenceGap.
+    def __init__(self, snapshot):
+        self.sequence, bids, asks = snapshot
+        self.bids = dict(bids)
+        self.asks = dict(asks)
+        self.last_trade = None
+        # (price, quantity) of the most recent trade seen
+
+    def __call__(self, symbol, updates):
+        self.apply(updates)
+
+    def apply(self, updates):
+        for update in updates:
+            if update.sequence <= self.sequence:
+                continue
+            if update.sequence != self.sequence + 1:
+                raise SequenceGap("Missed Book Updates " + str(self.sequence + 1) + " To " +
+                                  str(update.sequence - 1) + "!")
+            self.sequence = update.sequence
+            if update.type == BookUpdateType.TRADE:
+                self.last_trade = update.price, update.quantity
+                continue
+            levels = self.bids if update.side == OrderSide.BUY else self.asks
+            if update.type == BookUpdateType.LEVEL_REMOVED:
+                del levels[update.price]
+            else:
+                levels[update.price] = update.quantity
+
+    def depth(self, n):
+        # the same (bids, asks) lists as MatchingEngine.depth
+        return (sorted(self.bids.items(), reverse=True)[:n], sorted(self.asks.items())[:n])
+
+
+class BarSeries():
+    # The most recent capacity OHLCV bars of one interval (in seconds), in a ring of preallocated
+    # columns. Bar i is kept in slot i % capacity; intervals without trades get no bar.
+    def __init__(self, interval, capacity=1024):
+        self.interval = interval
+        self.capacity = capacity
+        self.starts = array('d', bytes(8 * capacity))
+        self.opens = array('d', bytes(8 * capacity))
+        self.highs = array('d', bytes(8 * capacity))
+        self.lows = array('d', bytes(8 * capacity))
+        self.closes = array('d', bytes(8 * capacity))
+        self.volumes = array('q', bytes(8 * capacity))
+        self.count = 0
+        # bars started so far
+        self.start = None
+        # start time of the current bar
+
+    def add(self, trade_time, price, quantity):
+        start = trade_time - trade_time % self.interval
+        if start != self.start:
+            i = self.count % self.capacity
+            self.count += 1
+            self.start = self.starts[i] = start
+            self.opens[i] = self.highs[i] = self.lows[i] = self.closes[i] = price
+            self.volumes[i] = quantity
+            return
+        i = (self.count - 1) % self.capacity
+        if price > self.highs[i]:
+            self.highs[i] = price
+        elif price < self.lows[i]:
+            self.lows[i] = price
+        self.closes[i] = price
+        self.volumes[i] += quantity
+
+    def bars(self, n=None):
+        # (start, open, high, low, close, volume) of the last n bars kept (all of them by default),
+        # oldest first; the last one may still be in progress
+        kept = min(self.count, self.capacity)
+        n = kept if n is None else min(n, kept)
+        return [(self.starts[j], self.opens[j], self.highs[j], self.lows[j], self.closes[j], self.volumes[j])
+                for j in (i % self.capacity for i in range(self.count - n, self.count))]
+
+
+class BarAggregator():
+    # Subscribes to MatchingEngines (pass the aggregator to subscribe) and keeps a BarSeries for each
+    # interval of every symbol it hears from, updated as the trades arrive. Trades are timed by
+    # clock when their batch is published.
+    def __init__(self, intervals=(1, 60, 300), capacity=1024, clock=time.time):
+        self.intervals = intervals
+        self.capacity = capacity
+        self.clock = clock
+        self.series = {}
+        # symbol -> {interval: BarSeries}
+
+    def __call__(self, symbol, updates):
+        series = self.series.get(symbol)
+        if series is None:
+            series = self.series[symbol] = {interval: BarSeries(interval, self.capacity)
+                                            for interval in self.intervals}
+        now = None
+        for update in updates:
+            if update.type != BookUpdateType.TRADE:
+                continue
+            if now is None:
+                now = self.clock()
+            for bars in series.values():
+                bars.add(now, update.price, update.quantity)
+
+    def bars(self, symbol, interval, n=None):
+        # the last n bars of symbol at interval, as BarSeries.bars gives them (none if it has not
+        # traded)
+        series = self.series.get(symbol)
+        if series is None:
+            return []
+        return series[interval].bars(n)
+
+
+SYMBOL_BITS = 16
+SEQUENCE_BITS = 47
+
+
+class SymbolRouter():
+    # Keeps one MatchingEngine per symbol and routes every order, amend and cancel to the right one.
+    # A book is created the first time its symbol is seen. Symbols are interned into small integer
+    # ids: callers that hold an id reach the book with a list index, and even lookups by name only
+    # hash a string once, since the table keys are interned.
+    # Order ids carry the symbol id above their low SEQUENCE_BITS bits, so they are unique across
+    # all books and an amend or cancel finds its book without any extra index. The low bits are a
+    # running count, which keeps consecutive ids apart in the low bits that dicts hash on.
+    def __init__(self):
+        self.symbol_ids = {}
+        self.symbols = []
+        self.engines = []
+        self.order_ids = itertools.count(1)
+
+    def symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.add_symbol(symbol)
+        return symbol_id
+
+    def add_symbol(self, symbol, tick_size=None, min_price=None, max_price=None):
+        # creates the book of a new symbol ahead of its first order, on a price ladder if tick_size
+        # is given (see MatchingEngine), and returns its id
+        if symbol in self.symbol_ids:
+            raise ValueError("Symbol Already Has A Book!")
+        symbol_id = len(self.symbols)
+        if symbol_id >= 1 << SYMBOL_BITS:
+            raise OverflowError("Too Many Symbols!")
+        symbol = sys.intern(symbol)
+        matching_engine = MatchingEngine(symbol, tick_size, min_price, max_price)
+        self.symbol_ids[symbol] = symbol_id
+        self.symbols.append(symbol)
+        self.engines.append(matching_engine)
+        return symbol_id
+
+    def engine(self, symbol):
+        return self.engines[self.symbol_id(symbol)]
+
+    def engine_for_order(self, id):
+        symbol_id = id >> SEQUENCE_BITS
+        if 0 <= symbol_id < len(self.engines):
+            return self.engines[symbol_id]
+        return None
+
+    def next_order_id(self, symbol_id):
+        return symbol_id << SEQUENCE_BITS | next(self.order_ids)
+
+    def resting_order(self, id):
+        # the order with this id if it is still resting in its book, otherwise None
+        matching_engine = self.engine_for_order(id)
+        if matching_engine is None:
+            return None
+        return matching_engine.orders.get(id)
 
-    def cancel_order(self, id):
-        # Implement this function
-        # Think about the changes you need to make in the order book based on the parameters given
-        switch = 0
-
-        for item in self.ask_book:
-            if item.id == id:
-                cancelled_order = item
-                switch = 1
-                break
-        if switch == 0:
-            for item in self.bid_book:
-                if item.id == id:
-                    cancelled_order = item
-                    break
-        self.remove(cancelled_order)
+    def handle_order(self, order):
+        symbol_id = self.symbol_id(order.symbol)
+        if order.id is None:
+            order.id = self.next_order_id(symbol_id)
+        return self.engines[symbol_id].handle_order(order)
+
+    def check_price(self, order):
+        self.engine(order.symbol).check_price(order)
 
+    def handle_orders(self, batch):
+        symbol_id = self.symbol_id(batch.symbol)
+        return self.engines[symbol_id].handle_orders(batch, lambda: self.next_order_id(symbol_id))
+
+    def amend_quantity(self, id, quantity):
+        matching_engine = self.engine_for_order(id)
+        if matching_engine is None:
+            return False
+        return matching_engine.amend_quantity(id, quantity)
 
-        # You need to raise the following error if the user attempts to modify an order
-        # with a quantity that's greater than given in the existing order
-        return False
+    def cancel_order(self, id):
+        matching_engine = self.engine_for_order(id)
+        if matching_engine is None:
+            return False
+        return matching_engine.cancel_order(id)
 
 
 import unittest
+import random
+import os
+import tempfile
 
 
 class TestOrderBook(unittest.TestCase):
@@ -492,12 +1275,30 @@ class TestOrderBook(unittest.TestCase):
         filled_orders = matching_engine.handle_limit_order(order_sell)
 
         self.assertEqual(matching_engine.bid_book[0].quantity, 6)
-        self.assertEqual(filled_orders[0].id, 3)
+        self.assertEqual(filled_orders[0].passive_id, 3)
+        self.assertEqual(filled_orders[0].aggressor_id, 4)
         self.assertEqual(filled_orders[0].price, 15)
-        self.assertEqual(filled_orders[2].id, 1)
-        self.assertEqual(filled_orders[2].quantity, 4)
-        self.assertEqual(filled_orders[2].price, 10)
+        self.assertEqual(filled_orders[1].passive_id, 1)
+        self.assertEqual(filled_orders[1].quantity, 4)
+        self.assertEqual(filled_orders[1].price, 10)
+        self.assertEqual(filled_orders[1].sequence, filled_orders[0].sequence + 1)
+
+
+    def test_price_level_time_priority(self):
+        matching_engine = MatchingEngine()
+        matching_engine.handle_limit_order(LimitOrder(1, "S", 5, 11, OrderSide.SELL, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(2, "S", 5, 10, OrderSide.SELL, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(3, "S", 5, 10, OrderSide.SELL, time.time()))
+
+        self.assertEqual([item.id for item in matching_engine.ask_book], [2, 3, 1])
+        self.assertEqual(matching_engine.asks.best_price(), 10)
 
+        filled_orders = matching_engine.handle_limit_order(LimitOrder(4, "S", 7, 10, OrderSide.BUY, time.time()))
+        self.assertEqual(filled_orders[0].passive_id, 2)
+        self.assertEqual(filled_orders[1].passive_id, 3)
+        self.assertEqual(filled_orders[1].quantity, 2)
+        self.assertEqual([item.id for item in matching_engine.ask_book], [3, 1])
+        self.assertEqual(len(matching_engine.bid_book), 0)
 
     def test_insert_limit_order(self):
         matching_engine = MatchingEngine()
@@ -524,11 +1325,13 @@ class TestOrderBook(unittest.TestCase):
         filled_orders = matching_engine.handle_limit_order(order_sell)
 
         self.assertEqual(matching_engine.bid_book[0].quantity, 6)
-        self.assertEqual(filled_orders[0].id, 3)
+        self.assertEqual(filled_orders[0].passive_id, 3)
+        self.assertEqual(filled_orders[0].aggressor_id, 4)
         self.assertEqual(filled_orders[0].price, 15)
-        self.assertEqual(filled_orders[2].id, 1)
-        self.assertEqual(filled_orders[2].quantity, 4)
-        self.assertEqual(filled_orders[2].price, 10)
+        self.assertEqual(filled_orders[1].passive_id, 1)
+        self.assertEqual(filled_orders[1].quantity, 4)
+        self.assertEqual(filled_orders[1].price, 10)
+        self.assertEqual(filled_orders[1].sequence, filled_orders[0].sequence + 1)
 
 
 
@@ -556,6 +1359,282 @@ class TestOrderBook(unittest.TestCase):
         self.assertEqual(matching_engine.bid_book[0].quantity, 1)
         self.assertEqual(len(filled_orders), 0)
 
+    def test_sweep_across_levels(self):
+        matching_engine = MatchingEngine()
+        matching_engine.handle_limit_order(LimitOrder(1, "S", 5, 10, OrderSide.SELL, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(2, "S", 5, 11, OrderSide.SELL, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(3, "S", 5, 12, OrderSide.SELL, time.time()))
+
+        order = IOCOrder(4, "S", 12, 11, OrderSide.BUY, time.time())
+        filled_orders = matching_engine.handle_ioc_order(order)
+        self.assertEqual([item.passive_id for item in filled_orders], [1, 2])
+        self.assertEqual([item.aggressor_id for item in filled_orders], [4, 4])
+        self.assertEqual(filled_orders[1].price, 11)
+        self.assertEqual(filled_orders[1].side, OrderSide.BUY)
+        self.assertEqual(order.quantity, 2)
+        self.assertEqual([item.id for item in matching_engine.ask_book], [3])
+        self.assertEqual(len(matching_engine.bid_book), 0)
+
+        order = MarketOrder(5, "S", 8, OrderSide.BUY, time.time())
+        filled_orders = matching_engine.handle_market_order(order)
+        self.assertEqual(filled_orders[0].quantity, 5)
+        self.assertEqual(filled_orders[0].price, 12)
+        self.assertEqual(len(matching_engine.ask_book), 0)
+        self.assertEqual(matching_engine.bid_book[0].id, 5)
+        self.assertEqual(matching_engine.bid_book[0].quantity, 3)
+        self.assertEqual(matching_engine.bids.best_price(), 12)
+
+        # with nothing left to trade against, a market order is dropped rather than rested
+        order = MarketOrder(6, "S", 4, OrderSide.BUY, time.time())
+        self.assertEqual(matching_engine.handle_market_order(order), [])
+        self.assertEqual(order.quantity, 4)
+        self.assertEqual([item.id for item in matching_engine.bid_book], [5])
+        self.assertNotIn(6, matching_engine.orders)
+
+    def test_top_of_book(self):
+        matching_engine = MatchingEngine()
+        self.assertIsNone(matching_engine.best_bid())
+        self.assertEqual(matching_engine.depth(3), ([], []))
+        matching_engine.handle_limit_order(LimitOrder(1, "S", 5, 10, OrderSide.BUY, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(2, "S", 7, 10, OrderSide.BUY, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(3, "S", 4, 9, OrderSide.BUY, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(4, "S", 6, 12, OrderSide.SELL, time.time()))
+        matching_engine.handle_limit_order(LimitOrder(5, "S", 3, 13, OrderSide.SELL, time.time()))
+        self.assertEqual(matching_engine.best_bid(), (10, 12))
+        self.assertEqual(matching_engine.best_ask(), (12, 6))
+        self.assertEqual(matching_engine.depth(1), ([(10, 12)], [(12, 6)]))
+        self.assertEqual(matching_engine.depth(5), ([(10, 12), (9, 4)], [(12, 6), (13, 3)]))
+
+        matching_engine.handle_ioc_order(IOCOrder(6, "S", 8, 10, OrderSide.SELL, time.time()))
+        self.assertEqual(matching_engine.best_bid(), (10, 4))
+        matching_engine.amend_quantity(2, 1)
+        self.assertEqual(matching_engine.best_bid(), (10, 1))
+        matching_engine.cancel_order(2)
+        self.assertEqual(matching_engine.best_bid(), (9, 4))
+        matching_engine.handle_market_order(MarketOrder(7, "S", 7, OrderSide.BUY, time.time()))
+        self.assertEqual(matching_engine.best_ask(), (13, 2))
+
+        random.seed(3)
+        for i in range(300):
+            side = OrderSide(random.randint(1, 2))
+            matching_engine.handle_limit_order(LimitOrder(i + 10, "S", random.randint(1, 9), random.randint(5, 15),
+                                                          side, time.time()))
+            if random.random() < 0.2:
+                matching_engine.cancel_order(random.randint(10, i + 10))
+        for book, levels in ((matching_engine.bid_book, matching_engine.depth(100)[0]),
+                             (matching_engine.ask_book, matching_engine.depth(100)[1])):
+            totals = {}
+            for item in book:
+                totals[item.price] = totals.get(item.price, 0) + item.quantity
+            self.assertEqual(levels, list(totals.items()))
+
+    def test_market_data_feed(self):
+        matching_engine = MatchingEngine("S")
+        matching_engine.handle_order(LimitOrder(None, "S", 5, 10, OrderSide.BUY, time.time()))
+        replica = BookReplica(matching_engine.l2_snapshot())
+        batches = []
+        matching_engine.subscribe(replica)
+        matching_engine.subscribe(lambda symbol, updates: batches.append(updates))
+
+        matching_engine.handle_order(LimitOrder(None, "S", 3, 11, OrderSide.SELL, time.time()))
+        matching_engine.handle_order(LimitOrder(None, "S", 4, 11, OrderSide.SELL, time.time()))
+        matching_engine.handle_order(LimitOrder(None, "S", 9, 11, OrderSide.BUY, time.time()))
+        # one batch per order; the buy filled the whole level and rested at the same price
+        self.assertEqual(len(batches), 3)
+        self.assertEqual([(update.type, update.side, update.price, update.quantity) for update in batches[2]],
+                         [(BookUpdateType.TRADE, OrderSide.BUY, 11, 3), (BookUpdateType.TRADE, OrderSide.BUY, 11, 4),
+                          (BookUpdateType.LEVEL_ADDED, OrderSide.BUY, 11, 2),
+                          (BookUpdateType.LEVEL_REMOVED, OrderSide.SELL, 11, 0)])
+        self.assertEqual([update.sequence for batch in batches for update in batch], list(range(1, 7)))
+        self.assertEqual(replica.depth(5), matching_engine.depth(5))
+
+        random.seed(11)
+        ids = []
+        for i in range(400):
+            side = OrderSide(random.randint(1, 2))
+            action = random.random()
+            if action < 0.6:
+                order = LimitOrder(None, "S", random.randint(1, 9), random.randint(5, 15), side, time.time())
+                matching_engine.handle_order(order)
+                ids.append(order.id)
+            elif action < 0.7:
+                matching_engine.handle_order(MarketOrder(None, "S", random.randint(1, 9), side, time.time()))
+            elif action < 0.8:
+                matching_engine.handle_order(IOCOrder(None, "S", random.randint(1, 9), random.randint(5, 15), side,
+                                                      time.time()))
+            elif action < 0.9 and ids:
+                matching_engine.cancel_order(random.choice(ids))
+            else:
+                matching_engine.handle_orders(OrderBatch(None, [1, 2, 1], [1, 1, 3], [9, 11, 12], [2, 2, 2], "S"))
+        self.assertEqual(replica.depth(100), matching_engine.depth(100))
+        self.assertEqual(replica.sequence, matching_engine.update_sequence)
+
+        replica.sequence -= 2
+        with self.assertRaises(SequenceGap):
+            replica.apply(batches[-1][-1:])
+
+    def test_bar_aggregator(self):
+        matching_engine = MatchingEngine("S")
+        now = [100.5]
+        aggregator = BarAggregator(intervals=(1, 60), capacity=2, clock=lambda: now[0])
+        matching_engine.subscribe(aggregator)
+        matching_engine.handle_order(LimitOrder(None, "S", 50, 10, OrderSide.SELL, time.time()))
+        matching_engine.handle_order(LimitOrder(None, "S", 50, 12, OrderSide.SELL, time.time()))
+        self.assertEqual(aggregator.bars("S", 1), [])
+        matching_engine.handle_order(MarketOrder(None, "S", 5, OrderSide.BUY, time.time()))
+        now[0] = 100.9
+        matching_engine.handle_order(MarketOrder(None, "S", 50, OrderSide.BUY, time.time()))
+        now[0] = 101.2
+        matching_engine.handle_order(MarketOrder(None, "S", 1, OrderSide.BUY, time.time()))
+        self.assertEqual(aggregator.bars("S", 1), [(100, 10, 12, 10, 12, 55), (101, 12, 12, 12, 12, 1)])
+        self.assertEqual(aggregator.bars("S", 60), [(60, 10, 12, 10, 12, 56)])
+        now[0] = 105.0
+        matching_engine.handle_order(LimitOrder(None, "S", 10, 9, OrderSide.BUY, time.time()))
+        matching_engine.handle_order(LimitOrder(None, "S", 4, 9, OrderSide.SELL, time.time()))
+        # only the last two bars are kept
+        self.assertEqual(aggregator.bars("S", 1), [(101, 12, 12, 12, 12, 1), (105, 9, 9, 9, 9, 4)])
+        self.assertEqual(aggregator.bars("S", 1, 1), [(105, 9, 9, 9, 9, 4)])
+        self.assertEqual(aggregator.bars("S", 60)[-1], (60, 10, 12, 9, 9, 60))
+
+    def test_event_log(self):
+        log = EventLog(capacity=4, level=LogLevel.INFO)
+        log.log(LogLevel.DEBUG, LogEvent.ORDER_HANDLED, 0, 1, 5, 10.0)
+        self.assertEqual(log.head, 0)
+        for i in range(6):
+            log.log(LogLevel.INFO, LogEvent.FILL_SENT, i, 100 + i, 5, 10.5)
+        self.assertEqual((log.head, log.dropped), (4, 2))
+
+        path = os.path.join(tempfile.mkdtemp(), "events.bin")
+        log.open(path, binary=True)
+        log.close()
+        for i in range(3):
+            log.log(LogLevel.WARNING, LogEvent.TRADER_STEP, i, 0, i)
+        log.open(path, binary=True)
+        log.close()
+        records = list(read_event_log(path))
+        self.assertEqual([(record[2], record[3], record[4]) for record in records],
+                         [(LogEvent.FILL_SENT, i, 100 + i) for i in range(4)] +
+                         [(LogEvent.TRADER_STEP, i, 0) for i in range(3)])
+        self.assertEqual(records[0][1], LogLevel.INFO)
+        self.assertEqual(records[0][6], 10.5)
+
+        path = os.path.join(tempfile.mkdtemp(), "events.log")
+        log.open(path)
+        log.log(LogLevel.ERROR, LogEvent.ACK_RECEIVED, 7, 0, 2)
+        log.close()
+        with open(path) as f:
+            self.assertEqual(f.read().split()[1:], ["ERROR", "ACK_RECEIVED", "7", "0", "2", "0.0"])
+
+    def test_handle_orders(self):
+        random.seed(7)
+        sequential_engine = MatchingEngine()
+        batch_engine = MatchingEngine()
+        sides = array('b', [random.randint(1, 2) for _ in range(500)])
+        types = array('b', [random.choice((1, 1, 1, 2, 3)) for _ in range(500)])
+        prices = array('d', [random.randint(95, 105) for _ in range(500)])
+        quantities = array('q', [random.randint(1, 20) for _ in range(500)])
+        executions = batch_engine.handle_orders(OrderBatch(None, sides, types, prices, quantities, "S"))
+
+        reports = []
+        for i in range(500):
+            side = OrderSide(sides[i])
+            if types[i] == OrderType.LIMIT.value:
+                order = LimitOrder(None, "S", quantities[i], prices[i], side, 0.0)
+            elif types[i] == OrderType.IOC.value:
+                order = IOCOrder(None, "S", quantities[i], prices[i], side, 0.0)
+            else:
+                order = MarketOrder(None, "S", quantities[i], side, 0.0)
+            reports.extend(sequential_engine.handle_order(order))
+
+        self.assertGreater(len(reports), 0)
+        self.assertEqual(list(executions.sequence), [item.sequence for item in reports])
+        self.assertEqual(list(executions.aggressor_id), [item.aggressor_id for item in reports])
+        self.assertEqual(list(executions.passive_id), [item.passive_id for item in reports])
+        self.assertEqual(list(executions.price), [item.price for item in reports])
+        self.assertEqual(list(executions.quantity), [item.quantity for item in reports])
+        for sequential_book, batch_book in ((sequential_engine.bid_book, batch_engine.bid_book),
+                                            (sequential_engine.ask_book, batch_engine.ask_book)):
+            self.assertEqual([(item.id, item.price, item.quantity) for item in sequential_book],
+                             [(item.id, item.price, item.quantity) for item in batch_book])
+
+        with self.assertRaises(NonPositiveQuantity):
+            batch_engine.handle_orders(OrderBatch(None, [1], [1], [10], [0]))
+
+    def test_symbol_router(self):
+        router = SymbolRouter()
+        order_1 = LimitOrder(None, "S", 5, 10, OrderSide.BUY, time.time())
+        order_2 = LimitOrder(None, "T", 5, 10, OrderSide.SELL, time.time())
+        self.assertEqual(router.handle_order(order_1), [])
+        self.assertEqual(router.handle_order(order_2), [])
+        self.assertEqual(router.symbols, ["S", "T"])
+        self.assertIs(router.engine("S").bid_book[0], order_1)
+        self.assertIs(router.engine("T").ask_book[0], order_2)
+        self.assertIs(router.resting_order(order_2.id), order_2)
+
+        filled_orders = router.handle_order(LimitOrder(None, "T", 2, 10, OrderSide.BUY, time.time()))
+        self.assertEqual(filled_orders[0].passive_id, order_2.id)
+        self.assertEqual(router.engine("S").bid_book[0].quantity, 5)
+
+        self.assertTrue(router.amend_quantity(order_2.id, 1))
+        self.assertTrue(router.cancel_order(order_1.id))
+        self.assertFalse(router.cancel_order(order_1.id))
+        self.assertIsNone(router.resting_order(order_1.id))
+        self.assertEqual(len(router.engine("S").bid_book), 0)
+        self.assertEqual(router.engine("T").ask_book[0].quantity, 1)
+
+    def test_tick_ladder(self):
+        random.seed(11)
+        matching_engine = MatchingEngine("S", 5, 5, 20000)
+        reference_engine = MatchingEngine("S")
+        for _ in range(2000):
+            side = random.choice((OrderSide.BUY, OrderSide.SELL))
+            quantity = random.randint(1, 20)
+            price = 5 * random.randint(1, 4000)
+            market = random.random() < 0.1
+            reports = []
+            for engine in (matching_engine, reference_engine):
+                if market:
+                    order = MarketOrder(None, "S", quantity, side, 0.0)
+                else:
+                    order = LimitOrder(None, "S", quantity, price, side, 0.0)
+                reports.append([(item.passive_id, item.price, item.quantity) for item in engine.handle_order(order)])
+            self.assertEqual(reports[0], reports[1])
+            if random.random() < 0.2 and reference_engine.orders:
+                id = random.choice(list(reference_engine.orders))
+                self.assertTrue(matching_engine.cancel_order(id))
+                self.assertTrue(reference_engine.cancel_order(id))
+        self.assertEqual(matching_engine.depth(1000), reference_engine.depth(1000))
+        self.assertEqual([item.id for item in matching_engine.ask_book], [item.id for item in reference_engine.ask_book])
+
+        with self.assertRaises(PriceNotOnTick):
+            matching_engine.handle_order(LimitOrder(None, "S", 5, 12, OrderSide.BUY, time.time()))
+        with self.assertRaises(PriceOutOfBand):
+            matching_engine.handle_order(IOCOrder(None, "S", 5, 20005, OrderSide.BUY, time.time()))
+        with self.assertRaises(PriceNotOnTick):
+            matching_engine.handle_orders(OrderBatch(None, [1, 2], [1, 1], [10, 11], [5, 5]))
+        with self.assertRaises(PriceNotOnTick):
+            LimitOrder(None, "S", 5, 10.02, OrderSide.BUY, time.time(), tick_size=0.05)
+        self.assertEqual(IOCOrder(None, "S", 5, 10.05, OrderSide.BUY, time.time(), tick_size=0.05).price, 10.05)
+
+        router = SymbolRouter()
+        router.add_symbol("T", 0.01, 0.01, 100)
+        router.handle_order(LimitOrder(None, "T", 5, 0.07, OrderSide.SELL, time.time()))
+        router.handle_order(LimitOrder(None, "T", 5, 0.03, OrderSide.SELL, time.time()))
+        self.assertEqual([price for price, _ in router.engine("T").asks.depth(2)], [0.03, 0.07])
+        # (tick + base) * tick_size alone would put these at 0.30000000000000004 and 0.7000000000000001
+        router.add_symbol("U", 0.1, 0.1, 100)
+        router.handle_order(LimitOrder(None, "U", 5, 0.3, OrderSide.SELL, time.time()))
+        router.handle_order(LimitOrder(None, "U", 5, 0.7, OrderSide.SELL, time.time()))
+        self.assertEqual([price for price, _ in router.engine("U").asks.depth(2)], [0.3, 0.7])
+        fills = router.handle_order(LimitOrder(None, "U", 8, 0.7, OrderSide.BUY, time.time()))
+        self.assertEqual([(item.price, item.quantity) for item in fills], [(0.3, 5), (0.7, 3)])
+        self.assertEqual(tick_digits(0.05), 2)
+        self.assertEqual(tick_digits(1e-05), 5)
+        self.assertEqual(tick_digits(2.0), 0)
+        self.assertIsNone(tick_digits(5))
+        with self.assertRaises(ValueError):
+            router.add_symbol("T")
+
     def test_amend_quantity(self):
         matching_engine = MatchingEngine()
         order_1 = LimitOrder(1, "S", 5, 10, OrderSide.BUY, time.time())
@@ -566,6 +1645,26 @@ class TestOrderBook(unittest.TestCase):
         matching_engine.amend_quantity(2, 8)
         self.assertEqual(matching_engine.bid_book[0].quantity, 8)
 
+    def test_order_index(self):
+        matching_engine = MatchingEngine()
+        order_1 = LimitOrder(None, "S", 5, 10, OrderSide.BUY, time.time())
+        order_2 = LimitOrder(None, "S", 10, 10, OrderSide.BUY, time.time())
+        matching_engine.handle_order(order_1)
+        matching_engine.handle_order(order_2)
+        self.assertNotEqual(order_1.id, order_2.id)
+        self.assertIs(matching_engine.orders[order_2.id], order_2)
+
+        matching_engine.handle_limit_order(LimitOrder(None, "S", 5, 10, OrderSide.SELL, time.time()))
+        self.assertNotIn(order_1.id, matching_engine.orders)
+        self.assertFalse(matching_engine.cancel_order(order_1.id))
+        self.assertTrue(matching_engine.cancel_order(order_2.id))
+        self.assertEqual(len(matching_engine.orders), 0)
+        self.assertEqual(len(matching_engine.bid_book), 0)
+
+        matching_engine.insert_limit_order(LimitOrder(7, "S", 5, 10, OrderSide.SELL, time.time()))
+        with self.assertRaises(DuplicateOrderId):
+            matching_engine.insert_limit_order(LimitOrder(7, "S", 5, 12, OrderSide.SELL, time.time()))
+
     def test_cancel_order(self):
         matching_engine = MatchingEngine()
         order_1 = LimitOrder(1, "S", 5, 10, OrderSide.BUY, time.time())
@@ -0,0 +1,141 @@
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+from trading_arena import Exchange, Trader, Simulation
+from population import TraderCohort
+
+
+# Many independent arena sessions with different seeds and parameters, farmed out to a pool of
+# worker processes. Every session builds its own exchange, traders and simulation and keeps them
+# out of MyThread.list_of_threads; its Simulation hands requests straight to the exchange and acks
+# straight to the traders, so nothing goes through or is made in the module level queues, and a
+# worker can run one session after another. All of a session's randomness is drawn from its seed,
+# which depends only on the run's index and the base seed; a run's summary is therefore the same
+# whichever worker runs it, and aggregate puts the summaries back in run order before adding them
+# up.
+
+METRICS = ('trades', 'volume', 'vwap', 'high', 'low', 'last_price', 'simulated_time', 'events', 'balance_total',
+           'balance_min', 'balance_max', 'bankrupt')
+
+
+class TradeStats():
+    # stands in for a TradeTape on the session's exchange, keeping only running totals
+    def __init__(self):
+        self.trades = 0
+        self.volume = 0
+        self.notional = 0.0
+        self.high = None
+        self.low = None
+        self.last_price = None
+
+    def record(self, sequence, trade_time, symbol, price, quantity, side, aggressor, passive):
+        self.trades += 1
+        self.volume += quantity
+        self.notional += price * quantity
+        if self.high is None or price > self.high:
+            self.high = price
+        if self.low is None or price < self.low:
+            self.low = price
+        self.last_price = price
+
+
+class Session():
+    # One arena session: traders Trader objects and, if cohort is given, a TraderCohort made with
+    # cohort as its keyword arguments, run as a Simulation for steps actions each or until
+    # simulated time until
+    def __init__(self, seed, traders=100, steps=10, until=None, interval=1.0, latency=0.001, cohort=None):
+        seeds = random.Random(seed)
+        self.seed = seed
+        self.threads = []
+        self.exchange = Exchange(0, self.threads)
+        self.stats = self.exchange.tape = TradeStats()
+        self.traders = [Trader(i, threads=self.threads) for i in range(traders)]
+        for trader in self.traders:
+            trader.random = random.Random(seeds.getrandbits(64))
+        cohorts = []
+        if cohort is not None:
+            # the cohort's ids follow the traders'
+            cohorts.append(TraderCohort(self.exchange, first_id=traders, seed=seeds.getrandbits(64), **cohort))
+        self.simulation = Simulation(self.exchange, self.traders, interval, latency, seeds.getrandbits(64), cohorts)
+        self.steps = steps
+        self.until = until
+
+    def run(self):
+        # runs the session and returns its summary
+        simulated_time = self.simulation.run(self.steps, self.until)
+        stats, balance = self.stats, self.exchange.balance
+        return {'seed': self.seed, 'trades': stats.trades, 'volume': stats.volume,
+                'vwap': stats.notional / stats.volume if stats.volume else None, 'high': stats.high,
+                'low': stats.low, 'last_price': stats.last_price, 'simulated_time': simulated_time,
+                'events': self.simulation.handled, 'balance_total': sum(balance),
+                'balance_min': min(balance, default=None), 'balance_max': max(balance, default=None),
+                'bankrupt': sum(1 for value in balance if value < 0)}
+
+
+def run_session(task):
+    # worker: (run index, seed, parameters) -> (run index, summary)
+    run, seed, parameters = task
+    return run, Session(seed, **parameters).run()
+
+
+def run_seeds(runs, seed=0):
+    # the seed of each of runs runs, drawn from the base seed
+    seeds = random.Random(seed)
+    return [seeds.getrandbits(64) for _ in range(runs)]
+
+
+def monte_carlo(runs, workers=None, seed=0, parameters=None):
+    # runs sessions with the same parameters (Session's keyword arguments, or a list with one dict
+    # per run) and yields (run index, summary) for each as soon as it finishes. With workers=1 they
+    # run one after another in this process.
+    if parameters is None or isinstance(parameters, dict):
+        parameters = [parameters or {}] * runs
+    tasks = [(run, run_seed, parameters[run]) for run, run_seed in enumerate(run_seeds(runs, seed))]
+    if workers == 1:
+        for task in tasks:
+            yield run_session(task)
+        return
+    with multiprocessing.get_context().Pool(workers) as pool:
+        yield from pool.imap_unordered(run_session, tasks)
+
+
+def aggregate(results):
+    # metric -> (runs, mean, standard deviation, min, max) over the (run index, summary) pairs in
+    # results, taken in run order so the sums come out the same however the runs were scheduled
+    summaries = [summary for _, summary in sorted(results, key=lambda result: result[0])]
+    statistics = {}
+    for metric in METRICS:
+        values = [summary[metric] for summary in summaries if summary[metric] is not None]
+        if not values:
+            continue
+        mean = math.fsum(values) / len(values)
+        deviation = math.sqrt(math.fsum((value - mean) ** 2 for value in values) / len(values))
+        statistics[metric] = (len(values), mean, deviation, min(values), max(values))
+    return statistics
+
+
+if __name__ == "__main__":
+    # python montecarlo.py RUNS [workers] [number of traders] [cohort size]
+    #     runs RUNS sessions of 10 steps, printing each run's summary as it comes in and the
+    #     statistics over all of them at the end
+    runs = int(sys.argv[1])
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    traders = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    cohort_size = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    parameters = {'traders': traders}
+    if cohort_size:
+        parameters['cohort'] = {'size': cohort_size, 'price_sd': 5, 'quantity_low': 1, 'order_types': (0.9, 0.05, 0.05)}
+    start = time.perf_counter()
+    results = []
+    for run, summary in monte_carlo(runs, workers, parameters=parameters):
+        results.append((run, summary))
+        print('run ', run, ' trades: ', summary['trades'], ' vwap: ', summary['vwap'], ' bankrupt: ',
+              summary['bankrupt'])
+    print()
+    print('%-16s %6s %16s %16s %16s %16s' % ('metric', 'runs', 'mean', 'std', 'min', 'max'))
+    for metric, (count, mean, deviation, low, high) in aggregate(results).items():
+        print('%-16s %6d %16.4f %16.4f %16.4f %16.4f' % (metric, count, mean, deviation, low, high))
+    print('time taken: ', time.perf_counter() - start)
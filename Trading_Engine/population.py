@@ -0,0 +1,133 @@
+import sys
+import time
+
+import numpy as np
+
+from trading_arena import Exchange, Trader, OrderBatch, OrderSide, ActionType
+
+
+# Trader populations whose actions are drawn for the whole cohort at once with NumPy, for
+# simulations with far more traders than Trader objects could step through. Individual Traders
+# still work alongside a cohort on the same Exchange.
+
+
+class TraderCohort():
+    # size traders with consecutive ids from first_id (the next unused id by default) who all trade
+    # symbol. Every step, each trader whose balance has not run out acts with probability
+    # participation; what it does is drawn from these distributions:
+    #   actions      probabilities of placing an order, amending, cancelling and asking for the
+    #                balance and position (the ActionTypes in order)
+    #   order_types  probabilities of a limit, market and IOC order
+    #   buy          probability that an order is a buy
+    #   prices       normal with mean price and standard deviation price_sd, rounded to multiples of
+    #                tick and at least one tick
+    #   quantities   uniform over quantity_low to quantity_high inclusive; an amend takes the
+    #                trader's oldest resting order down to half of quantity_high, as Trader's does
+    # The defaults make every trader place a limit order of 100 at 10000 each step, like Trader.
+    # New orders go to the exchange as one OrderBatch; the other actions are handled one request at
+    # a time. The cohort has no mailboxes, so its acks are dropped; the exchange's accounts are the
+    # record of what its traders hold.
+    def __init__(self, exchange, size, first_id=None, symbol='AAPL', seed=None, participation=1.0,
+                 actions=(1.0, 0.0, 0.0, 0.0), order_types=(1.0, 0.0, 0.0), buy=0.5, price=10000, price_sd=0,
+                 tick=1, quantity_low=100, quantity_high=100):
+        self.exchange = exchange
+        self.size = size
+        self.first_id = len(exchange.balance) if first_id is None else first_id
+        exchange.add_trader(self.first_id + size - 1)
+        self.symbol = symbol
+        self.random = np.random.default_rng(seed)
+        self.participation = participation
+        self.actions = np.asarray(actions, np.float64)
+        self.order_types = np.asarray(order_types, np.float64)
+        self.buy = buy
+        self.price = price
+        self.price_sd = price_sd
+        self.tick = tick
+        self.quantity_low = quantity_low
+        self.quantity_high = quantity_high
+        self.clock = time.time
+
+    def active(self):
+        # ids of the traders acting this step
+        balances = np.array(self.exchange.balance[self.first_id:self.first_id + self.size], np.float64)
+        acting = balances >= 0
+        if self.participation < 1:
+            acting &= self.random.random(self.size) < self.participation
+        return np.flatnonzero(acting) + self.first_id
+
+    def draw(self, count):
+        # the sides, types, prices and quantities of count new orders
+        random = self.random
+        sides = np.where(random.random(count) < self.buy, OrderSide.BUY.value, OrderSide.SELL.value).astype(np.int8)
+        types = (random.choice(3, count, p=self.order_types / self.order_types.sum()) + 1).astype(np.int8)
+        if self.price_sd:
+            ticks = np.maximum(np.rint(random.normal(self.price, self.price_sd, count) / self.tick), 1)
+        else:
+            ticks = np.full(count, max(round(self.price / self.tick), 1))
+        prices = ticks.astype(np.int64) * self.tick
+        quantities = random.integers(self.quantity_low, self.quantity_high + 1, count)
+        return sides, types, prices, quantities
+
+    def generate(self):
+        # this step's actions: an OrderBatch of the new orders with the id of the trader behind each,
+        # and the other requests
+        trader_ids = self.active()
+        if len(self.actions) > 1 and self.actions[1:].any():
+            actions = self.random.choice(4, len(trader_ids), p=self.actions / self.actions.sum()) + 1
+            placing = trader_ids[actions == ActionType.PLACE_ORDER.value]
+            requests = [(ActionType.AMEND_ORDER.value, trader_id, max(self.quantity_high // 2, 1))
+                        for trader_id in trader_ids[actions == ActionType.AMEND_ORDER.value].tolist()]
+            for action in (ActionType.CANCEL_ORDER.value, ActionType.RETURN_POSITION.value):
+                requests.extend((action, trader_id) for trader_id in trader_ids[actions == action].tolist())
+        else:
+            placing, requests = trader_ids, []
+        sides, types, prices, quantities = self.draw(len(placing))
+        return OrderBatch(None, sides, types, prices, quantities, self.symbol, self.clock()), placing, requests
+
+    def submit(self, actions):
+        # hands what generate drew to the exchange
+        batch, trader_ids, requests = actions
+        if len(batch):
+            self.exchange.place_orders(batch, trader_ids)
+        for request in requests:
+            self.exchange.handle_request(request)
+
+    def step(self):
+        self.submit(self.generate())
+
+
+def bench_generation(traders=100000, steps=5):
+    # seconds per trader per step to draw an action, for Trader objects and for a cohort
+    exchange = Exchange(0)
+    population = [Trader(i) for i in range(traders)]
+    start = time.perf_counter()
+    for _ in range(steps):
+        for trader in population:
+            trader.random_action()
+    objects = (time.perf_counter() - start) / (traders * steps)
+    cohort = TraderCohort(exchange, traders, price_sd=5, quantity_low=1)
+    start = time.perf_counter()
+    for _ in range(steps):
+        cohort.generate()
+    vectorized = (time.perf_counter() - start) / (traders * steps)
+    return objects, vectorized
+
+
+if __name__ == "__main__":
+    # python population.py [number of traders] [steps]
+    #     compares the cost of drawing actions for Trader objects and for a cohort, then runs a cohort
+    #     against the exchange
+    traders = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    objects, vectorized = bench_generation(traders, steps)
+    print('action generation per trader: Trader objects ', round(objects * 1e9), ' ns, cohort ',
+          round(vectorized * 1e9), ' ns (', round(objects / vectorized, 1), 'x)')
+    exchange = Exchange(0)
+    cohort = TraderCohort(exchange, traders, seed=1, price_sd=5, quantity_low=1, quantity_high=100,
+                          order_types=(0.9, 0.05, 0.05))
+    start = time.perf_counter()
+    for _ in range(steps):
+        cohort.step()
+    elapsed = time.perf_counter() - start
+    print('cohort of ', traders, ' traders: ', int(traders * steps / elapsed), ' orders per second')
+    print("Total Money Amount for All Traders: ", str(int(sum(exchange.balance))))
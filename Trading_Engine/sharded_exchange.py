@@ -0,0 +1,211 @@
+import multiprocessing
+import os
+import queue
+import traceback
+from collections import deque
+
+import trading_arena
+from trading_arena import Exchange, ActionType, UndefinedTraderAction
+
+
+# A sharded exchange: symbols are partitioned across a pool of worker processes, each running its
+# own Exchange with the books of its symbols and the slice of every trader's balance and position
+# that those symbols move. Requests are routed to the owning shard in chunks, and the shards' acks
+# are merged back into the trader mailboxes (exchange_to_trader by default).
+#
+# Every shard starts its balances at 0, so a shard's balance is the net cash its own symbols have
+# moved for a trader; a balance query is answered by summing the slices of all shards on top of
+# the starting balance.
+#
+# Amends and cancels name a trader, not an order, so they go to the shard of the symbol the trader
+# last placed an order in and apply to the trader's oldest resting order there. A trader that only
+# ever trades one symbol gets the same results as from a single Exchange. One with orders resting
+# in several symbols does not: a single Exchange would amend or cancel its oldest order across all
+# of them, which the front cannot tell without tracking every order itself.
+
+STARTING_BALANCE = 1000000
+
+
+class ShardFailed(Exception):
+    pass
+
+
+class ShardMailbox():
+    # a trader's mailbox in a shard: its acks are collected, tagged with the trader's id, in the
+    # list that goes back to the front once the chunk is done
+    def __init__(self, trader_id, acks):
+        self.trader_id = trader_id
+        self.acks = acks
+
+    def put_nowait(self, response):
+        self.acks.append((self.trader_id, response))
+
+
+class ShardMailboxes(dict):
+    # trader id -> ShardMailbox, made the first time the shard acks the trader
+    def __init__(self):
+        super().__init__()
+        self.acks = []
+
+    def __missing__(self, trader_id):
+        mailbox = self[trader_id] = ShardMailbox(trader_id, self.acks)
+        return mailbox
+
+
+def run_shard(shard, requests, results):
+    # worker process: handle chunks of requests until a None arrives, sending back
+    # (shard, acks) for each chunk with the acks as a list of (trader id, response), then
+    # (shard, None). Accounts open as traders first appear. If handling a request raises, the
+    # worker sends (shard, the traceback as a string) instead and exits.
+    exchange = Exchange()
+    exchange.starting_balance = 0
+    mailboxes = exchange.mailboxes = ShardMailboxes()
+    try:
+        while True:
+            chunk = requests.get()
+            if chunk is None:
+                break
+            for request in chunk:
+                exchange.handle_request(request)
+            results.put((shard, mailboxes.acks[:]))
+            del mailboxes.acks[:]
+    except Exception:
+        results.put((shard, traceback.format_exc()))
+        return
+    results.put((shard, None))
+
+
+class ShardedExchange():
+    def __init__(self, shards=None, chunk_size=1024, mailboxes=None):
+        self.shards = shards or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.mailboxes = trading_arena.exchange_to_trader if mailboxes is None else mailboxes
+        self.shard_of_symbol = {}
+        # symbol -> shard, handed out round robin the first time a symbol is seen
+        self.trader_shard = {}
+        # trader id -> shard of the symbol the trader last placed an order in, where its amends
+        # and cancels go
+        self.pending = [[] for _ in range(self.shards)]
+        # requests routed to each shard but not sent yet
+        self.queries = {}
+        # trader id -> deque of [set of shards still to answer, balance, positions], one per
+        # balance query not answered yet, oldest first
+        context = multiprocessing.get_context()
+        self.requests = [context.Queue() for _ in range(self.shards)]
+        self.results = context.Queue()
+        self.workers = [context.Process(target=run_shard, args=(i, self.requests[i], self.results), daemon=True)
+                        for i in range(self.shards)]
+        self.in_flight = 0
+        # chunks sent to the shards whose acks have not come back yet
+        self.stopped = set()
+        # shards whose workers have finished after being sent None
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def shard(self, symbol):
+        shard = self.shard_of_symbol.get(symbol)
+        if shard is None:
+            shard = self.shard_of_symbol[symbol] = len(self.shard_of_symbol) % self.shards
+        return shard
+
+    def submit(self, request):
+        action, trader_id = request[0], request[1]
+        if action == ActionType.PLACE_ORDER.value:
+            shard = self.trader_shard[trader_id] = self.shard(request[2].symbol)
+            self.route(shard, request)
+        elif action == ActionType.AMEND_ORDER.value or action == ActionType.CANCEL_ORDER.value:
+            shard = self.trader_shard.get(trader_id)
+            if shard is None:
+                # the trader has never placed an order, so there is nothing to amend or cancel
+                self.mailboxes[trader_id].put_nowait((action, False))
+            else:
+                self.route(shard, request)
+        elif action == ActionType.RETURN_POSITION.value:
+            self.queries.setdefault(trader_id, deque()).append([set(range(self.shards)), STARTING_BALANCE, {}])
+            for shard in range(self.shards):
+                self.route(shard, request)
+        else:
+            raise UndefinedTraderAction("Undefined Trader Action!")
+
+    def route(self, shard, request):
+        pending = self.pending[shard]
+        pending.append(request)
+        if len(pending) >= self.chunk_size:
+            self.send(shard)
+
+    def send(self, shard):
+        if self.pending[shard]:
+            self.requests[shard].put(self.pending[shard])
+            self.pending[shard] = []
+            self.in_flight += 1
+
+    def flush(self):
+        for shard in range(self.shards):
+            self.send(shard)
+
+    def collect(self, block=False):
+        # move the acks the shards have sent back into the trader mailboxes; with block=True, wait
+        # until every chunk sent so far has been answered
+        while self.in_flight:
+            if not block and self.results.empty():
+                break
+            shard, acks = self.result()
+            self.in_flight -= 1
+            for trader_id, response in acks:
+                if response[0] == ActionType.RETURN_POSITION.value:
+                    self.merge_query(trader_id, shard, response[1])
+                else:
+                    self.mailboxes[trader_id].put_nowait(response)
+
+    def result(self):
+        # the next (shard, message) the workers sent back. Raises ShardFailed if a worker reports
+        # an error, or exits, rather than waiting for an answer that will never come.
+        while True:
+            try:
+                shard, message = self.results.get(timeout=1)
+            except queue.Empty:
+                for shard, worker in enumerate(self.workers):
+                    if shard not in self.stopped and not worker.is_alive():
+                        raise ShardFailed("Shard " + str(shard) + " Exited With Code " + str(worker.exitcode) + "!")
+                continue
+            if isinstance(message, str):
+                raise ShardFailed("Shard " + str(shard) + " Failed:\n" + message)
+            if message is None:
+                self.stopped.add(shard)
+            return shard, message
+
+    def merge_query(self, trader_id, shard, answer):
+        # a shard answers a trader's queries in the order they were routed to it, so its answer
+        # belongs to the oldest one it has not answered yet
+        queries = self.queries[trader_id]
+        for query in queries:
+            if shard in query[0]:
+                break
+        query[0].remove(shard)
+        query[1] += answer[0]
+        for symbol, position in answer[1].items():
+            query[2][symbol] = query[2].get(symbol, 0) + position
+        while queries and not queries[0][0]:
+            _, balance, positions = queries.popleft()
+            self.mailboxes[trader_id].put_nowait((ActionType.RETURN_POSITION.value, (balance, positions)))
+        if not queries:
+            del self.queries[trader_id]
+
+    def stop(self):
+        # waits for the acks of everything submitted, then for the workers to exit. If a shard has
+        # failed, the other workers are terminated and ShardFailed is raised.
+        try:
+            self.flush()
+            self.collect(block=True)
+            for requests in self.requests:
+                requests.put(None)
+            while len(self.stopped) < len(self.workers):
+                self.result()
+        except ShardFailed:
+            for worker in self.workers:
+                worker.terminate()
+            raise
+        for worker in self.workers:
+            worker.join()
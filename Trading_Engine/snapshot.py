@@ -0,0 +1,271 @@
+import gc
+import itertools
+import math
+import struct
+import sys
+import time
+from array import array
+from collections import deque, OrderedDict
+
+from trading_arena import Exchange, LimitOrder, MarketOrder, IOCOrder
+from journal import replay
+
+
+# Snapshots of an Exchange's complete state - every book with its resting orders in time priority,
+# the id counters, and the traders' accounts - in a compact binary file that loads back in bulk.
+#
+# Layout: HEADER, then the accounts, then each symbol's book in the order the router knows them.
+# Every column is written as a typecode byte, a count and the raw array.array contents, in the
+# machine's native byte order. Number columns are stored as integers when every value is an int,
+# and otherwise as floats followed by a column flagging the values that were ints (empty if none
+# were), so balances and prices come back as the same types they were saved as.
+#   accounts: balances, open order count per trader, open order ids (trader by trader, oldest
+#             first), then the positions as three columns of trader id, symbol index and quantity
+#   book:     symbol (length prefixed UTF-8), the engine's next order id, next execution sequence
+#             number and last market data sequence number, the price ladder's tick size, lowest and
+#             highest price (see LADDER), then bids and asks, each as level prices (best first),
+#             orders per level, and the id, quantity, time, OrderType value and owning trader (-1 for
+#             none) of every order in priority order
+
+MAGIC = b'FIMSNAP2'
+HEADER = struct.Struct('<8sqqqq')
+# magic, traders, symbols, the router's next order id, and the journal position
+SYMBOL_HEADER = struct.Struct('<HqqqBddd')
+LADDER = 1
+# set in a symbol's ladder flags if its book is on a price ladder. The next three bits are set for
+# each of the tick size, lowest and highest price that was an int, so they come back as ints; a
+# book without a ladder stores NaN for all three.
+COLUMN_HEADER = struct.Struct('<cq')
+
+ORDER_CLASSES = (None, LimitOrder, MarketOrder, IOCOrder)
+
+
+class InvalidSnapshot(Exception):
+    pass
+
+
+def write_column(f, column):
+    f.write(COLUMN_HEADER.pack(column.typecode.encode(), len(column)))
+    f.write(column.tobytes())
+
+
+def write_numbers(f, values):
+    try:
+        write_column(f, array('q', values))
+    except TypeError:
+        write_column(f, array('d', values))
+        integers = array('b', [type(value) is int for value in values])
+        write_column(f, integers if any(integers) else array('b'))
+
+
+def read_column(view, offset):
+    typecode, count = COLUMN_HEADER.unpack_from(view, offset)
+    offset += COLUMN_HEADER.size
+    column = array(typecode.decode())
+    end = offset + count * column.itemsize
+    column.frombytes(view[offset:end])
+    return column.tolist(), end
+
+
+def read_numbers(view, offset):
+    floats = view[offset:offset + 1] == b'd'
+    values, offset = read_column(view, offset)
+    if floats:
+        integers, offset = read_column(view, offset)
+        if integers:
+            values = [int(value) if integer else value for value, integer in zip(values, integers)]
+    return values, offset
+
+
+def next_value(owner, attribute):
+    # the value the itertools.count owner.attribute hands out next; reading it consumes the value,
+    # so the counter is replaced by one that starts there again
+    value = next(getattr(owner, attribute))
+    setattr(owner, attribute, itertools.count(value))
+    return value
+
+
+def write_side(f, book, order_owner):
+    prices = []
+    sizes = []
+    orders = []
+    for price in book.prices():
+        level = book.levels[price]
+        prices.append(price)
+        sizes.append(len(level))
+        orders.extend(level.values())
+    write_numbers(f, prices)
+    write_column(f, array('q', sizes))
+    write_column(f, array('q', [order.id for order in orders]))
+    write_numbers(f, [order.quantity for order in orders])
+    write_numbers(f, [order.time for order in orders])
+    write_column(f, array('b', [order.type.value for order in orders]))
+    write_column(f, array('q', [order_owner.get(order.id, -1) for order in orders]))
+
+
+def save_snapshot(exchange, path):
+    # writes the exchange's state to path. If the exchange is journaling, the journal is flushed
+    # and the snapshot records how many of its requests it covers, so a restore only needs to
+    # replay the ones after that.
+    journal_position = 0
+    if exchange.journal is not None:
+        exchange.journal.flush()
+        journal_position = len(exchange.journal)
+    router = exchange.router
+    resting = [[id for id in exchange.open_orders.get(trader_id, ()) if router.resting_order(id) is not None]
+               for trader_id in range(len(exchange.balance))]
+    # ids of orders that have left the book are only dropped lazily by the exchange; they are
+    # left out here
+    symbol_index = {symbol: i for i, symbol in enumerate(router.symbols)}
+    traders, symbols, quantities = [], [], []
+    for trader_id, position in exchange.position.items():
+        for symbol, quantity in position.items():
+            traders.append(trader_id)
+            symbols.append(symbol_index[symbol])
+            quantities.append(quantity)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(exchange.balance), len(router.symbols), next_value(router, 'order_ids'),
+                            journal_position))
+        write_numbers(f, exchange.balance)
+        write_column(f, array('q', [len(ids) for ids in resting]))
+        write_column(f, array('q', [id for ids in resting for id in ids]))
+        write_column(f, array('q', traders))
+        write_column(f, array('q', symbols))
+        write_numbers(f, quantities)
+        for matching_engine in router.engines:
+            symbol = matching_engine.symbol.encode()
+            f.write(SYMBOL_HEADER.pack(len(symbol), next_value(matching_engine, 'order_ids'),
+                                       next_value(matching_engine, 'sequence'), matching_engine.update_sequence,
+                                       *ladder_settings(matching_engine)))
+            f.write(symbol)
+            write_side(f, matching_engine.bids, exchange.order_owner)
+            write_side(f, matching_engine.asks, exchange.order_owner)
+    return journal_position
+
+
+def ladder_settings(matching_engine):
+    # the ladder flags, tick size, lowest and highest price of a symbol header
+    if matching_engine.tick_size is None:
+        return 0, math.nan, math.nan, math.nan
+    settings = (matching_engine.tick_size, matching_engine.bids.min_price, matching_engine.bids.max_price)
+    flags = LADDER
+    for i, value in enumerate(settings):
+        if type(value) is int:
+            flags |= 2 << i
+    return (flags,) + settings
+
+
+def ladder_arguments(flags, *settings):
+    # add_symbol's tick_size, min_price and max_price for the ladder fields of a symbol header
+    if not flags & LADDER:
+        return None, None, None
+    return tuple(int(value) if flags & 2 << i else value for i, value in enumerate(settings))
+
+
+def read_side(view, offset, matching_engine, book, order_owner):
+    # rebuilds one side of a book straight from the columns: every order object is made without
+    # going through the constructors' checks, and each level and the id index are filled in one go
+    prices, offset = read_numbers(view, offset)
+    sizes, offset = read_column(view, offset)
+    ids, offset = read_column(view, offset)
+    quantities, offset = read_numbers(view, offset)
+    times, offset = read_numbers(view, offset)
+    types, offset = read_column(view, offset)
+    owners, offset = read_column(view, offset)
+    symbol, side = matching_engine.symbol, book.side
+    orders = []
+    start = 0
+    for price, size in zip(prices, sizes):
+        end = start + size
+        level = [ORDER_CLASSES[order_type].unchecked(id, symbol, quantity, side, order_time, price)
+                 for id, quantity, order_time, order_type in
+                 zip(ids[start:end], quantities[start:end], times[start:end], types[start:end])]
+        book.levels[price] = OrderedDict(zip(ids[start:end], level))
+        book.quantities[price] = sum(quantities[start:end])
+        orders.extend(level)
+        start = end
+    if matching_engine.tick_size is None:
+        book.keys = [book.sign * price for price in reversed(prices)]
+    else:
+        for price in prices:
+            book.mark(book.tick_of(price))
+        if prices:
+            book.best_tick = book.tick_of(prices[0])
+            book.best_level_price = prices[0]
+    matching_engine.orders.update(zip(ids, orders))
+    order_owner.update(zip(ids, owners))
+    if -1 in owners:
+        for id, owner in zip(ids, owners):
+            if owner < 0:
+                del order_owner[id]
+    return offset
+
+
+def load_snapshot(path):
+    # a new Exchange in the state saved at path, and the journal position the snapshot covers.
+    # Every object the load makes stays alive, so the cyclic garbage collector is paused while it
+    # runs rather than rescanning a growing heap of them over and over.
+    with open(path, 'rb') as f:
+        data = f.read()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return read_snapshot(memoryview(data))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_snapshot(view):
+    magic, traders, symbols, next_order_id, journal_position = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise InvalidSnapshot("Not An Exchange Snapshot!")
+    offset = HEADER.size
+    exchange = Exchange()
+    exchange.balance, offset = read_numbers(view, offset)
+    if len(exchange.balance) != traders:
+        raise InvalidSnapshot("Snapshot Is Truncated Or Corrupt!")
+    counts, offset = read_column(view, offset)
+    ids, offset = read_column(view, offset)
+    start = 0
+    for trader_id, count in enumerate(counts):
+        if count:
+            exchange.open_orders[trader_id] = deque(ids[start:start + count])
+            start += count
+    position_traders, offset = read_column(view, offset)
+    position_symbols, offset = read_column(view, offset)
+    position_quantities, offset = read_numbers(view, offset)
+    router = exchange.router
+    router.order_ids = itertools.count(next_order_id)
+    for _ in range(symbols):
+        length, engine_order_id, sequence, update_sequence, *ladder = SYMBOL_HEADER.unpack_from(view, offset)
+        offset += SYMBOL_HEADER.size
+        symbol = bytes(view[offset:offset + length]).decode()
+        matching_engine = router.engines[router.add_symbol(symbol, *ladder_arguments(*ladder))]
+        offset += length
+        matching_engine.order_ids = itertools.count(engine_order_id)
+        matching_engine.sequence = itertools.count(sequence)
+        matching_engine.update_sequence = update_sequence
+        offset = read_side(view, offset, matching_engine, matching_engine.bids, exchange.order_owner)
+        offset = read_side(view, offset, matching_engine, matching_engine.asks, exchange.order_owner)
+    for trader_id, symbol, quantity in zip(position_traders, position_symbols, position_quantities):
+        exchange.position[trader_id][router.symbols[symbol]] = quantity
+    return exchange, journal_position
+
+
+def restore(path, journal_path=None):
+    # a warm restart: loads the snapshot at path, then replays the requests journaled after it
+    exchange, journal_position = load_snapshot(path)
+    if journal_path is not None:
+        replay(journal_path, exchange, start=journal_position)
+    return exchange
+
+
+if __name__ == "__main__":
+    # python snapshot.py PATH [journal path]
+    #     restores the exchange saved at PATH, replaying the journal after it if one is given
+    start = time.perf_counter()
+    exchange = restore(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print('restored ', sum(len(matching_engine.orders) for matching_engine in exchange.router.engines),
+          ' resting orders in ', time.perf_counter() - start, ' seconds')
+    print("Total Money Amount for All Traders: ", str(int(sum(exchange.balance))))
@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from trading_arena import Exchange, Trader, Runtime, OrderSide
+
+
+# A trade tape: every execution an Exchange makes, appended column by column to raw files in a
+# directory and read back as memory-mapped NumPy arrays, so queries over a whole session run as
+# vectorized passes without making a Python object per trade.
+#
+# Each column is a file of native byte order values, one per trade:
+#   sequence   int64    the engine's execution sequence number (per symbol)
+#   time       float64  time of the aggressing order
+#   symbol     int16    line number of the symbol in the symbols file
+#   price      float64
+#   quantity   int64
+#   side       int8     OrderSide value of the aggressing order
+#   aggressor  int64    id of the trader whose order took liquidity
+#   passive    int64    id of the trader whose resting order was filled
+# Trades are appended a buffer at a time; a crash can leave some columns a buffer longer than
+# others. The extra values are ignored when reading, and cut off when the tape is next opened for
+# appending so that every column carries on from the same trade.
+
+COLUMNS = (('sequence', 'q', np.int64), ('time', 'd', np.float64), ('symbol', 'h', np.int16),
+           ('price', 'd', np.float64), ('quantity', 'q', np.int64), ('side', 'b', np.int8),
+           ('aggressor', 'q', np.int64), ('passive', 'q', np.int64))
+SYMBOLS = 'symbols'
+
+
+class TradeTape():
+    # Appends trades to the tape in the directory at path, creating it if needed. Set it as
+    # Exchange.tape to record every execution the exchange makes; the queries see everything
+    # recorded so far.
+    def __init__(self, path, buffer_size=65536):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.buffer_size = buffer_size
+        self.files = [open(os.path.join(path, name), 'ab') for name, _, _ in COLUMNS]
+        stored = self.stored()
+        for name, _, dtype in COLUMNS:
+            os.truncate(os.path.join(path, name), stored * np.dtype(dtype).itemsize)
+        self.buffers = [array(typecode) for _, typecode, _ in COLUMNS]
+        (self.sequences, self.times, self.symbol_ids, self.prices, self.quantities, self.sides, self.aggressors,
+         self.passives) = self.buffers
+        self.symbols = {symbol: i for i, symbol in enumerate(self.read_symbols())}
+        # symbol -> its index in the symbols file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.stored() + len(self.sequences)
+
+    def record(self, sequence, trade_time, symbol, price, quantity, side, aggressor, passive):
+        symbol_id = self.symbols.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.add_symbol(symbol)
+        self.sequences.append(sequence)
+        self.times.append(trade_time)
+        self.symbol_ids.append(symbol_id)
+        self.prices.append(price)
+        self.quantities.append(quantity)
+        self.sides.append(side)
+        self.aggressors.append(aggressor)
+        self.passives.append(passive)
+        if len(self.sequences) >= self.buffer_size:
+            self.flush()
+
+    def add_symbol(self, symbol):
+        symbol_id = self.symbols[symbol] = len(self.symbols)
+        with open(os.path.join(self.path, SYMBOLS), 'a') as f:
+            f.write(symbol + '\n')
+        return symbol_id
+
+    def read_symbols(self):
+        try:
+            with open(os.path.join(self.path, SYMBOLS)) as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def flush(self):
+        for f, buffer in zip(self.files, self.buffers):
+            buffer.tofile(f)
+            del buffer[:]
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in self.files:
+            f.close()
+
+    def stored(self):
+        # the number of trades written out to every column
+        return min(os.path.getsize(os.path.join(self.path, name)) // np.dtype(dtype).itemsize
+                   for name, _, dtype in COLUMNS)
+
+    def columns(self):
+        # name -> read only array of every trade recorded so far, mapped from the files
+        self.flush()
+        length = self.stored()
+        if length == 0:
+            return {name: np.empty(0, dtype) for name, _, dtype in COLUMNS}
+        return {name: np.memmap(os.path.join(self.path, name), dtype, 'r', shape=(length,))
+                for name, _, dtype in COLUMNS}
+
+    def select(self, columns, start=None, end=None, symbol=None):
+        # the trades at times from start up to but not including end, in symbol if given, as a
+        # boolean mask over columns (or a slice of all of them when there is nothing to filter)
+        mask = slice(None)
+        if start is not None:
+            mask = columns['time'] >= start
+        if end is not None:
+            before = columns['time'] < end
+            mask = before if start is None else mask & before
+        if symbol is not None:
+            symbols = self.read_symbols()
+            symbol_id = symbols.index(symbol) if symbol in symbols else -1
+            same = columns['symbol'] == symbol_id
+            mask = same if start is None and end is None else mask & same
+        return mask
+
+    def volume(self, start=None, end=None, symbol=None):
+        columns = self.columns()
+        return int(columns['quantity'][self.select(columns, start, end, symbol)].sum())
+
+    def vwap(self, start=None, end=None, symbol=None):
+        # the volume weighted average price, or None if nothing traded
+        columns = self.columns()
+        mask = self.select(columns, start, end, symbol)
+        quantities = columns['quantity'][mask]
+        volume = quantities.sum()
+        if volume == 0:
+            return None
+        return float(np.dot(columns['price'][mask], quantities.astype(np.float64)) / volume)
+
+    def fills(self, trader, start=None, end=None, symbol=None):
+        # name -> array of the trades the trader was on either side of, with an extra 'bought'
+        # column that is True where the trader was the buyer
+        columns = self.columns()
+        mask = self.select(columns, start, end, symbol)
+        aggressing = columns['aggressor'] == trader
+        resting = columns['passive'] == trader
+        mine = aggressing | resting
+        mask = mine if isinstance(mask, slice) else mask & mine
+        trades = {name: np.asarray(column[mask]) for name, column in columns.items()}
+        trades['bought'] = (trades['side'] == OrderSide.BUY.value) == aggressing[mask]
+        return trades
+
+    def trader_volumes(self, start=None, end=None, symbol=None):
+        # the quantity each trader has traded, indexed by trader id, counting both sides of a trade
+        columns = self.columns()
+        mask = self.select(columns, start, end, symbol)
+        quantities = columns['quantity'][mask]
+        aggressors = columns['aggressor'][mask]
+        passives = columns['passive'][mask]
+        if len(quantities) == 0:
+            return np.zeros(0, np.int64)
+        traders = int(max(aggressors.max(), passives.max())) + 1
+        return (np.bincount(aggressors, quantities, traders) +
+                np.bincount(passives, quantities, traders)).astype(np.int64)
+
+
+if __name__ == "__main__":
+    # python tape.py record PATH [backend] [number of traders]
+    #     runs a session of the trading arena, recording every trade to the tape at PATH
+    # python tape.py summary PATH
+    #     the trades, volume and VWAP of every symbol on the tape at PATH
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'record':
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'thread'
+        traders = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+        exchange = Exchange(traders)
+        with TradeTape(path) as exchange.tape:
+            Runtime(exchange, [Trader(i) for i in range(traders)], backend).run(10)
+            print('recorded ', len(exchange.tape), ' trades')
+    elif command == 'summary':
+        start = time.perf_counter()
+        with TradeTape(path) as tape:
+            print('%-10s %12s %14s %14s' % ('symbol', 'trades', 'volume', 'vwap'))
+            columns = tape.columns()
+            for symbol in tape.read_symbols():
+                mask = tape.select(columns, symbol=symbol)
+                print('%-10s %12d %14d %14.4f' % (symbol, int(mask.sum()), tape.volume(symbol=symbol),
+                                                  tape.vwap(symbol=symbol)))
+        print('summarized in ', time.perf_counter() - start, ' seconds')
+    else:
+        raise ValueError("Command Must Be Either record or summary!")
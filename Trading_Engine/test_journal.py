@@ -0,0 +1,116 @@
+import os
+import random
+import tempfile
+import unittest
+
+from trading_arena import Exchange, LimitOrder, MarketOrder, IOCOrder, OrderSide, OrderType, ActionType
+from journal import RequestJournal, RECORD, read_journal, replay
+
+
+def random_requests(n, seed=0, traders=200):
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(n):
+        trader_id = rng.randrange(traders)
+        symbol = rng.choice(('S', 'T'))
+        action = rng.choice((1, 1, 1, 1, 2, 3, 4))
+        if action == ActionType.PLACE_ORDER.value:
+            side = OrderSide(rng.randint(1, 2))
+            order_type = rng.random()
+            if order_type < 0.1:
+                order = MarketOrder(None, symbol, rng.randint(1, 20), side, rng.random())
+            elif order_type < 0.2:
+                order = IOCOrder(None, symbol, rng.randint(1, 20), rng.randint(95, 105) + 0.5, side, rng.random())
+            else:
+                order = LimitOrder(None, symbol, rng.randint(1, 20), rng.randint(95, 105), side, rng.random())
+            requests.append((action, trader_id, order))
+        elif action == ActionType.AMEND_ORDER.value:
+            requests.append((action, trader_id, 1))
+        else:
+            requests.append((action, trader_id))
+    return requests
+
+
+def state(exchange):
+    # everything a replay has to reproduce
+    books = {}
+    for symbol in exchange.router.symbols:
+        matching_engine = exchange.router.engine(symbol)
+        books[symbol] = ([(order.id, order.price, order.quantity, order.time) for order in matching_engine.bids],
+                         [(order.id, order.price, order.quantity, order.time) for order in matching_engine.asks])
+    return (exchange.balance, [type(balance) for balance in exchange.balance],
+            {trader_id: position for trader_id, position in exchange.position.items() if position},
+            books, exchange.order_owner)
+
+
+class TestRequestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'journal')
+
+    def test_replay_reproduces_exchange(self):
+        exchange = Exchange()
+        with RequestJournal(self.path, buffer_size=64) as exchange.journal:
+            requests = random_requests(3000)
+            for request in requests[:1500]:
+                exchange.handle_request(request)
+            exchange.remove_trader(7)
+            exchange.add_trader(250)
+            for request in requests[1500:]:
+                exchange.handle_request(request)
+            self.assertEqual(len(exchange.journal), 3002)
+        self.assertEqual(os.path.getsize(self.path), 3002 * RECORD.size)
+        self.assertEqual(state(replay(self.path)), state(exchange))
+        self.assertEqual(len(replay(self.path).balance), 251)
+
+    def test_ladder_symbols(self):
+        exchange = Exchange()
+        with RequestJournal(self.path) as exchange.journal:
+            order = LimitOrder(None, 'S', 5, 100, OrderSide.BUY, 1.0)
+            exchange.handle_request((ActionType.PLACE_ORDER.value, 0, order))
+            exchange.add_symbol('T', 0.1, 0.1, 100.3)
+            exchange.add_symbol('U', 1, 10, 1000.0)
+            exchange.add_symbol('V')
+            for request in random_requests(2000, seed=2):
+                order = request[2] if request[0] == ActionType.PLACE_ORDER.value else None
+                if order is not None and order.type != OrderType.MARKET:
+                    # on both ladders
+                    order.price = 10 + round(order.price * 10 % 50) / 10
+                exchange.handle_request(request)
+        replayed = replay(self.path)
+        self.assertEqual(state(replayed), state(exchange))
+        self.assertEqual(replayed.router.symbols, ['S', 'T', 'U', 'V'])
+        for symbol, settings in (('T', (0.1, 0.1, 100.3)), ('U', (1, 10, 1000.0)), ('V', (None, None, None))):
+            matching_engine = replayed.router.engine(symbol)
+            self.assertEqual(matching_engine.tick_size, settings[0])
+            if settings[0] is not None:
+                book = matching_engine.bids
+                self.assertEqual((book.min_price, book.max_price), settings[1:])
+                self.assertEqual([type(value) for value in (book.tick_size, book.min_price, book.max_price)],
+                                 [type(value) for value in settings])
+
+    def test_torn_tail(self):
+        requests = random_requests(6, seed=1)
+        with RequestJournal(self.path) as journal:
+            for request in requests[:3]:
+                journal.append(request)
+        with open(self.path, 'ab') as f:
+            f.write(b'\1' * 20)
+        self.assertEqual(len(list(read_journal(self.path))), 3)
+
+        with RequestJournal(self.path) as journal:
+            self.assertEqual(len(journal), 3)
+            for request in requests[3:]:
+                journal.append(request)
+        records = list(read_journal(self.path))
+        self.assertEqual([(record[0], record[1]) for record in records],
+                         [(request[0], request[1]) for request in requests])
+
+        exchange = Exchange()
+        for request in random_requests(6, seed=1):
+            exchange.handle_request(request)
+        self.assertEqual(state(replay(self.path)), state(exchange))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from trading_arena import Exchange, Trader, Runtime
+from tape import TradeTape
+from ledger import AccountLedger, net_fills
+from population import TraderCohort
+
+
+class TestAccountLedger(unittest.TestCase):
+
+    def check_same_accounts(self, ledger, exchange):
+        self.assertEqual(ledger.balance.tolist(), exchange.balance)
+        for trader_id in range(len(exchange.balance)):
+            position = exchange.position.get(trader_id, {})
+            for symbol in ledger.symbols:
+                self.assertEqual(ledger.positions[trader_id, ledger.symbol_id(symbol)], -position.get(symbol, 0))
+
+    def test_apply_tape_matches_exchange(self):
+        # a session of Traders and a cohort, settled fill by fill and batch by batch by the exchange,
+        # and settled again from its tape by a fresh ledger
+        exchange = Exchange()
+        traders = [Trader(i) for i in range(20)]
+        with TradeTape(tempfile.mkdtemp()) as exchange.tape:
+            Runtime(exchange, traders, 'thread').run(10)
+            cohort = TraderCohort(exchange, 200, seed=0, price=100, price_sd=3, quantity_low=1, quantity_high=50,
+                                  order_types=(0.8, 0.1, 0.1), actions=(0.8, 0.05, 0.1, 0.05))
+            for _ in range(10):
+                cohort.step()
+            ledger = AccountLedger()
+            trades = ledger.apply_tape(exchange.tape)
+        self.assertEqual(trades, len(exchange.tape))
+        self.assertGreater(trades, 0)
+        self.check_same_accounts(ledger, exchange)
+        self.assertEqual(ledger.total_balance(), 1000000 * len(exchange.balance))
+        self.assertEqual(ledger.positions.sum(axis=0).tolist(), [0] * len(ledger.symbols))
+
+        copied = AccountLedger.from_exchange(exchange)
+        self.assertEqual(copied.balance.tolist(), ledger.balance.tolist())
+        self.assertEqual(copied.positions.tolist(), ledger.positions.tolist())
+
+    def test_net_fills(self):
+        traders, received, bought = net_fills([1, 2, 1], [2, 3, 3], [10.0, 11.0, 12.0], [5, 1, 2])
+        self.assertEqual(traders.tolist(), [1, 2, 3])
+        self.assertEqual(received.tolist(), [-74.0, 39.0, 35.0])
+        self.assertEqual(bought.tolist(), [7, -4, -3])
+
+    def test_queries(self):
+        ledger = AccountLedger(3, ('S', 'T'))
+        ledger.apply_fills([0, 1], [2, 2], [0, 1], [10.0, 20.0], [5, 2])
+        self.assertEqual(ledger.last_prices.tolist(), [10.0, 20.0])
+        self.assertEqual(ledger.equity().tolist(), [1000000.0] * 3)
+        self.assertEqual(ledger.equity([12.0, 20.0]).tolist(), [1000010.0, 1000000.0, 999990.0])
+        gross, net = ledger.exposure()
+        self.assertEqual((gross.tolist(), net.tolist()), ([100.0, 80.0], [0.0, 0.0]))
+        self.assertEqual(ledger.below(1000000, [12.0, 20.0]).tolist(), [2])
+        ledger.apply_fills([4], [0], [ledger.symbol_id('U')], [1.0], [1])
+        self.assertEqual(ledger.positions.shape, (5, 3))
+        self.assertTrue(np.isnan(AccountLedger(1, ('S',)).last_prices).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import pickle
+import unittest
+
+import trading_arena
+from trading_arena import Trader
+from montecarlo import Session, monte_carlo, aggregate
+
+PARAMETERS = {'traders': 8, 'steps': 6, 'cohort': {'size': 20, 'price_sd': 3, 'quantity_low': 1,
+                                                   'order_types': (0.8, 0.1, 0.1)}}
+
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def test_worker_count_does_not_matter(self):
+        serial = list(monte_carlo(4, workers=1, seed=7, parameters=PARAMETERS))
+        pooled = list(monte_carlo(4, workers=2, seed=7, parameters=PARAMETERS))
+        self.assertEqual(sorted(pooled, key=lambda result: result[0]), serial)
+        self.assertEqual(aggregate(pooled), aggregate(serial))
+        self.assertGreater(aggregate(serial)['trades'][1], 0)
+        self.assertEqual(aggregate(serial)['balance_total'][3], 1000000 * 28)
+
+    def test_seeds(self):
+        self.assertEqual(Session(1, **PARAMETERS).run(), Session(1, **PARAMETERS).run())
+        self.assertNotEqual(Session(1, **PARAMETERS).run(), Session(2, **PARAMETERS).run())
+
+    def test_sessions_share_nothing(self):
+        shared = (len(trading_arena.exchange_to_trader), trading_arena.trader_to_exchange.qsize(),
+                  len(trading_arena.MyThread.list_of_threads))
+        for seed in range(3):
+            Session(seed, **PARAMETERS).run()
+        self.assertEqual((len(trading_arena.exchange_to_trader), trading_arena.trader_to_exchange.qsize(),
+                          len(trading_arena.MyThread.list_of_threads)), shared)
+
+    def test_cohort_only(self):
+        session = Session(1, traders=0, steps=4, cohort={'size': 30, 'price_sd': 3, 'quantity_low': 1})
+        summary = session.run()
+        self.assertEqual(session.simulation.cohorts[0].first_id, 0)
+        self.assertEqual(len(session.exchange.balance), 30)
+        self.assertGreater(summary['trades'], 0)
+
+    def test_trader_random_pickles(self):
+        # a trader's random draws go with it to another process
+        trader = Trader(0)
+        trader.random.seed(3)
+        copy = pickle.loads(pickle.dumps(trader.random))
+        self.assertEqual([copy.randint(1, 2) for _ in range(20)], [trader.random.randint(1, 2) for _ in range(20)])
+
+
+if __name__ == "__main__":
+    unittest.main()
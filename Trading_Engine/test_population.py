@@ -0,0 +1,94 @@
+import os
+import queue
+import tempfile
+import unittest
+from collections import defaultdict
+
+import numpy as np
+
+from trading_arena import (Exchange, FilledOrder, RejectedOrder, LimitOrder, MarketOrder, IOCOrder, OrderSide,
+                           OrderType, ActionType)
+from journal import RequestJournal, replay
+from population import TraderCohort
+
+ORDER_CLASSES = {OrderType.LIMIT.value: LimitOrder, OrderType.MARKET.value: MarketOrder,
+                 OrderType.IOC.value: IOCOrder}
+
+
+def make_cohort(exchange, seed=0):
+    return TraderCohort(exchange, 300, seed=seed, price_sd=4, quantity_low=1, quantity_high=40,
+                        order_types=(0.8, 0.1, 0.1), actions=(0.7, 0.1, 0.1, 0.1))
+
+
+def place_one_by_one(exchange, actions):
+    # the same step as single requests, one order object each
+    batch, trader_ids, requests = actions
+    _, sides, types, prices, quantities = batch.columns()
+    for trader_id, side, order_type, price, quantity in zip(trader_ids.tolist(), sides, types, prices, quantities):
+        if order_type == OrderType.MARKET.value:
+            order = MarketOrder(None, batch.symbol, quantity, OrderSide(side), batch.time)
+        else:
+            order = ORDER_CLASSES[order_type](None, batch.symbol, quantity, price, OrderSide(side), batch.time)
+        exchange.handle_request((ActionType.PLACE_ORDER.value, trader_id, order))
+    for request in requests:
+        exchange.handle_request(request)
+
+
+def ack(response):
+    action, result = response
+    if isinstance(result, FilledOrder):
+        return action, result.id, result.quantity, result.price, result.side, result.time
+    if isinstance(result, RejectedOrder):
+        return action, result.id, result.quantity, result.side, result.reason
+    return response
+
+
+def state(exchange):
+    matching_engine = exchange.router.engine('AAPL')
+    return (exchange.balance, {trader_id: position for trader_id, position in exchange.position.items() if position},
+            [(order.id, order.price, order.quantity, order.side) for order in
+             matching_engine.bid_book + matching_engine.ask_book],
+            exchange.order_owner)
+
+
+class TestTraderCohort(unittest.TestCase):
+
+    def test_batch_same_as_one_by_one(self):
+        batched, single = Exchange(), Exchange()
+        batched.mailboxes = defaultdict(queue.SimpleQueue)
+        single.mailboxes = defaultdict(queue.SimpleQueue)
+        cohort, drawer = make_cohort(batched), make_cohort(single)
+        cohort.clock = drawer.clock = lambda: 1.0
+        for _ in range(15):
+            cohort.submit(cohort.generate())
+            place_one_by_one(single, drawer.generate())
+        self.assertEqual(state(batched), state(single))
+        self.assertEqual(sum(batched.balance), 1000000 * 300)
+        # every trader was sent the same fills
+        for trader_id in single.mailboxes:
+            sent = single.mailboxes[trader_id]
+            received = batched.mailboxes[trader_id]
+            while not sent.empty():
+                self.assertEqual(ack(received.get_nowait()), ack(sent.get_nowait()))
+            self.assertTrue(received.empty())
+
+    def test_journaled_batches_replay(self):
+        path = os.path.join(tempfile.mkdtemp(), 'journal')
+        exchange = Exchange()
+        with RequestJournal(path, buffer_size=100) as exchange.journal:
+            cohort = make_cohort(exchange, seed=3)
+            for _ in range(15):
+                cohort.step()
+        self.assertEqual(state(replay(path)), state(exchange))
+
+    def test_participation(self):
+        exchange = Exchange()
+        cohort = TraderCohort(exchange, 1000, first_id=50, seed=1, participation=0.25)
+        trader_ids = cohort.active()
+        self.assertTrue(np.all((trader_ids >= 50) & (trader_ids < 1050)))
+        self.assertLess(abs(len(trader_ids) - 250), 60)
+        self.assertEqual(len(exchange.balance), 1050)
+
+
+if __name__ == "__main__":
+    unittest.main()
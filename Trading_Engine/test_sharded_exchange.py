@@ -0,0 +1,109 @@
+import queue
+import random
+import unittest
+from collections import defaultdict
+
+from trading_arena import Exchange, LimitOrder, MarketOrder, FilledOrder, RejectedOrder, OrderSide, ActionType
+from sharded_exchange import ShardedExchange, ShardFailed
+
+
+def random_requests(n, seed=0, traders=300, symbols=6):
+    # requests from traders who each trade one symbol, so amends and cancels find the same order
+    # in a shard as in a single Exchange
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(n):
+        trader_id = rng.randrange(traders)
+        symbol = 'SYM%d' % (trader_id % symbols)
+        action = rng.choice((1, 1, 1, 1, 2, 3, 4))
+        if action == ActionType.PLACE_ORDER.value:
+            side = OrderSide(rng.randint(1, 2))
+            if rng.random() < 0.1:
+                order = MarketOrder(None, symbol, rng.randint(1, 20), side, 0.0)
+            else:
+                order = LimitOrder(None, symbol, rng.randint(1, 20), rng.randint(95, 105), side, 0.0)
+            requests.append((action, trader_id, order))
+        elif action == ActionType.AMEND_ORDER.value:
+            requests.append((action, trader_id, 1))
+        else:
+            requests.append((action, trader_id))
+    return requests
+
+
+def ack(response):
+    # what an ack says, leaving out the order ids, which each shard hands out on its own
+    action, result = response
+    if isinstance(result, FilledOrder):
+        return action, result.quantity, result.price, result.side
+    if isinstance(result, RejectedOrder):
+        return action, result.quantity, result.side, result.reason
+    if action == ActionType.RETURN_POSITION.value:
+        return action, result[0], dict(result[1])
+    return action, result
+
+
+def split(acks):
+    # a trader's balance answers and the rest of its acks: the sharded exchange only sends a balance
+    # answer once every shard has given its part, so it can come later than the other acks
+    return ([item for item in acks if item[0] == ActionType.RETURN_POSITION.value],
+            [item for item in acks if item[0] != ActionType.RETURN_POSITION.value])
+
+
+class TestShardedExchange(unittest.TestCase):
+
+    def run_sharded(self, requests, shards=2):
+        mailboxes = defaultdict(queue.SimpleQueue)
+        sharded = ShardedExchange(shards, chunk_size=7, mailboxes=mailboxes)
+        sharded.start()
+        for request in requests:
+            sharded.submit(request)
+            sharded.collect()
+        sharded.stop()
+        acks = {}
+        for trader_id, mailbox in mailboxes.items():
+            acks[trader_id] = []
+            while not mailbox.empty():
+                acks[trader_id].append(ack(mailbox.get_nowait()))
+        return acks
+
+    def test_same_as_single_exchange(self):
+        requests = random_requests(3000)
+        exchange = Exchange()
+        mailboxes = exchange.mailboxes = defaultdict(queue.SimpleQueue)
+        expected = defaultdict(list)
+        # the same requests again, since handling an order changes it
+        for request in random_requests(3000):
+            exchange.handle_request(request)
+        for trader_id, mailbox in mailboxes.items():
+            while not mailbox.empty():
+                expected[trader_id].append(ack(mailbox.get_nowait()))
+
+        acks = self.run_sharded(requests)
+        self.assertEqual(set(acks), set(expected))
+        for trader_id in expected:
+            self.assertEqual(split(acks[trader_id]), split(expected[trader_id]))
+
+    def test_overlapping_balance_queries(self):
+        query = (ActionType.RETURN_POSITION.value, 0)
+        requests = [(ActionType.PLACE_ORDER.value, 1, LimitOrder(None, 'S', 10, 100, OrderSide.SELL, 0.0)),
+                    (ActionType.PLACE_ORDER.value, 1, LimitOrder(None, 'T', 10, 7, OrderSide.SELL, 0.0)),
+                    (ActionType.PLACE_ORDER.value, 0, LimitOrder(None, 'S', 10, 100, OrderSide.BUY, 0.0)),
+                    (ActionType.PLACE_ORDER.value, 0, LimitOrder(None, 'T', 1, 7, OrderSide.BUY, 0.0)),
+                    query, query, query]
+        answers, _ = split(self.run_sharded(requests)[0])
+        self.assertEqual(answers, [(ActionType.RETURN_POSITION.value, 998993, {'S': -10, 'T': -1})] * 3)
+
+    def test_shard_failure(self):
+        sharded = ShardedExchange(2, chunk_size=1, mailboxes=defaultdict(queue.SimpleQueue))
+        sharded.start()
+        # an order that was never validated, with no side, fails in its shard
+        sharded.submit((ActionType.PLACE_ORDER.value, 0, LimitOrder.unchecked(None, 'S', 5, None, 0.0, 100)))
+        with self.assertRaises(ShardFailed):
+            sharded.stop()
+        for worker in sharded.workers:
+            worker.join()
+            self.assertFalse(worker.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import random
+import tempfile
+import unittest
+
+from trading_arena import Exchange, LimitOrder, MarketOrder, IOCOrder, OrderSide, ActionType
+from journal import RequestJournal
+from snapshot import save_snapshot, load_snapshot, restore, InvalidSnapshot
+
+
+def drive(exchange, n, rng):
+    for _ in range(n):
+        trader_id = rng.randrange(20)
+        symbol = rng.choice(('AAPL', 'GOOG', 'MSFT'))
+        action = rng.choice((1, 1, 1, 1, 2, 3, 4))
+        if action == ActionType.PLACE_ORDER.value:
+            side = OrderSide(rng.randint(1, 2))
+            order_type = rng.random()
+            if order_type < 0.1:
+                order = MarketOrder(None, symbol, rng.randint(1, 50), side, rng.random())
+            elif order_type < 0.2:
+                order = IOCOrder(None, symbol, rng.randint(1, 50), rng.randint(95, 105), side, rng.random())
+            else:
+                # half-tick prices make some balances floats, which have to come back as floats
+                price = rng.randint(95, 105) + rng.choice((0, 0.5))
+                order = LimitOrder(None, symbol, rng.randint(1, 50), price, side, rng.random())
+            exchange.handle_request((action, trader_id, order))
+        elif action == ActionType.AMEND_ORDER.value:
+            exchange.handle_request((action, trader_id, rng.randint(1, 60)))
+        else:
+            exchange.handle_request((action, trader_id))
+
+
+def state(exchange):
+    books = []
+    for matching_engine in exchange.router.engines:
+        books.append((matching_engine.symbol,
+                      [(order.id, order.price, type(order.price), order.quantity, order.side, type(order), order.time)
+                       for order in matching_engine.bid_book + matching_engine.ask_book],
+                      sorted(matching_engine.orders)))
+    open_orders = {trader_id: [id for id in ids if exchange.router.resting_order(id) is not None]
+                   for trader_id, ids in exchange.open_orders.items()}
+    return (exchange.balance, [type(balance) for balance in exchange.balance],
+            {trader_id: position for trader_id, position in exchange.position.items() if position},
+            books, exchange.router.symbols, exchange.order_owner,
+            {trader_id: ids for trader_id, ids in open_orders.items() if ids})
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, 'snapshot')
+        self.journal_path = os.path.join(directory, 'journal')
+
+    def test_round_trip(self):
+        exchange = Exchange()
+        drive(exchange, 4000, random.Random(0))
+        self.assertEqual(save_snapshot(exchange, self.path), 0)
+        loaded, journal_position = load_snapshot(self.path)
+        self.assertEqual(journal_position, 0)
+        self.assertEqual(state(loaded), state(exchange))
+
+        # both hand out the same order ids and execution sequence numbers from here on
+        drive(exchange, 2000, random.Random(1))
+        drive(loaded, 2000, random.Random(1))
+        self.assertEqual(state(loaded), state(exchange))
+
+    def test_sparse_accounts(self):
+        exchange = Exchange()
+        exchange.add_trader(300000)
+        drive(exchange, 500, random.Random(5))
+        save_snapshot(exchange, self.path)
+        loaded, _ = load_snapshot(self.path)
+        self.assertEqual(state(loaded), state(exchange))
+        self.assertEqual(len(loaded.balance), 300001)
+        self.assertEqual(loaded.mailboxes, {})
+        self.assertLessEqual(len(loaded.position), 20)
+
+    def test_snapshot_and_journal_tail(self):
+        exchange = Exchange()
+        with RequestJournal(self.journal_path, buffer_size=100) as exchange.journal:
+            rng = random.Random(2)
+            drive(exchange, 3000, rng)
+            self.assertEqual(save_snapshot(exchange, self.path), 3000)
+            exchange.add_trader(40)
+            drive(exchange, 2000, rng)
+        self.assertEqual(state(restore(self.path, self.journal_path)), state(exchange))
+
+    def test_price_ladder(self):
+        exchange = Exchange()
+        exchange.add_symbol('AAPL', 0.5, 90, 110)
+        exchange.add_symbol('GOOG', 0.5, 1.0, 1000)
+        drive(exchange, 3000, random.Random(3))
+        save_snapshot(exchange, self.path)
+        loaded, _ = load_snapshot(self.path)
+        self.assertEqual(state(loaded), state(exchange))
+        for symbol, settings in (('AAPL', (0.5, 90, 110)), ('GOOG', (0.5, 1.0, 1000)), ('MSFT', (None, None, None))):
+            for book in (loaded.router.engine(symbol).bids, loaded.router.engine(symbol).asks):
+                self.assertEqual(loaded.router.engine(symbol).tick_size, settings[0])
+                self.assertEqual((getattr(book, 'min_price', None), getattr(book, 'max_price', None)), settings[1:])
+                self.assertEqual([type(value) for value in settings], [type(value) for value in (
+                    loaded.router.engine(symbol).tick_size, getattr(book, 'min_price', None),
+                    getattr(book, 'max_price', None))])
+        for symbol in ('AAPL', 'GOOG'):
+            for side in ('bids', 'asks'):
+                book = getattr(loaded.router.engine(symbol), side)
+                original = getattr(exchange.router.engine(symbol), side)
+                self.assertEqual((book.best_tick, book.best_level_price, book.bitmaps),
+                                 (original.best_tick, original.best_level_price, original.bitmaps))
+
+        drive(exchange, 2000, random.Random(4))
+        drive(loaded, 2000, random.Random(4))
+        self.assertEqual(state(loaded), state(exchange))
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(InvalidSnapshot):
+            load_snapshot(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
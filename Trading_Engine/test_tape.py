@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from trading_arena import OrderSide
+from tape import TradeTape, COLUMNS
+
+
+TRADES = [(0, 1.0, 'S', 100.0, 10, OrderSide.BUY.value, 1, 2),
+          (1, 2.0, 'T', 7.5, 4, OrderSide.SELL.value, 3, 1),
+          (2, 3.0, 'S', 101.0, 30, OrderSide.SELL.value, 2, 4),
+          (0, 4.0, 'T', 8.0, 6, OrderSide.BUY.value, 4, 3)]
+
+
+class TestTradeTape(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def test_queries(self):
+        with TradeTape(self.path, buffer_size=3) as tape:
+            for trade in TRADES:
+                tape.record(*trade)
+            self.assertEqual(len(tape), 4)
+            self.assertEqual(tape.read_symbols(), ['S', 'T'])
+            self.assertEqual(tape.volume(), 50)
+            self.assertEqual(tape.volume(symbol='S'), 40)
+            self.assertEqual(tape.volume(start=2.0, end=4.0), 34)
+            self.assertEqual(tape.volume(symbol='U'), 0)
+            self.assertAlmostEqual(tape.vwap(symbol='S'), (100.0 * 10 + 101.0 * 30) / 40)
+            self.assertIsNone(tape.vwap(start=5.0))
+            fills = tape.fills(1)
+            self.assertEqual(list(fills['quantity']), [10, 4])
+            self.assertEqual(list(fills['bought']), [True, True])
+            self.assertEqual(list(tape.trader_volumes()), [0, 14, 40, 10, 36])
+
+    def test_reopen_after_torn_columns(self):
+        with TradeTape(self.path) as tape:
+            for trade in TRADES[:2]:
+                tape.record(*trade)
+        # a crash part way through a flush: some columns got a value more than others
+        for name, typecode, dtype in COLUMNS[:3]:
+            with open(os.path.join(self.path, name), 'ab') as f:
+                f.write(bytes(np.dtype(dtype).itemsize))
+        with TradeTape(self.path) as tape:
+            self.assertEqual(len(tape), 2)
+            for trade in TRADES[2:]:
+                tape.record(*trade)
+        with TradeTape(self.path) as tape:
+            columns = tape.columns()
+            self.assertEqual(len(tape), 4)
+            self.assertEqual(list(columns['sequence']), [0, 1, 2, 0])
+            self.assertEqual(list(columns['time']), [1.0, 2.0, 3.0, 4.0])
+            self.assertEqual(list(columns['passive']), [2, 1, 4, 3])
+            for name, _, dtype in COLUMNS:
+                self.assertEqual(os.path.getsize(os.path.join(self.path, name)), 4 * np.dtype(dtype).itemsize)
+
+
+if __name__ == "__main__":
+    unittest.main()
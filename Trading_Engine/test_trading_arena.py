@@ -0,0 +1,236 @@
+import os
+import queue
+import random
+import tempfile
+import unittest
+from collections import defaultdict
+
+import trading_arena
+from trading_arena import (Exchange, Trader, Runtime, Simulation, LatencyHistogram, LimitOrder, MarketOrder, OrderSide,
+                           OrderType, ActionType, FilledOrder, RejectedOrder, OrderBatch)
+from population import TraderCohort
+from journal import RequestJournal
+
+
+def place(trader_id, quantity, price, side, symbol="S"):
+    return ActionType.PLACE_ORDER.value, trader_id, LimitOrder(None, symbol, quantity, price, side, 0.0)
+
+
+class TestTraderRegistry(unittest.TestCase):
+
+    def test_accounts_open_on_demand(self):
+        exchange = Exchange()
+        exchange.handle_request(place(150, 10, 100, OrderSide.SELL))
+        exchange.handle_request(place(3, 4, 100, OrderSide.BUY))
+        self.assertEqual(len(exchange.balance), 151)
+        self.assertEqual(exchange.balance[150], 1000400)
+        self.assertEqual(exchange.balance[3], 999600)
+        self.assertEqual(exchange.balance[7], 1000000)
+        self.assertEqual(exchange.position[150], {"S": 4})
+        self.assertEqual(exchange.position[3], {"S": -4})
+        # only the traders that traded or placed orders have positions and open orders
+        self.assertEqual(set(exchange.position), {3, 150})
+        self.assertEqual(set(exchange.open_orders), {150})
+
+        exchange.handle_request((ActionType.RETURN_POSITION.value, 7))
+        self.assertNotIn(7, exchange.position)
+
+    def test_add_and_remove_trader(self):
+        exchange = Exchange()
+        mailbox = queue.SimpleQueue()
+        self.assertEqual(exchange.add_trader(mailbox=mailbox), 0)
+        self.assertEqual(exchange.add_trader(), 1)
+        exchange.add_trader(1000000)
+        self.assertEqual(len(exchange.balance), 1000001)
+        self.assertEqual((len(exchange.position), len(exchange.open_orders), len(exchange.mailboxes)), (0, 0, 1))
+
+        exchange.handle_request(place(0, 5, 100, OrderSide.BUY))
+        exchange.handle_request(place(0, 5, 99, OrderSide.BUY))
+        self.assertEqual(len(exchange.router.engine("S").bid_book), 2)
+        exchange.remove_trader(0)
+        self.assertEqual(len(exchange.router.engine("S").bid_book), 0)
+        self.assertEqual(exchange.order_owner, {})
+        self.assertNotIn(0, exchange.mailboxes)
+        self.assertEqual(exchange.balance[0], 1000000)
+
+        # acks for a trader that has left are dropped
+        exchange.handle_request((ActionType.CANCEL_ORDER.value, 0))
+        self.assertTrue(mailbox.empty())
+
+    def test_no_mailboxes_until_a_runtime_attaches_them(self):
+        shared = len(trading_arena.exchange_to_trader)
+        exchange = Exchange(500)
+        traders = [Trader(i) for i in range(500)]
+        self.assertEqual(len(exchange.balance), 500)
+        self.assertEqual(exchange.mailboxes, {})
+        self.assertTrue(all(trader.mailbox is None for trader in traders))
+        self.assertEqual(len(trading_arena.exchange_to_trader), shared)
+
+        Runtime(exchange, traders[:3], 'thread').connect(queue.Queue(), queue.SimpleQueue)
+        self.assertEqual(set(exchange.mailboxes), {0, 1, 2})
+        self.assertIs(exchange.mailboxes[1], traders[1].mailbox)
+        self.assertIsNone(traders[3].mailbox)
+
+
+class TestTickLadder(unittest.TestCase):
+
+    def test_fractional_tick_size(self):
+        exchange = Exchange()
+        exchange.add_symbol("T", 0.1, 0.1, 100)
+        exchange.handle_request(place(0, 2, 0.3, OrderSide.SELL, "T"))
+        self.assertEqual(exchange.router.engine("T").depth(1), ([], [(0.3, 2)]))
+        exchange.handle_request(place(1, 2, 0.3, OrderSide.BUY, "T"))
+        self.assertEqual(exchange.balance, [1000000.6, 999999.4])
+        self.assertEqual(exchange.position, {0: {"T": 2}, 1: {"T": -2}})
+
+    def test_off_ladder_orders_are_rejected(self):
+        exchange = Exchange()
+        mailboxes = exchange.mailboxes = defaultdict(queue.SimpleQueue)
+        exchange.add_symbol("T", 0.5, 1, 100)
+        path = os.path.join(tempfile.mkdtemp(), 'journal')
+        with RequestJournal(path) as exchange.journal:
+            for price in (10.25, 100.5):
+                exchange.handle_request(place(4, 2, price, OrderSide.SELL, "T"))
+                action, rejected = mailboxes[4].get_nowait()
+                self.assertEqual(action, ActionType.PLACE_ORDER.value)
+                self.assertIsInstance(rejected, RejectedOrder)
+                self.assertEqual((rejected.id, rejected.quantity, rejected.type), (None, 2, OrderType.LIMIT))
+            self.assertEqual(len(exchange.journal), 0)
+            self.assertEqual(len(exchange.balance), 0)
+
+            buy, limit = OrderSide.BUY.value, OrderType.LIMIT.value
+            batch = OrderBatch(None, [buy, buy], [limit, limit], [10, 10.2], [1, 1], "T", 1.0)
+            self.assertEqual(len(exchange.place_orders(batch, [5, 6]).sequence), 0)
+            self.assertIsNone(batch.id)
+            for trader_id in (5, 6):
+                self.assertIsInstance(mailboxes[trader_id].get_nowait()[1], RejectedOrder)
+            self.assertEqual(len(exchange.journal), 0)
+
+            # the rejects used no ids, so the first order accepted gets the first one
+            exchange.handle_request(place(4, 2, 10.5, OrderSide.SELL, "T"))
+            self.assertEqual(len(exchange.journal), 1)
+        first_id = exchange.router.symbol_id("T") << trading_arena.SEQUENCE_BITS | 1
+        self.assertEqual(list(exchange.open_orders[4]), [first_id])
+
+
+class TestRejects(unittest.TestCase):
+
+    def test_market_order_without_liquidity(self):
+        exchange = Exchange()
+        mailbox = queue.SimpleQueue()
+        exchange.add_trader(0, mailbox)
+        exchange.handle_request((ActionType.PLACE_ORDER.value, 0, MarketOrder(None, "S", 7, OrderSide.BUY, 1.0)))
+        action, rejected = mailbox.get_nowait()
+        self.assertEqual(action, ActionType.PLACE_ORDER.value)
+        self.assertIsInstance(rejected, RejectedOrder)
+        self.assertEqual((rejected.quantity, rejected.side, rejected.type), (7, OrderSide.BUY, OrderType.MARKET))
+        self.assertEqual(len(exchange.router.engine("S").bid_book), 0)
+
+        trader = Trader(0)
+        trader.process_response((action, rejected))
+        self.assertEqual((trader.balance_track, trader.book_position), (1000000, 0))
+
+        # a partly filled market order rests, so it gets no reject
+        exchange.handle_request(place(1, 3, 100, OrderSide.SELL))
+        exchange.handle_request((ActionType.PLACE_ORDER.value, 0, MarketOrder(None, "S", 7, OrderSide.BUY, 2.0)))
+        self.assertIsInstance(mailbox.get_nowait()[1], FilledOrder)
+        self.assertTrue(mailbox.empty())
+
+    def test_market_orders_in_batch(self):
+        exchange = Exchange()
+        mailboxes = exchange.mailboxes = defaultdict(queue.SimpleQueue)
+        exchange.handle_request(place(9, 3, 100, OrderSide.SELL))
+        market, limit = OrderType.MARKET.value, OrderType.LIMIT.value
+        buy, sell = OrderSide.BUY.value, OrderSide.SELL.value
+        batch = OrderBatch(None, [sell, buy, buy], [market, market, limit], [0, 0, 99], [5, 3, 2], "S", 1.0)
+        exchange.place_orders(batch, [1, 2, 3])
+        rejected = mailboxes[1].get_nowait()[1]
+        self.assertIsInstance(rejected, RejectedOrder)
+        self.assertEqual((rejected.id, rejected.quantity, rejected.side), (batch.id[0], 5, OrderSide.SELL))
+        self.assertTrue(mailboxes[1].empty())
+        self.assertIsInstance(mailboxes[2].get_nowait()[1], FilledOrder)
+        self.assertTrue(mailboxes[2].empty())
+        self.assertTrue(mailboxes[3].empty())
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_bucket_bounds(self):
+        # every value lands in a bucket whose upper bound is at most 1/16th above it
+        for value in list(range(1000)) + [random.Random(0).randrange(1 << 62) for _ in range(1000)]:
+            histogram = LatencyHistogram()
+            histogram.record(value)
+            index = next(index for index, count in enumerate(histogram.counts) if count)
+            self.assertLessEqual(value, LatencyHistogram.upper_bound(index))
+            self.assertLessEqual(LatencyHistogram.upper_bound(index), value + value // 16)
+            if index:
+                self.assertLess(LatencyHistogram.upper_bound(index - 1), value)
+
+    def test_percentiles(self):
+        rng = random.Random(1)
+        values = [int(rng.lognormvariate(8, 1.5)) for _ in range(20000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        self.assertEqual(histogram.count, len(values))
+        self.assertEqual(histogram.max, values[-1])
+        for fraction in (0.001, 0.5, 0.9, 0.99, 0.999, 1.0):
+            exact = values[max(1, int(-(-len(values) * fraction // 1))) - 1]
+            with self.subTest(fraction=fraction):
+                self.assertGreaterEqual(histogram.percentile(fraction), exact)
+                self.assertLessEqual(histogram.percentile(fraction), exact + exact // 16)
+        self.assertEqual(histogram.percentile(1.0), values[-1])
+        self.assertEqual(LatencyHistogram().percentile(0.99), 0)
+
+
+class TestRuntime(unittest.TestCase):
+
+    def check_session(self, exchange, traders):
+        # cash only moves between traders, and every trader saw the same fills the exchange settled
+        self.assertEqual(sum(exchange.balance), 1000000 * len(traders))
+        self.assertEqual(sum(position.get("AAPL", 0) for position in exchange.position.values()), 0)
+        for trader in traders:
+            self.assertEqual(trader.balance_track, exchange.balance[trader.id])
+            self.assertEqual(trader.book_position, -exchange.position.get(trader.id, {}).get("AAPL", 0))
+
+    def test_backends_conserve_cash(self):
+        for backend in Runtime.BACKENDS:
+            with self.subTest(backend=backend):
+                exchange = Exchange()
+                traders = [Trader(i) for i in range(8)]
+                Runtime(exchange, traders, backend, queue_size=4).run(20)
+                self.assertTrue(any(trader.book_position for trader in traders))
+                self.check_session(exchange, traders)
+
+
+class TestSimulation(unittest.TestCase):
+
+    def run_simulation(self, seed, until=None):
+        exchange = Exchange()
+        traders = [Trader(i) for i in range(10)]
+        for trader in traders:
+            trader.random = random.Random(seed * 100 + trader.id)
+        cohort = TraderCohort(exchange, 50, first_id=10, seed=seed, price_sd=2, quantity_low=1,
+                              actions=(0.7, 0.1, 0.1, 0.1))
+        simulation = Simulation(exchange, traders, interval=0.5, seed=seed, cohorts=[cohort])
+        end = simulation.run(30, until)
+        fills = [(trader.balance_track, trader.book_position) for trader in traders]
+        books = [(order.id, order.price, order.quantity, order.time) for order in
+                 exchange.router.engine("AAPL").bid_book + exchange.router.engine("AAPL").ask_book]
+        return end, simulation.handled, exchange.balance, dict(exchange.position), fills, books
+
+    def test_same_seed_same_session(self):
+        first = self.run_simulation(1)
+        self.assertEqual(self.run_simulation(1), first)
+        self.assertNotEqual(self.run_simulation(2), first)
+        self.assertEqual(sum(first[2]), 1000000 * 60)
+
+    def test_until(self):
+        end, handled = self.run_simulation(1, until=5.0)[:2]
+        self.assertLessEqual(end, 5.0)
+        self.assertLess(handled, self.run_simulation(1)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,19 @@
-from collections import deque
+from collections import defaultdict, deque, OrderedDict
 import time
 import random
+from array import array
 from abc import ABC
-from enum import Enum
+from enum import Enum, IntEnum
+from decimal import Decimal
+import struct
 import threading
+import bisect
+import itertools
+import sys
+import queue
+import asyncio
+import multiprocessing
+import heapq
 
 
 class OrderType(Enum):
@@ -16,6 +26,13 @@ class OrderSide(Enum):
     BUY = 1
     SELL = 2
 
+
+class BookUpdateType(Enum):
+    LEVEL_ADDED = 1
+    LEVEL_CHANGED = 2
+    LEVEL_REMOVED = 3
+    TRADE = 4
+
 class ActionType(Enum):
     PLACE_ORDER = 1
     AMEND_ORDER = 2
@@ -55,7 +72,61 @@ class UndefinedResponse(Exception):
     pass
 
 
+class DuplicateOrderId(Exception):
+    pass
+
+
+class SequenceGap(Exception):
+    pass
+
+
+class PriceNotOnTick(Exception):
+    pass
+
+
+class PriceOutOfBand(Exception):
+    pass
+
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+
+class LogEvent(IntEnum):
+    # what the trader, order, quantity and value fields of each event hold (unused ones are 0)
+    THREAD_WAITED = 1       # trader: the thread's id, -1 for the exchange
+    ORDER_HANDLED = 2       # order, quantity: left unfilled, value: price
+    FILL_SENT = 3           # trader: the one notified, order, quantity, value: price
+    TRADER_STEP = 4         # trader, quantity: steps taken by all traders so far
+    ACK_RECEIVED = 5        # trader, quantity: the ActionType value of the ack
+    POSITION_RECEIVED = 6   # trader, quantity: position in the trader's symbol, value: balance
+
+
+ORDER_SIDES = frozenset((OrderSide.BUY, OrderSide.SELL))
+TICK_TOLERANCE = 1e-9
+# how far, in ticks, a float price may be from a multiple of the tick size and still count as on it
+
+
+def off_tick(price, tick_size):
+    ticks = price / tick_size
+    return abs(ticks - round(ticks)) > TICK_TOLERANCE
+
+
+def tick_digits(tick_size):
+    # the decimal places of a float tick size as written (1 for 0.1, 2 for 0.05), or None for an int
+    if type(tick_size) is int:
+        return None
+    return max(0, -Decimal(repr(tick_size)).normalize().as_tuple().exponent)
+
+
+# Orders use __slots__ rather than a per-instance __dict__, which keeps a resting order to a few
+# machine words. The order type is a class attribute since it never changes for a given class.
 class Order(ABC):
+    __slots__ = ('id', 'symbol', 'quantity', 'side', 'time')
+
     def __init__(self, id, symbol, quantity, side, time):
         self.id = id
         self.symbol = symbol
@@ -63,63 +134,350 @@ class Order(ABC):
             self.quantity = quantity
         else:
             raise NonPositiveQuantity("Quantity Must Be Positive!")
-        if side in [OrderSide.BUY, OrderSide.SELL]:
+        if side in ORDER_SIDES:
             self.side = side
         else:
             raise InvalidSide("Side Must Be Either \"Buy\" or \"OrderSide.SELL\"!")
         self.time = time
 
+    @classmethod
+    def unchecked(cls, id, symbol, quantity, side, time, price=None):
+        # builds an order from fields that were already validated in bulk (see OrderBatch),
+        # skipping the checks in __init__
+        order = cls.__new__(cls)
+        order.id = id
+        order.symbol = symbol
+        order.quantity = quantity
+        order.side = side
+        order.time = time
+        if price is not None:
+            order.price = price
+        return order
+
 
 class LimitOrder(Order):
-    def __init__(self, id, symbol, quantity, price, side, time):
+    __slots__ = ('price',)
+    type = OrderType.LIMIT
+
+    def __init__(self, id, symbol, quantity, price, side, time, tick_size=None):
         super().__init__(id, symbol, quantity, side, time)
         if price > 0:
             self.price = price
         else:
             raise NonPositivePrice("Price Must Be Positive!")
-        self.type = OrderType.LIMIT
+        if tick_size is not None and off_tick(price, tick_size):
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
 
 
 class MarketOrder(Order):
+    # price is only set if the remainder of the order comes to rest in the book
+    __slots__ = ('price',)
+    type = OrderType.MARKET
+
     def __init__(self, id, symbol, quantity, side, time):
         super().__init__(id, symbol, quantity, side, time)
-        self.type = OrderType.MARKET
 
 
 class IOCOrder(Order):
-    def __init__(self, id, symbol, quantity, price, side, time):
+    __slots__ = ('price',)
+    type = OrderType.IOC
+
+    def __init__(self, id, symbol, quantity, price, side, time, tick_size=None):
         super().__init__(id, symbol, quantity, side, time)
         if price > 0:
             self.price = price
         else:
             raise NonPositivePrice("Price Must Be Positive!")
-        self.type = OrderType.IOC
+        if tick_size is not None and off_tick(price, tick_size):
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
 
 
 class FilledOrder(Order):
+    # Fills are only ever built by the matching engine from orders that were validated when they
+    # were created, so the checks in Order.__init__ are skipped here.
+    __slots__ = ('price', 'limit')
+
     def __init__(self, id, symbol, quantity, price, side, time, limit=False):
-        super().__init__(id, symbol, quantity, side, time)
+        self.id = id
+        self.symbol = symbol
+        self.quantity = quantity
+        self.side = side
+        self.time = time
         self.price = price
         self.limit = limit
 
+
+class RejectedOrder(Order):
+    # Sent back to a trader in place of a fill for the part of an order that was not accepted:
+    # quantity is how much was rejected, type the OrderType of the order, and reason why.
+    __slots__ = ('type', 'reason')
+
+    def __init__(self, id, symbol, quantity, side, time, type, reason):
+        self.id = id
+        self.symbol = symbol
+        self.quantity = quantity
+        self.side = side
+        self.time = time
+        self.type = type
+        self.reason = reason
+
+
+class ExecutionReport():
+    # One record per match between an incoming (aggressor) order and a resting (passive) order.
+    # side is the aggressor's side; the passive order was on the other one. Turning a report into a
+    # fill notice for each of the two traders is left to the exchange gateway.
+    __slots__ = ('sequence', 'aggressor_id', 'passive_id', 'side', 'price', 'quantity')
+
+    def __init__(self, sequence, aggressor_id, passive_id, side, price, quantity):
+        self.sequence = sequence
+        self.aggressor_id = aggressor_id
+        self.passive_id = passive_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+
+
+class OrderBatch():
+    # A block of new orders for MatchingEngine.handle_orders, stored column by column.
+    # Each column is an array.array, a NumPy array or a list with one entry per order. Sides and
+    # types hold the OrderSide/OrderType enum values, and the price of a market order is ignored.
+    # id may be None, in which case the engine assigns ids and stores them in the batch.
+    __slots__ = ('id', 'side', 'type', 'price', 'quantity', 'symbol', 'time')
+
+    def __init__(self, id, side, type, price, quantity, symbol=None, time=0.0):
+        self.id = id
+        self.side = side
+        self.type = type
+        self.price = price
+        self.quantity = quantity
+        self.symbol = symbol
+        self.time = time
+
+    def __len__(self):
+        return len(self.side)
+
+    def columns(self):
+        # the columns as plain lists, which are the cheapest to index one order at a time;
+        # array.array and NumPy arrays both convert in bulk through tolist()
+        return tuple(None if column is None else column.tolist() if hasattr(column, 'tolist') else list(column)
+                     for column in (self.id, self.side, self.type, self.price, self.quantity))
+
+    @staticmethod
+    def validate(sides, types, prices, quantities, tick_size=None, band=None):
+        # the checks the Order constructors make, run once over whole columns. Limit and IOC prices
+        # are also checked against tick_size and the (lowest, highest) price band when given.
+        if not len(sides) == len(types) == len(prices) == len(quantities):
+            raise ValueError("Batch Columns Must Have The Same Length!")
+        if not sides:
+            return
+        if min(quantities) <= 0:
+            raise NonPositiveQuantity("Quantity Must Be Positive!")
+        if not set(sides) <= {OrderSide.BUY.value, OrderSide.SELL.value}:
+            raise InvalidSide("Side Must Be Either \"Buy\" or \"OrderSide.SELL\"!")
+        order_types = set(types)
+        if not order_types <= {OrderType.LIMIT.value, OrderType.MARKET.value, OrderType.IOC.value}:
+            raise UndefinedOrderType("Undefined Order Type!")
+        if OrderType.MARKET.value in order_types:
+            prices = [price for price, order_type in zip(prices, types) if order_type != OrderType.MARKET.value]
+        if not prices:
+            return
+        if min(prices) <= 0:
+            raise NonPositivePrice("Price Must Be Positive!")
+        if tick_size is not None and any(off_tick(price, tick_size) for price in prices):
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
+        if band is not None and (min(prices) < band[0] or max(prices) > band[1]):
+            raise PriceOutOfBand("Price Outside The Price Band!")
+
+
+class ExecutionColumns():
+    # Execution reports stored column by column in typed arrays, as returned by
+    # MatchingEngine.handle_orders. side holds the aggressor's OrderSide value.
+    __slots__ = ('sequence', 'aggressor_id', 'passive_id', 'side', 'price', 'quantity')
+
+    def __init__(self):
+        self.sequence = array('q')
+        self.aggressor_id = array('q')
+        self.passive_id = array('q')
+        self.side = array('b')
+        self.price = array('d')
+        self.quantity = array('q')
+
+    def add(self, sequence, aggressor_id, passive_id, side, price, quantity):
+        self.sequence.append(sequence)
+        self.aggressor_id.append(aggressor_id)
+        self.passive_id.append(passive_id)
+        self.side.append(side)
+        self.price.append(price)
+        self.quantity.append(quantity)
+
+    def __len__(self):
+        return len(self.sequence)
+
+
+class BookUpdate():
+    # One incremental market data update from MatchingEngine, numbered by sequence within its
+    # symbol. A level update carries the new total quantity at price on side (0 once the level is
+    # removed); a trade carries the traded price and quantity, with side the aggressor's side.
+    __slots__ = ('sequence', 'type', 'side', 'price', 'quantity')
+
+    def __init__(self, sequence, type, side, price, quantity):
+        self.sequence = sequence
+        self.type = type
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+
+
+EVENT_BLOCK = struct.Struct('<q')
+
+
+class EventLog():
+    # Structured events (a LogEvent and four numeric fields, stamped with perf_counter_ns and a
+    # LogLevel) kept in a ring of preallocated typed columns, and written out by a background thread
+    # once a file is opened, as compact text or binary blocks (see read_event_log).
+    # Events below the log level are dropped by a single comparison; hot paths make it themselves,
+    # as in "if event_log.level <= LogLevel.DEBUG: event_log.log(...)", to skip even the call.
+    # When the writer falls a whole ring behind, new events are counted in dropped rather than
+    # blocking the caller. Each process logs on its own; the writer thread does not survive a fork.
+    def __init__(self, capacity=65536, level=LogLevel.WARNING):
+        self.capacity = capacity
+        self.level = level
+        self.times = array('q', bytes(8 * capacity))
+        self.levels = array('b', bytes(capacity))
+        self.events = array('b', bytes(capacity))
+        self.traders = array('q', bytes(8 * capacity))
+        self.orders = array('q', bytes(8 * capacity))
+        self.quantities = array('q', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.tail = 0
+        # events logged and events written out so far; event i is kept in slot i % capacity
+        self.dropped = 0
+        # events lost because the ring was full
+        self.lock = threading.Lock()
+        self.file = None
+        self.binary = False
+        self.writer = None
+        self.stopping = threading.Event()
+
+    def log(self, level, event, trader=0, order=0, quantity=0, value=0.0):
+        if level < self.level:
+            return
+        with self.lock:
+            head = self.head
+            if head - self.tail >= self.capacity:
+                self.dropped += 1
+                return
+            i = head % self.capacity
+            self.times[i] = time.perf_counter_ns()
+            self.levels[i] = level
+            self.events[i] = event
+            self.traders[i] = trader
+            self.orders[i] = order
+            self.quantities[i] = quantity
+            self.values[i] = value
+            self.head = head + 1
+
+    def open(self, path, level=None, binary=False, interval=0.05):
+        # starts writing events to the end of the file at path, every interval seconds
+        if level is not None:
+            self.level = level
+        self.binary = binary
+        self.file = open(path, 'ab' if binary else 'a')
+        self.stopping.clear()
+        self.writer = threading.Thread(target=self.write_loop, args=(interval,), daemon=True)
+        self.writer.start()
+
+    def write_loop(self, interval):
+        while not self.stopping.wait(interval):
+            self.drain()
+
+    def records(self, start, end):
+        # the columns of events start to end (a stretch of the ring that does not wrap)
+        return (self.times[start:end], self.levels[start:end], self.events[start:end], self.traders[start:end],
+                self.orders[start:end], self.quantities[start:end], self.values[start:end])
+
+    def drain(self):
+        # writes out every event logged so far
+        head, tail = self.head, self.tail
+        if head == tail or self.file is None:
+            return
+        start, end = tail % self.capacity, head % self.capacity
+        if end <= start:
+            stretches = [(start, self.capacity), (0, end)] if end else [(start, self.capacity)]
+        else:
+            stretches = [(start, end)]
+        for start, end in stretches:
+            columns = self.records(start, end)
+            if self.binary:
+                self.file.write(EVENT_BLOCK.pack(end - start))
+                for column in columns:
+                    self.file.write(column.tobytes())
+            else:
+                self.file.write(''.join('%d %s %s %d %d %d %r\n' % (t, LogLevel(l).name, LogEvent(e).name, a, o, q, v)
+                                        for t, l, e, a, o, q, v in zip(*columns)))
+        self.tail = head
+        self.file.flush()
+
+    def close(self):
+        # stops the writer after it has written out everything logged so far
+        if self.writer is not None:
+            self.stopping.set()
+            self.writer.join()
+            self.writer = None
+        self.drain()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_event_log(path):
+    # the (time, level, event, trader, order, quantity, value) records of a binary event log
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        count, = EVENT_BLOCK.unpack_from(data, offset)
+        offset += EVENT_BLOCK.size
+        columns = []
+        for typecode in 'qbbqqqd':
+            column = array(typecode)
+            end = offset + count * column.itemsize
+            column.frombytes(data[offset:end])
+            columns.append(column)
+            offset = end
+        for time_ns, level, event, trader, order, quantity, value in zip(*columns):
+            yield time_ns, LogLevel(level), LogEvent(event), trader, order, quantity, value
+
+
+event_log = EventLog()
+# the log the engine, traders and exchange write their events to
+
 # 1 thread for exchange,
-# and 100 threads for the traders
-trader_to_exchange = deque()
-exchange_to_trader = [deque() for _ in range(100)]
+# and a thread for each trader
+trader_to_exchange = queue.Queue()
+exchange_to_trader = defaultdict(queue.SimpleQueue)
 
 
-# Above you are given two deques where the orders submitted to the exchange and back to the trader
+# Above you are given two queues where the orders submitted to the exchange and back to the trader
 # are expected to be populated by the trading exchange simulator
-# The first is trader_to_exchange, a deque of orders to be populated for the exchange to execute
-# The second is a list of 100 deques exchange_to_trader, which are acknowledgements from the exchange
-# to each of the 100 traders for trades executed on their behalf
+# The first is trader_to_exchange, a queue of orders to be populated for the exchange to execute
+# The second maps a trader's id to its queue exchange_to_trader[id], which holds the
+# acknowledgements from the exchange for trades executed on its behalf; a trader's queue is only
+# made the first time it is looked up
+# trader_to_exchange is where a new Exchange and Traders send requests until a Runtime gives them
+# their own queue. Neither fills in exchange_to_trader: a Runtime or Simulation makes a mailbox for
+# each trader taking part (see Runtime below), and ShardedExchange delivers into exchange_to_trader
+# only when it is not given mailboxes of its own
 
 # Below you have an implementation of a simulated thread to be used where each trader is a separate thread
 class MyThread:
     list_of_threads = []
 
-    def __init__(self, id='NoID'):
-        MyThread.list_of_threads.append(self)
+    def __init__(self, id='NoID', threads=None):
+        # threads is the list the thread is kept in, MyThread.list_of_threads unless a session keeps
+        # its own
+        (MyThread.list_of_threads if threads is None else threads).append(self)
         self.is_started = False
         self.id = id
 
@@ -127,15 +485,328 @@ class MyThread:
         self.is_started = True
 
     def join(self):
-        print('Trader ' + str(self.id) + ' will be waited')
+        if event_log.level <= LogLevel.INFO:
+            event_log.log(LogLevel.INFO, LogEvent.THREAD_WAITED, self.id if type(self.id) is int else -1)
 
 
 # Paste in your implementation for the matching engine below
+class PriceLevelBook():
+    # One side of the order book: a sorted map of price levels, each level a FIFO queue of the
+    # orders resting at that price (time priority is the position in the queue).
+    # A level is an OrderedDict keyed by order id, so an order can also leave the middle of its
+    # queue in O(1) when it is cancelled.
+    # Level keys are kept ascending with the best price last (bids keyed by price, asks by -price),
+    # so the best level is always keys[-1] and clearing it is a pop from the end.
+    # The total quantity resting at each price is kept alongside the levels and updated on every
+    # insert, fill, amend and cancel, so the top of book and the depth never need to add up orders.
+    def __init__(self, side):
+        if side == OrderSide.BUY:
+            self.sign = 1
+        elif side == OrderSide.SELL:
+            self.sign = -1
+        else:
+            raise UndefinedOrderSide("Undefined Order Side!")
+        self.side = side
+        self.levels = {}
+        self.keys = []
+        self.quantities = {}
+        # price -> total quantity of the orders resting at that price
+        self.changed = None
+        # while the engine has market data subscribers: price -> total quantity at that price
+        # before its first change since the engine last published (None if it had no level)
+
+    def touch(self, price):
+        # to be called before the quantity at price changes, while changes are being recorded
+        if price not in self.changed:
+            self.changed[price] = self.quantities.get(price)
+
+    def insert(self, order):
+        if self.changed is not None:
+            self.touch(order.price)
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = OrderedDict()
+            bisect.insort(self.keys, self.sign * order.price)
+            self.quantities[order.price] = order.quantity
+        else:
+            self.quantities[order.price] += order.quantity
+        level[order.id] = order
+
+    def remove(self, order):
+        if self.changed is not None:
+            self.touch(order.price)
+        level = self.levels[order.price]
+        del level[order.id]
+        if not level:
+            del self.levels[order.price]
+            del self.quantities[order.price]
+            del self.keys[bisect.bisect_left(self.keys, self.sign * order.price)]
+        else:
+            self.quantities[order.price] -= order.quantity
+
+    def pop_best_level(self):
+        price = self.sign * self.keys.pop()
+        if self.changed is not None:
+            self.touch(price)
+        del self.levels[price]
+        del self.quantities[price]
+
+    def best_key(self):
+        # sign * the best price, the key the matching loop compares limits against, or None if the
+        # side is empty
+        if self.keys:
+            return self.keys[-1]
+        return None
+
+    def best_price(self):
+        if self.keys:
+            return self.sign * self.keys[-1]
+        return None
+
+    def best(self):
+        # (price, total quantity) of the best level, or None if the side is empty
+        if self.keys:
+            price = self.sign * self.keys[-1]
+            return price, self.quantities[price]
+        return None
+
+    def depth(self, n):
+        # (price, total quantity) of up to n levels, best first
+        sign, quantities = self.sign, self.quantities
+        return [(sign * key, quantities[sign * key]) for key in self.keys[:-n - 1:-1]] if n > 0 else []
+
+    def prices(self):
+        # the prices of the levels, best first
+        for key in reversed(self.keys):
+            yield self.sign * key
+
+    def __iter__(self):
+        # resting orders in priority order: best price first, then oldest first within a level
+        for price in self.prices():
+            yield from self.levels[price].values()
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels.values())
+
+
+class TickLadderBook(PriceLevelBook):
+    # One side of the book of an instrument whose prices are multiples of tick_size within a fixed
+    # band from min_price to max_price. Every price maps to an integer tick index, and which ticks
+    # have orders resting is kept in a bitmap instead of a sorted list of keys: bit i of word i >> 6
+    # of bitmaps[0] is set while tick i has a level, and each further bitmap has a bit set for every
+    # non-zero word of the one below, up to a single word. Adding or clearing a level sets or clears
+    # one bit per bitmap (only carrying on up while a word goes from or to zero), and the next level
+    # behind a given tick is found by scanning one word per bitmap, so neither depends on how many
+    # levels there are. The best tick is kept as well, which makes the top of book a lookup.
+    # The levels and their quantities are kept by price as in PriceLevelBook, so the matching loop,
+    # amends and market data work on either kind of book; prices are stored as tick index times
+    # tick size, and insert rewrites an order's price to that form.
+    def __init__(self, side, tick_size, min_price, max_price):
+        super().__init__(side)
+        if not 0 < min_price <= max_price:
+            raise PriceOutOfBand("Price Band Must Be Positive And Not Empty!")
+        if off_tick(min_price, tick_size) or off_tick(max_price, tick_size):
+            raise PriceNotOnTick("Price Band Must Start And End On A Tick!")
+        self.keys = None
+        self.tick_size = tick_size
+        self.min_price = min_price
+        self.max_price = max_price
+        self.base = round(min_price / tick_size)
+        self.size = round(max_price / tick_size) - self.base + 1
+        self.digits = tick_digits(tick_size)
+        # prices are rounded to this many decimal places (see price_of)
+        self.bitmaps = []
+        length = self.size
+        while True:
+            # one spare bit at the top of every bitmap lets the scans start just past the last tick
+            words = array('Q', bytes(8 * ((length >> 6) + 1)))
+            self.bitmaps.append(words)
+            if len(words) == 1:
+                break
+            length = len(words)
+        self.best_tick = -1
+        self.best_level_price = None
+        # tick index and price of the best level, -1 and None if the side is empty
+        self.worse = self.below if self.sign == 1 else self.above
+        # worse(i) is the next tick behind tick i that has a level
+
+    def tick_of(self, price):
+        # the tick index of price
+        ticks = price / self.tick_size
+        tick = round(ticks)
+        if abs(ticks - tick) > TICK_TOLERANCE:
+            raise PriceNotOnTick("Price Must Be A Multiple Of The Tick Size!")
+        tick -= self.base
+        if not 0 <= tick < self.size:
+            raise PriceOutOfBand("Price Outside The Price Band!")
+        return tick
+
+    def price_of(self, tick):
+        # tick index times tick size, rounded to the tick size's decimal places so that a price
+        # comes out as the float it is written as (0.3 rather than 0.30000000000000004)
+        if self.digits is None:
+            return (tick + self.base) * self.tick_size
+        return round((tick + self.base) * self.tick_size, self.digits)
+
+    def mark(self, tick):
+        for words in self.bitmaps:
+            i = tick >> 6
+            word = words[i]
+            words[i] = word | (1 << (tick & 63))
+            if word:
+                break
+            tick = i
+
+    def unmark(self, tick):
+        for words in self.bitmaps:
+            i = tick >> 6
+            word = words[i] & ~(1 << (tick & 63))
+            words[i] = word
+            if word:
+                break
+            tick = i
+
+    def below(self, tick):
+        # the highest tick under tick that has a level, or -1
+        bitmaps = self.bitmaps
+        for level, words in enumerate(bitmaps):
+            word = words[tick >> 6] & ((1 << (tick & 63)) - 1)
+            if word:
+                tick = (tick & ~63) + word.bit_length() - 1
+                break
+            tick >>= 6
+        else:
+            return -1
+        # tick is a set bit of bitmaps[level]; follow the highest set bits down to bitmaps[0]
+        for words in reversed(bitmaps[:level]):
+            tick = (tick << 6) + words[tick].bit_length() - 1
+        return tick
+
+    def above(self, tick):
+        # the lowest tick over tick that has a level, or -1
+        bitmaps = self.bitmaps
+        tick += 1
+        for level, words in enumerate(bitmaps):
+            word = words[tick >> 6] >> (tick & 63)
+            if word:
+                tick += (word & -word).bit_length() - 1
+                break
+            tick = (tick >> 6) + 1
+        else:
+            return -1
+        for words in reversed(bitmaps[:level]):
+            word = words[tick]
+            tick = (tick << 6) + (word & -word).bit_length() - 1
+        return tick
+
+    def insert(self, order):
+        tick = self.tick_of(order.price)
+        price = order.price = self.price_of(tick)
+        if self.changed is not None:
+            self.touch(price)
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = OrderedDict()
+            self.quantities[price] = order.quantity
+            self.mark(tick)
+            best = self.best_tick
+            if best < 0 or (tick > best if self.sign == 1 else tick < best):
+                self.best_tick = tick
+                self.best_level_price = price
+        else:
+            self.quantities[price] += order.quantity
+        level[order.id] = order
+
+    def remove(self, order):
+        if self.changed is not None:
+            self.touch(order.price)
+        level = self.levels[order.price]
+        del level[order.id]
+        if not level:
+            self.clear_level(order.price, self.tick_of(order.price))
+        else:
+            self.quantities[order.price] -= order.quantity
+
+    def clear_level(self, price, tick):
+        del self.levels[price]
+        del self.quantities[price]
+        self.unmark(tick)
+        if tick == self.best_tick:
+            tick = self.best_tick = self.worse(tick)
+            self.best_level_price = None if tick < 0 else self.price_of(tick)
+
+    def pop_best_level(self):
+        price = self.best_level_price
+        if self.changed is not None:
+            self.touch(price)
+        self.clear_level(price, self.best_tick)
+
+    def best_key(self):
+        if self.best_level_price is None:
+            return None
+        return self.sign * self.best_level_price
+
+    def best_price(self):
+        return self.best_level_price
+
+    def best(self):
+        price = self.best_level_price
+        if price is None:
+            return None
+        return price, self.quantities[price]
+
+    def depth(self, n):
+        quantities = self.quantities
+        return [(price, quantities[price]) for price in itertools.islice(self.prices(), max(n, 0))]
+
+    def prices(self):
+        tick = self.best_tick
+        while tick >= 0:
+            yield self.price_of(tick)
+            tick = self.worse(tick)
+
+
 class MatchingEngine():
-    def __init__(self):
-        self.bid_book = []
-        self.ask_book = []
+    def __init__(self, symbol=None, tick_size=None, min_price=None, max_price=None):
+        # With a tick_size, the symbol trades on a fixed price ladder (see TickLadderBook) and every
+        # limit and IOC price has to be a multiple of tick_size from min_price to max_price.
+        self.symbol = symbol
+        self.tick_size = tick_size
+        if tick_size is None:
+            self.bids = PriceLevelBook(OrderSide.BUY)
+            self.asks = PriceLevelBook(OrderSide.SELL)
+        else:
+            self.bids = TickLadderBook(OrderSide.BUY, tick_size, min_price, max_price)
+            self.asks = TickLadderBook(OrderSide.SELL, tick_size, min_price, max_price)
         # These are the order books you are given and expected to use for matching the orders below
+        self.orders = {}
+        # id -> resting order, kept in step with the books on every insert, fill and cancel
+        self.order_ids = itertools.count(1)
+        self.sequence = itertools.count(1)
+        # sequence numbers of the execution reports, in the order the matches happened
+        self.subscribers = []
+        self.update_sequence = 0
+        # market data subscribers (see subscribe) and the sequence number of the last BookUpdate
+
+    @property
+    def bid_book(self):
+        # flattened snapshot of the bid side in priority order, for inspection only
+        return list(self.bids)
+
+    @property
+    def ask_book(self):
+        return list(self.asks)
+
+    def best_bid(self):
+        # (price, total quantity) of the best bid level, or None if there are no bids
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def depth(self, n):
+        # the n best levels of each side as (bids, asks), each a list of (price, total quantity)
+        return self.bids.depth(n), self.asks.depth(n)
 
     # Note: As you implement the following functions keep in mind that these enums are available:
     #     class OrderType(Enum):
@@ -146,384 +817,478 @@ class MatchingEngine():
     #     class OrderSide(Enum):
     #         BUY = 1
     #         SELL = 2
+    def next_order_id(self):
+        # ids are handed out by the engine so that they are unique across all traders
+        return next(self.order_ids)
+
+    def index(self, order):
+        if order.id in self.orders:
+            raise DuplicateOrderId("Order Id Already Resting In The Book!")
+        self.orders[order.id] = order
+
     def remove(self, order):
+        del self.orders[order.id]
         if order.side == OrderSide.BUY:
-            self.bid_book.remove(order)
+            self.bids.remove(order)
         elif order.side == OrderSide.SELL:
-            self.ask_book.remove(order)
+            self.asks.remove(order)
         else:
             raise UndefinedOrderSide("Undefined Order Side!")
 
+    def check_price(self, order):
+        # raises PriceNotOnTick or PriceOutOfBand if the order's price is not on the book's ladder,
+        # without touching the book, so a caller can turn the order away before it is recorded
+        if self.tick_size is not None and order.type != OrderType.MARKET:
+            self.bids.tick_of(order.price)
+
     def handle_order(self, order):
+        if order.id is None:
+            order.id = self.next_order_id()
+        if self.tick_size is not None and order.type != OrderType.MARKET:
+            # checked before matching, so an order off the ladder is rejected before it trades
+            order.price = self.bids.price_of(self.bids.tick_of(order.price))
         if order.type == OrderType.LIMIT:
-            self.handle_limit_order(order)
-            print('limit order handled')
+            filled_orders = self.handle_limit_order(order)
+            if event_log.level <= LogLevel.DEBUG:
+                event_log.log(LogLevel.DEBUG, LogEvent.ORDER_HANDLED, 0, order.id, order.quantity, order.price)
         elif order.type == OrderType.MARKET:
-            self.handle_market_order(order)
+            filled_orders = self.handle_market_order(order)
         elif order.type == OrderType.IOC:
-            self.handle_ioc_order(order)
+            filled_orders = self.handle_ioc_order(order)
         else:
-            # Implement this function
-            # In this function you need to call different functions from the matching engine
-            # depending on the type of order you are given
-
             # You need to raise the following error if the type of order is ambiguous
             raise UndefinedOrderType("Undefined Order Type!")
+        return filled_orders
 
-    def handle_limit_order(self, order):
-        filled_orders = []
-        # The orders that are filled from the market order need to be inserted into the above list
+    def sweep(self, order, columns=None):
+        # The matching loop shared by the limit, market and IOC handlers.
+        # The order trades against the best opposite level, oldest order first, and every resting
+        # order it fills completely is popped off the front of its level straight away, so the cost
+        # is proportional to the number of fills. Limit and IOC orders stop at their own price,
+        # market orders are unbounded. Both sides of a fill trade at the resting order's price.
+        # Returns one ExecutionReport per match, or records the matches in columns
+        # (an ExecutionColumns) instead when one is given.
         if order.side == OrderSide.BUY:
-            consumed_asks = []
-            for item in self.ask_book:
-                if order.price < item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, order.price,
-                                                         order.side, order.time))
-                        consumed_asks.append(item)
-                        order.quantity = 0
-
-                    elif order.quantity < item.quantity:
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                    item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(
-                            FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                        order.time))
-                        order.quantity = 0
-                        break
-
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                      order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_asks.append(item)
-
-            for item2 in consumed_asks:
-                self.remove(item2)
-            if order.quantity != 0:
-                self.insert_limit_order(order)
-
+            book = self.asks
         elif order.side == OrderSide.SELL:
-            consumed_bids = []
-            for item in self.bid_book:
-                if order.price > item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(
-                            FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                        order.time))
-                        consumed_bids.append(item)
-                        order.quantity = 0
-                    elif order.quantity < item.quantity:
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                    item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(
-                            FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                        order.time))
-                        order.quantity = 0
-                        break
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                      order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_bids.append(item)
-
-            for item2 in consumed_bids:
-                self.remove(item2)
-
-            if order.quantity != 0:
-                self.insert_limit_order(order)
-
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
+            book = self.bids
         else:
-            # You need to raise the following error if the side the order is for is ambiguous
             raise UndefinedOrderSide("Undefined Order Side!")
-        # The filled orders are expected to be the return variable (list)
-        return filled_orders
-
-    def handle_market_order(self, order):
-        # Implement this function
+        # levels are keyed so that a larger key is a better price for the aggressor
+        limit_key = None if order.type == OrderType.MARKET else book.sign * order.price
         filled_orders = []
-        # The orders that are filled from the market order need to be inserted into the above list
-        if order.side == OrderSide.BUY:
-            consumed_asks = []
-            for item in self.ask_book:  # should really use while loop here for true functionality
-                if order.quantity == 0:
-                    break
-                if order.quantity == item.quantity:
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(LimitOrder(order.id, order.symbol, order.quantity, item.price, order.side,
-                                                    order.time))
-                    consumed_asks.append(item)
-                    order.quantity = 0
-                    break
-                elif order.quantity < item.quantity:
-                    partial_order = LimitOrder(item.id, item.symbol, order.quantity, item.price, item.side, item.time)
-                    item.quantity -= order.quantity
-                    filled_orders.append(partial_order)
-                    filled_orders.append(LimitOrder(order.id, order.symbol, order.quantity, item.price, order.side,
-                                                    order.time))
-                    order.quantity = 0
-                    break
+        sequence = self.sequence
+        while order.quantity > 0:
+            best_key = book.best_key()
+            if best_key is None or limit_key is not None and best_key < limit_key:
+                break
+            price = book.sign * best_key
+            level = book.levels[price]
+            if book.changed is not None:
+                book.touch(price)
+            traded = 0
+            while order.quantity > 0 and level:
+                item = level[next(iter(level))]
+                quantity = min(order.quantity, item.quantity)
+                if columns is None:
+                    filled_orders.append(ExecutionReport(next(sequence), order.id, item.id, order.side, price,
+                                                         quantity))
                 else:
-                    order.quantity -= item.quantity
-                    fulfilled_order = LimitOrder(order.id, order.symbol, item.quantity, item.price, order.side,
-                                                 order.time)
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(fulfilled_order)
-                    consumed_asks.append(item)
-
-            for item2 in consumed_asks:
-                self.remove(item2)
-
-            if order.quantity != 0:
-                self.insert_market_order(order)
+                    columns.add(next(sequence), order.id, item.id, order.side.value, price, quantity)
+                item.quantity -= quantity
+                order.quantity -= quantity
+                traded += quantity
+                if item.quantity == 0:
+                    level.popitem(last=False)
+                    del self.orders[item.id]
+            if not level:
+                book.pop_best_level()
+            else:
+                book.quantities[price] -= traded
+        return filled_orders
 
-        elif order.side == OrderSide.SELL:
-            consumed_bids = []
-            for item in self.bid_book:
-                if order.quantity == 0:
-                    break
-                if order.quantity == item.quantity:
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(FilledOrder(order.id, order.symbol, order.quantity, item.price, order.side,
-                                                     order.time))
-                    consumed_bids.append(item)
-                    order.quantity = 0
-                    break
-                elif order.quantity < item.quantity:
-
-                    partial_order = LimitOrder(item.id, item.symbol, order.quantity, item.price, item.side, item.time)
-                    item.quantity -= order.quantity
-                    filled_orders.append(partial_order)
-                    filled_orders.append(
-                        LimitOrder(order.id, order.symbol, order.quantity, item.price, order.side, order.time))
-                    order.quantity = 0
-                    break
-                else:
-                    order.quantity -= item.quantity
-                    fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, item.price, order.side,
-                                                  order.time)
-                    filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                     item.time))
-                    filled_orders.append(fulfilled_order)
-                    consumed_bids.append(item)
-            for item2 in consumed_bids:
-                self.remove(item2)
-
-            if order.quantity != 0:
-                self.insert_market_order(order)
-                # should create new insert_market_order functionality, which takes in the price as well
+    def handle_orders(self, batch, next_order_id=None):
+        # Columnar counterpart of calling handle_order on each order of an OrderBatch in turn: the
+        # book and the executions come out exactly the same, but the batch is validated once, no
+        # per-order objects are built for the fills, and orders that cannot cross the best
+        # opposite price skip the sweep altogether. A batch without ids gets them from
+        # next_order_id (the engine's own by default) once it has been validated, so a rejected
+        # batch uses none up. Returns an ExecutionColumns.
+        ids, sides, types, prices, quantities = batch.columns()
+        ladder = self.tick_size is not None
+        if ladder:
+            OrderBatch.validate(sides, types, prices, quantities, self.tick_size,
+                                (self.bids.min_price, self.bids.max_price))
         else:
-            raise UndefinedOrderSide("Undefined Order Side!")
+            OrderBatch.validate(sides, types, prices, quantities)
+        if batch.id is None:
+            next_order_id = next_order_id or self.next_order_id
+            ids = [next_order_id() for _ in sides]
+            batch.id = array('q', ids)
+        elif len(ids) != len(sides):
+            raise ValueError("Batch Columns Must Have The Same Length!")
+        executions = ExecutionColumns()
+        order_sides = (None, OrderSide.BUY, OrderSide.SELL)
+        limit, ioc = OrderType.LIMIT.value, OrderType.IOC.value
+        symbol, now = batch.symbol, batch.time
+        for i in range(len(sides)):
+            side = order_sides[sides[i]]
+            book = self.asks if side == OrderSide.BUY else self.bids
+            order_type = types[i]
+            if order_type == limit or order_type == ioc:
+                price = prices[i]
+                if ladder:
+                    price = book.price_of(book.tick_of(price))
+                if order_type == limit:
+                    order = LimitOrder.unchecked(ids[i], symbol, quantities[i], side, now, price)
+                else:
+                    order = IOCOrder.unchecked(ids[i], symbol, quantities[i], side, now, price)
+                best_key = book.best_key()
+                if best_key is not None and best_key >= book.sign * price:
+                    self.sweep(order, executions)
+                if order.quantity != 0 and order_type == limit:
+                    self.insert_limit_order(order)
+            else:
+                order = MarketOrder.unchecked(ids[i], symbol, quantities[i], side, now)
+                filled = len(executions)
+                self.sweep(order, executions)
+                if order.quantity != 0 and len(executions) > filled:
+                    self.insert_market_order(order, executions.price[-1])
+                # as in handle_market_order, an order that traded nothing is dropped
+        # the batch arrived as one message, so its market data goes out as one batch too
+        self.publish(executions)
+        return executions
+
+    def handle_limit_order(self, order):
+        filled_orders = self.sweep(order)
+        # whatever does not fill immediately rests in the book
+        if order.quantity != 0:
+            self.insert_limit_order(order)
+        self.publish(filled_orders)
         # The filled orders are expected to be the return variable (list)
         return filled_orders
 
-    def insert_limit_order(self, order):
-        assert order.type == OrderType.LIMIT
-        if order.side == OrderSide.BUY:
-            self.bid_book.append(order)
-            # self.bid_book.sort(key=lambda x: x.time)
-            self.bid_book.sort(key=lambda x: x.price, reverse=True)
-        elif order.side == OrderSide.SELL:
-            self.ask_book.append(order)
-            # self.ask_book.sort(key=lambda x: x.time)
-            self.ask_book.sort(key=lambda x: x.price)
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
-        else:
-            # You need to raise the following error if the side the order is for is ambiguous
-            raise UndefinedOrderSide("Undefined Order Side!")
+    def handle_market_order(self, order):
+        filled_orders = self.sweep(order)
+        if order.quantity != 0 and filled_orders:
+            # the remainder rests at the last price it traded at
+            self.insert_market_order(order, filled_orders[-1].price)
+        # an order that traded nothing has no price to rest at, so unlike the original engine (which
+        # queued it with no price) it is dropped, with order.quantity left as the quantity dropped;
+        # the exchange tells the trader with a RejectedOrder
+        self.publish(filled_orders)
+        return filled_orders
 
     def handle_ioc_order(self, order):
-        filled_orders = []
-        if order.side == OrderSide.BUY:
-            consumed_asks = []
-            for item in self.ask_book:
-                if order.price < item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(LimitOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                                        order.time))
-                        consumed_asks.append(item)
-                        order.quantity = 0
-                        # order gets filled, pop from ask book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    elif order.quantity < item.quantity:
-                        # filled_orders.append(item)
-                        # item.quantity -= order.quantity
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                    item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(
-                            FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                        order.time))
-                        order.quantity = 0
-                        break
-                        # order gets filled, pop from ask book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                      order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_asks.append(item)
-            for item2 in consumed_asks:
-                self.remove(item2)
-
-            # if order.quantity != 0:
-            #     self.insert_limit_order(order)
-
-        elif order.side == OrderSide.SELL:
-            consumed_bids = []
-            for item in self.bid_book:
-                if order.price > item.price or order.quantity == 0:
-                    break
-                else:
-                    if order.quantity == item.quantity:
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(
-                            FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                        order.time))
-                        consumed_bids.append(item)
-                        order.quantity = 0
-                        break
-                        # order gets filled, pop from bid book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    elif order.quantity < item.quantity:
-                        partial_order = FilledOrder(item.id, item.symbol, order.quantity, item.price, item.side,
-                                                    item.time)
-                        item.quantity -= order.quantity
-                        filled_orders.append(partial_order)
-                        filled_orders.append(
-                            FilledOrder(order.id, order.symbol, order.quantity, order.price, order.side,
-                                        order.time))
-                        order.quantity = 0
-                        break
-                        # order gets filled, pop from ask book
-                        # self.bid_book.pop(key = lambda x: x.id == order.id)
-                    else:
-                        order.quantity -= item.quantity
-                        fulfilled_order = FilledOrder(order.id, order.symbol, item.quantity, order.price, order.side,
-                                                      order.time)
-                        filled_orders.append(FilledOrder(item.id, item.symbol, item.quantity, item.price, item.side,
-                                                         item.time))
-                        filled_orders.append(fulfilled_order)
-                        consumed_bids.append(item)
-            for item2 in consumed_bids:
-                self.remove(item2)
-            return filled_orders
+        # whatever does not fill immediately is discarded
+        filled_orders = self.sweep(order)
+        self.publish(filled_orders)
+        return filled_orders
 
     def insert_limit_order(self, order):
         assert order.type == OrderType.LIMIT
         if order.side == OrderSide.BUY:
-            self.bid_book.append(order)
-            self.bid_book.sort(key=lambda x: x.price, reverse=True)
+            self.index(order)
+            self.bids.insert(order)
         elif order.side == OrderSide.SELL:
-            self.ask_book.append(order)
-            self.ask_book.sort(key=lambda x: x.price)
-        # Implement this function
+            self.index(order)
+            self.asks.insert(order)
         # this function's sole puporse is to place limit orders in the book that are guaranteed
         # to not immediately fill
         else:
             # You need to raise the following error if the side the order is for is ambiguous
             raise UndefinedOrderSide("Undefined Order Side!")
 
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
-
-    def insert_market_order(self, order):
-        # assert order.type == OrderType.MARKET
+    def insert_market_order(self, order, price):
+        # a market order has no price of its own, so its unfilled remainder is queued at the given price
+        order.price = price
         if order.side == OrderSide.BUY:
-            self.bid_book.append(order)
-            # self.bid_book.sort(key=lambda x: x.price, reverse=True)
+            self.index(order)
+            self.bids.insert(order)
         elif order.side == OrderSide.SELL:
-            self.ask_book.append(order)
-            # self.ask_book.sort(key=lambda x: x.price)
-        # Implement this function
-        # this function's sole puporse is to place limit orders in the book that are guaranteed
-        # to not immediately fill
+            self.index(order)
+            self.asks.insert(order)
         else:
-            # You need to raise the following error if the side the order is for is ambiguous
             raise UndefinedOrderSide("Undefined Order Side!")
 
     def amend_quantity(self, id, quantity): # modified to return True or False
-        # Implement this function
-        # Hint: Remember that there are two order books, one on the bid side and one on the ask side
-        switch = 0
-        for item in self.ask_book:
-            if item.id == id:
-                if item.quantity > quantity:
-                    item.quantity = quantity
-                    switch = 1
-                    return True
-                else:
-                    raise NewQuantityNotSmaller("Amendment Must Reduce Quantity!")
-        if switch == 0:
-            for item in self.bid_book:
-                if item.id == id:
-                    if item.quantity > quantity:
-                        item.quantity = quantity
-                        return True
-                    else:
-                        raise NewQuantityNotSmaller("Amendment Must Reduce Quantity!")
-        # You need to raise the following error if the user attempts to modify an order
-        # with a quantity that's greater than given in the existing order
-        return False
+        item = self.orders.get(id)
+        if item is None:
+            return False
+        if item.quantity > quantity:
+            book = self.bids if item.side == OrderSide.BUY else self.asks
+            if book.changed is not None:
+                book.touch(item.price)
+            book.quantities[item.price] -= item.quantity - quantity
+            item.quantity = quantity
+            self.publish()
+            return True
+        else:
+            # You need to raise the following error if the user attempts to modify an order
+            # with a quantity that's greater than given in the existing order
+            raise NewQuantityNotSmaller("Amendment Must Reduce Quantity!")
 
     def cancel_order(self, id): # modified to return true or false
-        # Implement this function
-        # Think about the changes you need to make in the order book based on the parameters given
-        switch = 0
-        cancelled_order = None
-        for item in self.ask_book:
-            if item.id == id:
-                cancelled_order = item
-                switch = 1
-                break
-        if switch == 0:
-            for item in self.bid_book:
-                if item.id == id:
-                    cancelled_order = item
-                    break
-        self.remove(cancelled_order)
-        if cancelled_order == None:
+        cancelled_order = self.orders.get(id)
+        if cancelled_order is None:
             return False
+        self.remove(cancelled_order)
+        self.publish()
+        return True
+
+    def subscribe(self, subscriber):
+        # subscriber(symbol, updates) is called with the list of BookUpdates caused by each order,
+        # amend or cancel from now on; l2_snapshot gives the book the first of them applies to
+        if not self.subscribers:
+            self.bids.changed = {}
+            self.asks.changed = {}
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+        if not self.subscribers:
+            self.bids.changed = None
+            self.asks.changed = None
+
+    def l2_snapshot(self):
+        # (sequence of the last update published, bid levels, ask levels), the levels as in depth
+        return self.update_sequence, self.bids.depth(len(self.bids.levels)), self.asks.depth(len(self.asks.levels))
+
+    def publish(self, executions=()):
+        # Sends the trades in executions (ExecutionReports or an ExecutionColumns) and every level
+        # changed since the last publish to the subscribers as one batch. A level that changed more
+        # than once is sent once with its final quantity, and one that ended where it started is
+        # not sent at all.
+        if not self.subscribers:
+            return
+        sequence = self.update_sequence
+        updates = []
+        if isinstance(executions, ExecutionColumns):
+            order_sides = (None, OrderSide.BUY, OrderSide.SELL)
+            for side, price, quantity in zip(executions.side, executions.price, executions.quantity):
+                sequence += 1
+                updates.append(BookUpdate(sequence, BookUpdateType.TRADE, order_sides[side], price, quantity))
         else:
-            return True
-        # You need to raise the following error if the user attempts to modify an order
-        # with a quantity that's greater than given in the existing order
+            for report in executions:
+                sequence += 1
+                updates.append(BookUpdate(sequence, BookUpdateType.TRADE, report.side, report.price,
+                                          report.quantity))
+        for book in (self.bids, self.asks):
+            for price, before in book.changed.items():
+                after = book.quantities.get(price)
+                if after == before:
+                    continue
+                if before is None:
+                    update_type = BookUpdateType.LEVEL_ADDED
+                elif after is None:
+                    update_type = BookUpdateType.LEVEL_REMOVED
+                    after = 0
+                else:
+                    update_type = BookUpdateType.LEVEL_CHANGED
+                sequence += 1
+                updates.append(BookUpdate(sequence, update_type, book.side, price, after))
+            book.changed.clear()
+        if updates:
+            self.update_sequence = sequence
+            for subscriber in self.subscribers:
+                subscriber(self.symbol, updates)
+
+
+class BookReplica():
+    # A subscriber's copy of the price levels of one symbol, started from MatchingEngine.l2_snapshot
+    # and kept current by the update batches the engine publishes (pass the replica to subscribe).
+    # Updates the snapshot already includes are skipped; a missing one raises SequenceGap.
+    def __init__(self, snapshot):
+        self.sequence, bids, asks = snapshot
+        self.bids = dict(bids)
+        self.asks = dict(asks)
+        self.last_trade = None
+        # (price, quantity) of the most recent trade seen
+
+    def __call__(self, symbol, updates):
+        self.apply(updates)
+
+    def apply(self, updates):
+        for update in updates:
+            if update.sequence <= self.sequence:
+                continue
+            if update.sequence != self.sequence + 1:
+                raise SequenceGap("Missed Book Updates " + str(self.sequence + 1) + " To " +
+                                  str(update.sequence - 1) + "!")
+            self.sequence = update.sequence
+            if update.type == BookUpdateType.TRADE:
+                self.last_trade = update.price, update.quantity
+                continue
+            levels = self.bids if update.side == OrderSide.BUY else self.asks
+            if update.type == BookUpdateType.LEVEL_REMOVED:
+                del levels[update.price]
+            else:
+                levels[update.price] = update.quantity
+
+    def depth(self, n):
+        # the same (bids, asks) lists as MatchingEngine.depth
+        return (sorted(self.bids.items(), reverse=True)[:n], sorted(self.asks.items())[:n])
+
+
+class BarSeries():
+    # The most recent capacity OHLCV bars of one interval (in seconds), in a ring of preallocated
+    # columns. Bar i is kept in slot i % capacity; intervals without trades get no bar.
+    def __init__(self, interval, capacity=1024):
+        self.interval = interval
+        self.capacity = capacity
+        self.starts = array('d', bytes(8 * capacity))
+        self.opens = array('d', bytes(8 * capacity))
+        self.highs = array('d', bytes(8 * capacity))
+        self.lows = array('d', bytes(8 * capacity))
+        self.closes = array('d', bytes(8 * capacity))
+        self.volumes = array('q', bytes(8 * capacity))
+        self.count = 0
+        # bars started so far
+        self.start = None
+        # start time of the current bar
+
+    def add(self, trade_time, price, quantity):
+        start = trade_time - trade_time % self.interval
+        if start != self.start:
+            i = self.count % self.capacity
+            self.count += 1
+            self.start = self.starts[i] = start
+            self.opens[i] = self.highs[i] = self.lows[i] = self.closes[i] = price
+            self.volumes[i] = quantity
+            return
+        i = (self.count - 1) % self.capacity
+        if price > self.highs[i]:
+            self.highs[i] = price
+        elif price < self.lows[i]:
+            self.lows[i] = price
+        self.closes[i] = price
+        self.volumes[i] += quantity
+
+    def bars(self, n=None):
+        # (start, open, high, low, close, volume) of the last n bars kept (all of them by default),
+        # oldest first; the last one may still be in progress
+        kept = min(self.count, self.capacity)
+        n = kept if n is None else min(n, kept)
+        return [(self.starts[j], self.opens[j], self.highs[j], self.lows[j], self.closes[j], self.volumes[j])
+                for j in (i % self.capacity for i in range(self.count - n, self.count))]
+
+
+class BarAggregator():
+    # Subscribes to MatchingEngines (pass the aggregator to subscribe) and keeps a BarSeries for each
+    # interval of every symbol it hears from, updated as the trades arrive. Trades are timed by
+    # clock when their batch is published.
+    def __init__(self, intervals=(1, 60, 300), capacity=1024, clock=time.time):
+        self.intervals = intervals
+        self.capacity = capacity
+        self.clock = clock
+        self.series = {}
+        # symbol -> {interval: BarSeries}
+
+    def __call__(self, symbol, updates):
+        series = self.series.get(symbol)
+        if series is None:
+            series = self.series[symbol] = {interval: BarSeries(interval, self.capacity)
+                                            for interval in self.intervals}
+        now = None
+        for update in updates:
+            if update.type != BookUpdateType.TRADE:
+                continue
+            if now is None:
+                now = self.clock()
+            for bars in series.values():
+                bars.add(now, update.price, update.quantity)
+
+    def bars(self, symbol, interval, n=None):
+        # the last n bars of symbol at interval, as BarSeries.bars gives them (none if it has not
+        # traded)
+        series = self.series.get(symbol)
+        if series is None:
+            return []
+        return series[interval].bars(n)
+
+
+SYMBOL_BITS = 16
+SEQUENCE_BITS = 47
+
+
+class SymbolRouter():
+    # Keeps one MatchingEngine per symbol and routes every order, amend and cancel to the right one.
+    # A book is created the first time its symbol is seen. Symbols are interned into small integer
+    # ids: callers that hold an id reach the book with a list index, and even lookups by name only
+    # hash a string once, since the table keys are interned.
+    # Order ids carry the symbol id above their low SEQUENCE_BITS bits, so they are unique across
+    # all books and an amend or cancel finds its book without any extra index. The low bits are a
+    # running count, which keeps consecutive ids apart in the low bits that dicts hash on.
+    def __init__(self):
+        self.symbol_ids = {}
+        self.symbols = []
+        self.engines = []
+        self.order_ids = itertools.count(1)
+
+    def symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.add_symbol(symbol)
+        return symbol_id
+
+    def add_symbol(self, symbol, tick_size=None, min_price=None, max_price=None):
+        # creates the book of a new symbol ahead of its first order, on a price ladder if tick_size
+        # is given (see MatchingEngine), and returns its id
+        if symbol in self.symbol_ids:
+            raise ValueError("Symbol Already Has A Book!")
+        symbol_id = len(self.symbols)
+        if symbol_id >= 1 << SYMBOL_BITS:
+            raise OverflowError("Too Many Symbols!")
+        symbol = sys.intern(symbol)
+        matching_engine = MatchingEngine(symbol, tick_size, min_price, max_price)
+        self.symbol_ids[symbol] = symbol_id
+        self.symbols.append(symbol)
+        self.engines.append(matching_engine)
+        return symbol_id
+
+    def engine(self, symbol):
+        return self.engines[self.symbol_id(symbol)]
+
+    def engine_for_order(self, id):
+        symbol_id = id >> SEQUENCE_BITS
+        if 0 <= symbol_id < len(self.engines):
+            return self.engines[symbol_id]
+        return None
+
+    def next_order_id(self, symbol_id):
+        return symbol_id << SEQUENCE_BITS | next(self.order_ids)
+
+    def resting_order(self, id):
+        # the order with this id if it is still resting in its book, otherwise None
+        matching_engine = self.engine_for_order(id)
+        if matching_engine is None:
+            return None
+        return matching_engine.orders.get(id)
+
+    def handle_order(self, order):
+        symbol_id = self.symbol_id(order.symbol)
+        if order.id is None:
+            order.id = self.next_order_id(symbol_id)
+        return self.engines[symbol_id].handle_order(order)
+
+    def check_price(self, order):
+        self.engine(order.symbol).check_price(order)
+
+    def handle_orders(self, batch):
+        symbol_id = self.symbol_id(batch.symbol)
+        return self.engines[symbol_id].handle_orders(batch, lambda: self.next_order_id(symbol_id))
+
+    def amend_quantity(self, id, quantity):
+        matching_engine = self.engine_for_order(id)
+        if matching_engine is None:
+            return False
+        return matching_engine.amend_quantity(id, quantity)
+
+    def cancel_order(self, id):
+        matching_engine = self.engine_for_order(id)
+        if matching_engine is None:
+            return False
+        return matching_engine.cancel_order(id)
 
 
 # ----------------------------------------------------------
@@ -539,16 +1304,20 @@ class MatchingEngine():
 # 4 - Return Balance And Position
 
 # request - (Action #, Trader ID, Additional Arguments) -  this should be appended to trader_to_exchange
+# Traders add the perf_counter_ns time they queued a request after the arguments (see Trader.stamp),
+# which the exchange uses for its latency histograms; requests without it are handled the same way
 # result - (Action #, Action Return) - this should be appended to exchange_to_trader
 
-# WE ASSUME 'AAPL' IS THE ONLY TRADED STOCK.
+# Each trader trades a single symbol, 'AAPL' unless it is given another one.
+# The exchange keeps a separate book for every symbol it sees.
 
 
 # the Trader class is inherited from thread class
 class Trader(MyThread):
     loop_count = 0
-    def __init__(self, id):
-        super().__init__(id)
+    def __init__(self, id, symbol='AAPL', threads=None):
+        super().__init__(id, threads)
+        self.symbol = symbol
         self.book_position = 0 #position of each trader (should be opposite to that of the exchange)
         # the position records the number of shares owned by the trader
         # self.balance_track = [1000000]
@@ -556,6 +1325,16 @@ class Trader(MyThread):
         self.limit_counter = 0
         # the traders each start with a balance of 1,000,000 and nothing on the books
         # each trader is a thread
+        self.requests = trader_to_exchange
+        self.mailbox = None
+        # where the trader sends its requests and receives the exchange's acks; the trader has no
+        # mailbox until a Runtime gives it one and hands it to the exchange (see Exchange.add_trader)
+        self.clock = time.time
+        # what the trader's orders are timestamped with; a Simulation swaps in its simulated clock
+        self.random = random.Random()
+        # where the trader's random choices come from, seeded from the system; seeding it makes them
+        # repeatable. Being an instance rather than the random module, it pickles with the trader
+        # when a process backend or pool sends the trader to another process.
 
     def place_limit_order(self, quantity=None, price=None, side=None):
         # Make sure the limit order given has the parameters necessary to construct the order
@@ -563,10 +1342,11 @@ class Trader(MyThread):
         quantity = 100
         price = 10000
         # side = OrderSide(1)
-        side = OrderSide(random.randint(1,2))
+        side = OrderSide(self.random.randint(1,2))
         self.limit_counter += quantity
         # The 'order' returned must be of type LimitOrder
-        myorder = LimitOrder(self.id, 'AAPL', quantity, price, side, time.time())
+        # the order id is left empty; the exchange assigns a unique one when it accepts the order
+        myorder = LimitOrder(None, self.symbol, quantity, price, side, self.clock())
 
         # print('id: ', self.id)
 
@@ -583,7 +1363,7 @@ class Trader(MyThread):
         quantity = 100
         price = 10000
         # The 'order' returned must be of type MarketOrder
-        myorder = MarketOrder(self.id, 'AAPL', quantity, side, time.time())
+        myorder = MarketOrder(None, self.symbol, quantity, side, self.clock())
         # trader_to_exchange.append(myorder)
         # Make sure you modify the book position after the trade
         # You must return a tuple of the following:
@@ -596,9 +1376,9 @@ class Trader(MyThread):
         quantity = 100
         price = 10000
         # side = OrderSide(random.randint(1, 2))
-        side = OrderSide(random.randint(1,2))
+        side = OrderSide(self.random.randint(1,2))
         # The 'order' returned must be of type IOCOrder
-        myorder = IOCOrder(self.id, 'AAPL', quantity, price, side, time.time())
+        myorder = IOCOrder(None, self.symbol, quantity, price, side, self.clock())
         # trader_to_exchange.append(myorder)
         # Make sure you modify the book position after the trade
         # You must return a tuple of the following:
@@ -631,7 +1411,11 @@ class Trader(MyThread):
         # 4 different types of responses
         # --filled order, use filled order's quantity to update
 
-        if response[0] == 1:
+        if response[0] == 1 and type(response[1]) is RejectedOrder:
+            # nothing traded, and a rejected limit order will not rest either
+            if response[1].type == OrderType.LIMIT:
+                self.limit_counter -= response[1].quantity
+        elif response[0] == 1:
             filled_limit_order = response[1]
             self.limit_counter -= filled_limit_order.quantity
             if filled_limit_order.side == OrderSide.BUY:
@@ -650,7 +1434,9 @@ class Trader(MyThread):
             if response[1]:
                 self.limit_counter = 0
         elif response[0] == 4:
-            print('balance: ', response[1][0], ' position: ', response[1][1])
+            if event_log.level <= LogLevel.INFO:
+                event_log.log(LogLevel.INFO, LogEvent.POSITION_RECEIVED, self.id, 0,
+                              response[1][1].get(self.symbol, 0), response[1][0])
 
         # --Amend quantity, need to use balance and position to check, then update the numbers
         # --Cancel order, revert the counter for limit order to 0
@@ -687,23 +1473,57 @@ class Trader(MyThread):
 
     # The action taken can be random or deterministic, your choice
 
+    def stamp(self, request):
+        # the request with the time it is queued at appended, for the exchange's latency histograms
+        return request + (time.perf_counter_ns(),)
+
     def run_infinite_loop(self):
         # print('loop -1')
         if self.balance_track >= 0:
             if Trader.loop_count > 99:
                 # print('first id:', self.id)
                 try:
-                    response = exchange_to_trader[self.id].popleft()
-                    print('id:', self.id, response)
+                    response = self.mailbox.get_nowait()
+                    if event_log.level <= LogLevel.DEBUG:
+                        event_log.log(LogLevel.DEBUG, LogEvent.ACK_RECEIVED, self.id, 0, response[0])
                     self.process_response(response)
-                except IndexError:
+                except queue.Empty:
                     pass
                 # firstly update and process the response from trader class
                 # however this should only run during the first cycle
-            print('loop 1: ',Trader.loop_count)
+            if event_log.level <= LogLevel.DEBUG:
+                event_log.log(LogLevel.DEBUG, LogEvent.TRADER_STEP, self.id, 0, Trader.loop_count)
             Trader.loop_count += 1
             action_request = self.random_action()
-            trader_to_exchange.append(action_request)
+            self.requests.put(self.stamp(action_request))
+
+    def process_responses(self):
+        # process every ack waiting in the mailbox, without blocking
+        while True:
+            try:
+                response = self.mailbox.get_nowait()
+            except queue.Empty:
+                return
+            self.process_response(response)
+
+    def run(self, steps):
+        # the trader's loop under a threaded or process Runtime: up to steps actions, stopping early
+        # once the balance runs out. put blocks while the exchange's request queue is full.
+        for _ in range(steps):
+            if self.balance_track < 0:
+                break
+            self.requests.put(self.stamp(self.random_action()))
+            self.process_responses()
+
+    async def run_async(self, steps):
+        # the same loop as a task under the asyncio Runtime. put only suspends the task while the
+        # request queue is full, which is when the exchange gets to run and drain it
+        for _ in range(steps):
+            if self.balance_track < 0:
+                break
+            await self.requests.put(self.stamp(self.random_action()))
+            while not self.mailbox.empty():
+                self.process_response(self.mailbox.get_nowait())
 
 
 
@@ -714,54 +1534,312 @@ class Trader(MyThread):
 # The trader then takes any received responses from the exchange and processes it
 # trader_to_exchange = deque()
 # exchange_to_trader = [deque() for _ in range(100)]
+REQUEST_LENGTHS = (None, 3, 3, 2, 2)
+# the length of a request of each action type before the trader's timestamp
+NO_LIQUIDITY = "No Orders To Trade Against!"
+# the reason a RejectedOrder gives for a market order that could not trade at all
+
+
+class LatencyHistogram():
+    # Counts of latencies in nanoseconds in log spaced buckets, in a fixed array allocated up front.
+    # Values below 2 * 2**SUB_BITS get a bucket each; above that every power of two is split into
+    # 2**SUB_BITS buckets, so a bucket is never wider than 1/16th of the values in it, from
+    # nanoseconds up to the 2**63 ns limit of a 64 bit counter.
+    SUB_BITS = 4
+    BUCKETS = (64 - SUB_BITS) << SUB_BITS
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * LatencyHistogram.BUCKETS))
+        self.count = 0
+        self.max = 0
+
+    def record(self, nanoseconds):
+        # a couple of integer operations and an in-place increment: nothing is allocated that
+        # outlives the call. SUB_BITS is written out as 4 here to keep the lookups off this path.
+        shift = nanoseconds.bit_length() - 5
+        if shift > 0:
+            self.counts[(shift << 4) + (nanoseconds >> shift)] += 1
+        else:
+            self.counts[nanoseconds] += 1
+        self.count += 1
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    @staticmethod
+    def upper_bound(index):
+        # the largest latency that falls into bucket index
+        if index < 2 << LatencyHistogram.SUB_BITS:
+            return index
+        shift = (index >> LatencyHistogram.SUB_BITS) - 1
+        return ((index - (shift << LatencyHistogram.SUB_BITS) + 1) << shift) - 1
+
+    def percentile(self, fraction):
+        # a latency at least as large as the given fraction of those recorded (never above the max)
+        if self.count == 0:
+            return 0
+        rank = max(1, -(-self.count * fraction // 1))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(LatencyHistogram.upper_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'p50': self.percentile(0.5), 'p99': self.percentile(0.99),
+                'p99.9': self.percentile(0.999), 'max': self.max}
+
+
 # the exchange class is inherited from thread class
 class Exchange(MyThread):
     requests_no = 0
-    def __init__(self):
-        super().__init__()
-        self.balance = [1000000 for _ in range(100)]
-        # an array of 1000000 of size 100 representing the balance of each trader
-        self.position = [0 for _ in range(100)]
-        # an array of 0 of size 100 representing the position of exchange relative to each trader
-        self.matching_engine = MatchingEngine()
+    def __init__(self, traders=0, threads=None):
+        super().__init__(threads=threads)
+        self.starting_balance = 1000000
+        self.balance = [self.starting_balance for _ in range(traders)]
+        # the balance of each trader, indexed by trader id; it starts with traders accounts and
+        # grows to the largest id seen, every new account opening with starting_balance
+        self.position = defaultdict(dict)
+        # trader id -> the position of exchange relative to that trader, as a symbol -> quantity
+        # dict, made the first time the trader trades
+        self.router = SymbolRouter()
         # The exchange keeps track of the traders' balances
-        # The exchange uses the matching engine you built previously
-
-    def place_new_order(self, order):
+        # The exchange uses the matching engine you built previously, one per symbol
+        self.order_owner = {}
+        # engine order id -> id of the trader who placed it, used to route fills back
+        self.open_orders = defaultdict(deque)
+        # trader id -> the order ids the trader has placed, oldest first, made the first time it
+        # places one; ids that have since left the book are dropped lazily when the trader next
+        # amends or cancels
+        self.requests = trader_to_exchange
+        self.mailboxes = {}
+        # the queue requests arrive on, and trader id -> mailbox for the acks of every trader taking
+        # part; traders join with their mailbox and leave through add_trader and remove_trader, and
+        # acks to a trader without one are dropped
+        self.journal = None
+        # a RequestJournal (see journal.py) that records every request before it is handled, and
+        # every trader added or removed
+        self.tape = None
+        # a TradeTape (see tape.py) that records every execution
+        self.latencies = [None] + [LatencyHistogram() for _ in ActionType]
+        # per action type, the time from a trader queuing a request to its last ack being in the
+        # trader's mailbox (see latency_report)
+
+    def reply(self, trader_id, response):
+        # mailboxes are never bounded, so this does not block (see Runtime)
+        try:
+            self.mailboxes[trader_id].put_nowait(response)
+        except KeyError:
+            # the trader has left, so nobody is waiting for the ack
+            pass
+
+    def add_trader(self, trader_id=None, mailbox=None):
+        # opens an account for trader_id (the next unused id by default) unless it already has one,
+        # and sends its acks to mailbox from now on; returns the trader's id
+        if trader_id is None:
+            trader_id = len(self.balance)
+        if self.journal is not None:
+            self.journal.add_trader(trader_id)
+        self.open_account(trader_id)
+        if mailbox is not None:
+            self.mailboxes[trader_id] = mailbox
+        return trader_id
+
+    def open_account(self, trader_id):
+        # grows the balances to cover trader_id. Only the balance list is sized to the largest id;
+        # positions and open orders are made when a trader first needs them
+        added = trader_id + 1 - len(self.balance)
+        if added > 0:
+            self.balance.extend([self.starting_balance] * added)
+
+    def remove_trader(self, trader_id):
+        # cancels the trader's resting orders and drops its mailbox; its balance and position stay
+        if self.journal is not None:
+            self.journal.remove_trader(trader_id)
+        open_orders = self.open_orders.pop(trader_id, ())
+        while open_orders:
+            order_id = open_orders.popleft()
+            if self.router.resting_order(order_id) is not None:
+                self.router.cancel_order(order_id)
+                del self.order_owner[order_id]
+        self.mailboxes.pop(trader_id, None)
+
+    def add_symbol(self, symbol, tick_size=None, min_price=None, max_price=None):
+        # creates the book of a new symbol ahead of its first order, as router.add_symbol does, and
+        # journals it once the router has taken it, so a replay builds the same book; returns its id
+        symbol_id = self.router.add_symbol(symbol, tick_size, min_price, max_price)
+        if self.journal is not None:
+            self.journal.add_symbol(symbol, tick_size, min_price, max_price)
+        return symbol_id
+
+    def place_new_order(self, order, trader_id):
         # The exchange must use the matching engine to handle orders given
-        filled_order = self.matching_engine.handle_limit_order(order)
-        # adding the filled order to the info to be sent to trader
-        # exchange_to_trader[order.id].append(filled_order)
+        # order ids are assigned by the exchange, whatever the trader put there
+        order.id = None
+        executions = self.router.handle_order(order)
+        if order.type == OrderType.MARKET and not executions:
+            # the engine drops a market order that finds nothing to trade against
+            self.reply(trader_id, (ActionType.PLACE_ORDER.value,
+                                   RejectedOrder(order.id, order.symbol, order.quantity, order.side, order.time,
+                                                 OrderType.MARKET, NO_LIQUIDITY)))
+        if self.router.resting_order(order.id) is not None:
+            self.order_owner[order.id] = trader_id
+            self.open_orders[trader_id].append(order.id)
         # exchange to trader information
-        # order id, limit order enum, order itself
+        # the engine reports each match once; it is fanned out here into a fill for each of the two
+        # traders, resting order first
+        if order.side == OrderSide.BUY:
+            passive_side = OrderSide.SELL
+        else:
+            passive_side = OrderSide.BUY
         results = []
-        for item in filled_order:
-            # append the filled orders to results
-            results.append((item.id, (ActionType.PLACE_ORDER.value, item)))
-            # update the book position and balance based on sell or buy
-            if item.side == OrderSide.BUY:
-                self.position[item.id] -= item.quantity
-                self.balance[item.id] -= item.quantity*item.price
-            elif item.side == OrderSide.SELL:
-                self.position[item.id] += item.quantity
-                self.balance[item.id] += item.quantity * item.price
+        tape = self.tape
+        for report in executions:
+            if self.router.resting_order(report.passive_id) is not None:
+                owner = self.order_owner[report.passive_id]
             else:
-                raise UndefinedOrderSide("Undefined Order Side!")
+                # the resting order was filled completely and has left the book
+                owner = self.order_owner.pop(report.passive_id)
+            if tape is not None:
+                tape.record(report.sequence, order.time, order.symbol, report.price, report.quantity,
+                            order.side.value, trader_id, owner)
+            results.append((owner, (ActionType.PLACE_ORDER.value,
+                                    FilledOrder(report.passive_id, order.symbol, report.quantity, report.price,
+                                                passive_side, order.time))))
+            results.append((trader_id, (ActionType.PLACE_ORDER.value,
+                                        FilledOrder(order.id, order.symbol, report.quantity, report.price,
+                                                    order.side, order.time))))
+            self.settle(owner, order.symbol, passive_side, report.quantity, report.price)
+            self.settle(trader_id, order.symbol, order.side, report.quantity, report.price)
 
         for requests in results:
-            print('request id: ',self.id, 'length request: ', Exchange.requests_no)
+            if event_log.level <= LogLevel.DEBUG:
+                fill = requests[1][1]
+                event_log.log(LogLevel.DEBUG, LogEvent.FILL_SENT, requests[0], fill.id, fill.quantity, fill.price)
             # Exchange.requests_no+=1
-            exchange_to_trader[requests[0]].append(requests[1])
+            self.reply(requests[0], requests[1])
 
         # The list of results is expected to contain a tuple of the follow form:
         # (Trader id that processed the order, (action type enum, order))
         # The exchange must update the balance of positions of each trader involved in the trade (if any)
         return 0
 
+    def place_orders(self, batch, trader_ids):
+        # columnar counterpart of place_new_order for a whole OrderBatch of one symbol, with
+        # trader_ids giving the trader behind each of its orders. The batch goes through the engine's
+        # handle_orders, and every fill is recorded and acked just as place_new_order does (acks to
+        # traders without a mailbox are dropped); the fills are then settled together by
+        # settle_fills. A journal gets the batch as one place request per order once the engine has
+        # accepted it, before anything is settled or acked. The engine takes a batch whole or not at
+        # all, so a price off the symbol's ladder gets every order of the batch a RejectedOrder,
+        # with no id, and nothing is journaled. Returns the ExecutionColumns.
+        trader_ids = trader_ids.tolist() if hasattr(trader_ids, 'tolist') else list(trader_ids)
+        batch.id = None
+        try:
+            executions = self.router.handle_orders(batch)
+        except (PriceNotOnTick, PriceOutOfBand) as error:
+            _, sides, types, _, quantities = batch.columns()
+            for trader_id, side, order_type, quantity in zip(trader_ids, sides, types, quantities):
+                self.reply(trader_id, (ActionType.PLACE_ORDER.value,
+                                       RejectedOrder(None, batch.symbol, quantity, OrderSide(side), batch.time,
+                                                     OrderType(order_type), str(error))))
+            return ExecutionColumns()
+        if trader_ids and max(trader_ids) >= len(self.balance):
+            self.open_account(max(trader_ids))
+        if self.journal is not None:
+            self.journal.append_batch(batch, trader_ids)
+        placed = dict(zip(batch.id, trader_ids))
+        resting_order, order_owner = self.router.resting_order, self.order_owner
+        symbol, now = batch.symbol, batch.time
+        order_sides = (None, OrderSide.BUY, OrderSide.SELL)
+        tape = self.tape
+        buyers, sellers = [], []
+        for sequence, aggressor_id, passive_id, side, price, quantity in zip(
+                executions.sequence, executions.aggressor_id, executions.passive_id, executions.side,
+                executions.price, executions.quantity):
+            # the resting order may have come from earlier in the same batch
+            owner = placed.get(passive_id)
+            if owner is None:
+                owner = order_owner[passive_id]
+            trader_id = placed[aggressor_id]
+            aggressor_side = order_sides[side]
+            passive_side = order_sides[3 - side]
+            if tape is not None:
+                tape.record(sequence, now, symbol, price, quantity, side, trader_id, owner)
+            if aggressor_side == OrderSide.BUY:
+                buyers.append(trader_id)
+                sellers.append(owner)
+            else:
+                buyers.append(owner)
+                sellers.append(trader_id)
+            self.reply(owner, (ActionType.PLACE_ORDER.value,
+                               FilledOrder(passive_id, symbol, quantity, price, passive_side, now)))
+            self.reply(trader_id, (ActionType.PLACE_ORDER.value,
+                                   FilledOrder(aggressor_id, symbol, quantity, price, aggressor_side, now)))
+        if buyers:
+            self.settle_fills(symbol, buyers, sellers, executions.price, executions.quantity)
+        # the book is only looked at once the whole batch is through, since an order can be filled
+        # by several orders of the batch
+        for passive_id in set(executions.passive_id):
+            if passive_id not in placed and resting_order(passive_id) is None:
+                del order_owner[passive_id]
+        for order_id, trader_id in placed.items():
+            if resting_order(order_id) is not None:
+                order_owner[order_id] = trader_id
+                self.open_orders[trader_id].append(order_id)
+        ids, sides, types, _, quantities = batch.columns()
+        market = OrderType.MARKET.value
+        if market in types:
+            # market orders that found nothing to trade against were dropped, as in place_new_order
+            traded = set(executions.aggressor_id)
+            for order_id, side, order_type, quantity in zip(ids, sides, types, quantities):
+                if order_type == market and order_id not in traded:
+                    self.reply(placed[order_id], (ActionType.PLACE_ORDER.value,
+                                                  RejectedOrder(order_id, symbol, quantity, order_sides[side], now,
+                                                                OrderType.MARKET, NO_LIQUIDITY)))
+        return executions
+
+    def settle_fills(self, symbol, buyers, sellers, prices, quantities):
+        # settles a batch of fills in symbol, given as columns, with one update per trader in it: the
+        # cash and quantities are netted per trader in NumPy by ledger.net_fills. NumPy is only
+        # needed for batches, so ledger is imported here rather than with the rest.
+        from ledger import net_fills
+        traders, received, bought = net_fills(buyers, sellers, prices, quantities)
+        balance, positions = self.balance, self.position
+        for trader_id, cash, quantity in zip(traders.tolist(), received.tolist(), bought.tolist()):
+            balance[trader_id] += cash
+            position = positions[trader_id]
+            position[symbol] = position.get(symbol, 0) - quantity
+
+    def settle(self, trader_id, symbol, side, quantity, price):
+        # update the book position and balance based on sell or buy
+        position = self.position[trader_id]
+        if side == OrderSide.BUY:
+            position[symbol] = position.get(symbol, 0) - quantity
+            self.balance[trader_id] -= quantity * price
+        elif side == OrderSide.SELL:
+            position[symbol] = position.get(symbol, 0) + quantity
+            self.balance[trader_id] += quantity * price
+        else:
+            raise UndefinedOrderSide("Undefined Order Side!")
+
+    def resting_order_id(self, trader_id):
+        # the trader's oldest order still resting in the book, or None
+        open_orders = self.open_orders.get(trader_id, ())
+        while open_orders:
+            if self.router.resting_order(open_orders[0]) is not None:
+                return open_orders[0]
+            open_orders.popleft()
+        return None
+
     def amend_quantity(self, id, quantity):
         # The matching engine must be able to process the 'amend' action based on the given parameters
+        # id is the trader's id; the amendment applies to the trader's oldest resting order
+        order_id = self.resting_order_id(id)
+        if order_id is None:
+            return ActionType.AMEND_ORDER.value, False
         try:
-            amend_bool = self.matching_engine.amend_quantity(id, quantity)
+            amend_bool = self.router.amend_quantity(order_id, quantity)
             return ActionType.AMEND_ORDER.value, amend_bool
         except NewQuantityNotSmaller:
             return ActionType.AMEND_ORDER.value, False
@@ -771,7 +1849,13 @@ class Exchange(MyThread):
 
     def cancel_order(self, id):
         # The matching engine must be able to process the 'cancel' action based on the given parameters
-        cancel_bool = self.matching_engine.cancel_order(self, id)
+        # id is the trader's id; the cancel applies to the trader's oldest resting order
+        order_id = self.resting_order_id(id)
+        if order_id is None:
+            return ActionType.CANCEL_ORDER.value, False
+        cancel_bool = self.router.cancel_order(order_id)
+        self.open_orders[id].popleft()
+        del self.order_owner[order_id]
         return ActionType.CANCEL_ORDER.value, cancel_bool
 
         # Keep in mind of any exceptions that may be thrown by the matching engine while handling orders
@@ -780,7 +1864,8 @@ class Exchange(MyThread):
     def balance_and_position(self, id):
         # The matching engine must be able to process the 'balance' action based on the given parameters
         # The return must be in the form (action type enum, (trader balance, trader positions))
-        result = (ActionType.RETURN_POSITION.value, (self.balance[id], self.position[id]))
+        # the positions are copied, since the ack may only be read after later fills change them
+        result = (ActionType.RETURN_POSITION.value, (self.balance[id], dict(self.position.get(id, ()))))
         return result
 
     # class ActionType(Enum):
@@ -793,34 +1878,78 @@ class Exchange(MyThread):
         # The exchange must be able to process different types of requests based on the action
         # type given using the functions implemented above
         # catagorize on different responses, update the book and balance
+        if request[0] == 1:
+            order = request[2]
+            try:
+                self.router.check_price(order)
+            except (PriceNotOnTick, PriceOutOfBand) as error:
+                # turned away before it is journaled, so a replay never sees it; it takes no id
+                self.reply(request[1], (ActionType.PLACE_ORDER.value,
+                                        RejectedOrder(None, order.symbol, order.quantity, order.side, order.time,
+                                                      order.type, str(error))))
+                return
+        if self.journal is not None:
+            self.journal.append(request)
+        if request[1] >= len(self.balance):
+            # accounts open on demand, so a trader that was never added can still trade
+            self.open_account(request[1])
         action = request[0]
         if action == 1:
             # the results contains a list of filled orders
-            self.place_new_order(request[2])
+            self.place_new_order(request[2], request[1])
         elif action == 2:
-            exchange_to_trader[request[1]].append(self.amend_quantity(request[1], request[2]))
+            self.reply(request[1], self.amend_quantity(request[1], request[2]))
         elif action == 3:
-            exchange_to_trader[request[1]].append(self.cancel_order(request[1]))
+            self.reply(request[1], self.cancel_order(request[1]))
         elif action == 4:
-            exchange_to_trader[request[1]].append(self.balance_and_position(request[1]))
+            self.reply(request[1], self.balance_and_position(request[1]))
         # You must raise the following exception if the action given is ambiguous
         else:
             raise UndefinedTraderAction("Undefined Trader Action!")
+        if len(request) > REQUEST_LENGTHS[action]:
+            self.latencies[action].record(time.perf_counter_ns() - request[-1])
+
+    def latency_report(self):
+        # the latency percentiles in ns of every action type seen so far, by ActionType name
+        return {action.name: self.latencies[action.value].summary() for action in ActionType}
 
     def run_infinite_loop(self):
         #         # if trader's balance becomes 0 then stop the trading
-        # from trader id0 to trader id99, process their requests
-        for i in range(100):
+        # process every request queued since the last turn, however many traders there are
+        while True:
             try:
-                request = trader_to_exchange.popleft()
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_request(request)
+
+    def serve(self):
+        # the exchange's loop under a threaded or process Runtime: sleeps on the request queue until
+        # a request arrives, and returns when it receives None
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            self.handle_request(request)
+
+    async def serve_async(self):
+        # the exchange's task under the asyncio Runtime. It only suspends in get, when the request
+        # queue is empty; otherwise it takes everything queued so far as one batch and handles it
+        # without giving the traders' tasks a turn in between
+        requests = self.requests
+        while True:
+            batch = [await requests.get()]
+            while not requests.empty():
+                batch.append(requests.get_nowait())
+            for request in batch:
+                if request is None:
+                    return
                 self.handle_request(request)
-            except IndexError:
-                pass
 
 
 
-        # print('askbook: ',self.matching_engine.ask_book)
-        # print('bidbook: ',self.matching_engine.bid_book)
+        # print('askbook: ',self.router.engine('AAPL').ask_book)
+        # print('bidbook: ',self.router.engine('AAPL').bid_book)
 
 
 
@@ -830,14 +1959,231 @@ class Exchange(MyThread):
 # If there are, handle the request using the functions built above and using the
 # corresponding trader's deque, return an acknowledgement based on the response
 
+
+def run_trader_process(trader, steps, results):
+    trader.run(steps)
+    results.put(('done', trader.id))
+    # acks keep arriving until the exchange has handled every request; it ends each mailbox with
+    # None once it has stopped
+    while True:
+        response = trader.mailbox.get()
+        if response is None:
+            break
+        trader.process_response(response)
+    results.put((trader.id, trader.balance_track, trader.book_position, trader.limit_counter))
+
+
+def run_exchange_process(exchange, results):
+    exchange.serve()
+    if exchange.journal is not None:
+        exchange.journal.flush()
+    if exchange.tape is not None:
+        exchange.tape.flush()
+    for mailbox in exchange.mailboxes.values():
+        mailbox.put(None)
+    results.put(('exchange', exchange.balance, exchange.position, exchange.latencies))
+
+
+class Runtime():
+    # Runs an Exchange and its Traders concurrently on one of three backends:
+    #   'thread'  - a threading.Thread each, talking through queue.Queue
+    #   'asyncio' - a task each on one event loop, talking through asyncio.Queue
+    #   'process' - a process each, talking through multiprocessing queues
+    # Every trader takes up to steps actions and stops early once its balance runs out. When all of
+    # them have stopped, the exchange is sent None, handles what is still queued and exits, and the
+    # traders process their remaining acks.
+    # The request queue is bounded, so traders that get ahead of the exchange block in put until it
+    # catches up. Mailboxes are unbounded: if they were bounded too, an exchange blocked on a full
+    # mailbox and a trader blocked on the full request queue would wait on each other forever.
+    BACKENDS = ('thread', 'asyncio', 'process')
+
+    def __init__(self, exchange, traders, backend='thread', queue_size=1024):
+        if backend not in Runtime.BACKENDS:
+            raise ValueError("Backend Must Be One Of " + ", ".join(Runtime.BACKENDS) + "!")
+        self.exchange = exchange
+        self.traders = traders
+        self.backend = backend
+        self.queue_size = queue_size
+
+    def connect(self, requests, mailbox):
+        # gives each trader a new mailbox() and opens accounts for any the exchange has not seen
+        # before; only the traders taking part get a mailbox, whatever their ids
+        self.exchange.requests = requests
+        self.exchange.mailboxes = {}
+        for trader in self.traders:
+            trader.requests = requests
+            trader.mailbox = mailbox()
+            self.exchange.add_trader(trader.id, trader.mailbox)
+
+    def run(self, steps):
+        if self.backend == 'thread':
+            self.run_threads(steps)
+        elif self.backend == 'asyncio':
+            asyncio.run(self.run_tasks(steps))
+        else:
+            self.run_processes(steps)
+
+    def run_threads(self, steps):
+        self.connect(queue.Queue(self.queue_size), queue.SimpleQueue)
+        exchange = threading.Thread(target=self.exchange.serve)
+        traders = [threading.Thread(target=trader.run, args=(steps,)) for trader in self.traders]
+        exchange.start()
+        for t in traders:
+            t.start()
+        for t in traders:
+            t.join()
+        self.exchange.requests.put(None)
+        exchange.join()
+        for trader in self.traders:
+            trader.process_responses()
+
+    async def run_tasks(self, steps):
+        self.connect(asyncio.Queue(self.queue_size), asyncio.Queue)
+        exchange = asyncio.create_task(self.exchange.serve_async())
+        await asyncio.gather(*(trader.run_async(steps) for trader in self.traders))
+        await self.exchange.requests.put(None)
+        await exchange
+        for trader in self.traders:
+            while not trader.mailbox.empty():
+                trader.process_response(trader.mailbox.get_nowait())
+
+    def run_processes(self, steps):
+        # each process works on its own copy of the exchange or trader, so their final state is sent
+        # back through results and copied onto the objects in this process
+        context = multiprocessing.get_context()
+        self.connect(context.Queue(self.queue_size), context.Queue)
+        results = context.Queue()
+        exchange = context.Process(target=run_exchange_process, args=(self.exchange, results))
+        traders = [context.Process(target=run_trader_process, args=(trader, steps, results))
+                   for trader in self.traders]
+        exchange.start()
+        for p in traders:
+            p.start()
+        states = {}
+        done = 0
+        while done < len(traders):
+            result = results.get()
+            if result[0] == 'done':
+                done += 1
+            else:
+                states[result[0]] = result
+        self.exchange.requests.put(None)
+        while len(states) < len(traders) + 1:
+            result = results.get()
+            states[result[0]] = result
+        exchange.join()
+        for p in traders:
+            p.join()
+        self.exchange.balance, self.exchange.position, self.exchange.latencies = states['exchange'][1:]
+        for trader in self.traders:
+            trader.balance_track, trader.book_position, trader.limit_counter = states[trader.id][1:]
+
+
+class SimulatedMailbox():
+    # a trader's mailbox in a Simulation: every ack put in it is delivered to the trader latency
+    # simulated seconds later
+    def __init__(self, simulation, trader):
+        self.simulation = simulation
+        self.trader = trader
+
+    def put_nowait(self, response):
+        simulation = self.simulation
+        simulation.schedule(simulation.now + simulation.latency, Simulation.DELIVERY, self.trader, response)
+
+
+class Simulation():
+    # Runs an Exchange and its Traders as a discrete-event simulation on a simulated clock, in one
+    # thread and as fast as the events can be handled. Events wait in a heap ordered by their time
+    # (ties go in the order they were scheduled), and only the trader or exchange an event is for
+    # does any work:
+    #   WAKE     - a trader takes its next action, which arrives at the exchange latency seconds
+    #              later; its next wake-up is drawn from an exponential distribution with mean
+    #              interval seconds
+    #   ARRIVAL  - the exchange handles a request
+    #   DELIVERY - a trader processes an ack, latency seconds after the exchange sent it
+    #   COHORT   - a TraderCohort (see population.py) draws its next step, which arrives at the
+    #              exchange latency seconds later; it wakes up again like a trader
+    #   BATCH    - the exchange handles a cohort's step
+    # Traders timestamp their orders with the simulated time. Wake-ups are drawn from a random.Random
+    # seeded with seed, so a run is repeatable as long as the traders' own choices are.
+    WAKE = 1
+    ARRIVAL = 2
+    DELIVERY = 3
+    COHORT = 4
+    BATCH = 5
+
+    def __init__(self, exchange, traders, interval=1.0, latency=0.001, seed=None, cohorts=()):
+        self.exchange = exchange
+        self.traders = traders
+        self.cohorts = cohorts
+        self.interval = interval
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.now = 0.0
+        self.events = []
+        self.sequence = itertools.count()
+        self.handled = 0
+        # events handled so far
+        exchange.mailboxes = {}
+        for trader in traders:
+            trader.clock = self.clock
+            exchange.add_trader(trader.id, SimulatedMailbox(self, trader))
+        for cohort in cohorts:
+            cohort.clock = self.clock
+
+    def clock(self):
+        return self.now
+
+    def schedule(self, at, kind, target, payload=None):
+        heapq.heappush(self.events, (at, next(self.sequence), kind, target, payload))
+
+    def run(self, steps, until=None):
+        # every trader and cohort takes up to steps actions, a trader stopping early once its
+        # balance runs out; with until, events after that simulated time are left unhandled.
+        # Returns the simulated time the run ended at.
+        for trader in self.traders:
+            self.schedule(self.now + self.random.expovariate(1 / self.interval), Simulation.WAKE, trader, steps)
+        for cohort in self.cohorts:
+            self.schedule(self.now + self.random.expovariate(1 / self.interval), Simulation.COHORT, cohort, steps)
+        events = self.events
+        handle_request = self.exchange.handle_request
+        latency = self.latency
+        while events:
+            if until is not None and events[0][0] > until:
+                break
+            self.now, _, kind, target, payload = heapq.heappop(events)
+            self.handled += 1
+            if kind == Simulation.ARRIVAL:
+                handle_request(payload)
+            elif kind == Simulation.DELIVERY:
+                target.process_response(payload)
+            elif kind == Simulation.BATCH:
+                target.submit(payload)
+            elif kind == Simulation.COHORT or target.balance_track >= 0:
+                if kind == Simulation.COHORT:
+                    self.schedule(self.now + latency, Simulation.BATCH, target, target.generate())
+                else:
+                    self.schedule(self.now + latency, Simulation.ARRIVAL, None, target.random_action())
+                if payload > 1:
+                    self.schedule(self.now + self.random.expovariate(1 / self.interval), kind, target, payload - 1)
+        return self.now
+
+
 if __name__ == "__main__":
+    # python trading_arena.py [simulated|thread|asyncio|process] [number of traders] [event log path]
+    # 'simulated' runs the session as a discrete-event Simulation, the others under a Runtime.
+    # Given a path, every event down to DEBUG is written there as text.
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'thread'
+    traders = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    if len(sys.argv) > 3:
+        event_log.open(sys.argv[3], LogLevel.DEBUG)
 
     # the trader initiated the thread with numbers so they have ids
-    trader = [Trader(i) for i in range(100)]
+    trader = [Trader(i) for i in range(traders)]
     # creating an array of traders, each i represents the thread number
 
     # the exchange also initiated a thread with 'NoID' as its ID as it had default constructor
-    exchange = Exchange()
+    exchange = Exchange(traders)
 
     # creating a single thread for the exchange
     exchange.start()
@@ -870,15 +2216,14 @@ if __name__ == "__main__":
 
     a = time.time()
 
-    for i in range(10):
-        thread_active = False
-        for t in MyThread.list_of_threads:
-            # for each of the cycles the run_infinite loop needs to update the balance in list_of_threads
-            if t.is_started:
-                t.run_infinite_loop()
-                thread_active = True
-        if not thread_active:
-            break
+    if backend == 'simulated':
+        # each trader acts 10 times, about once a simulated second; only traders with something to do
+        # are stepped
+        simulation = Simulation(exchange, trader)
+        print('simulated seconds: ', simulation.run(10), ' events: ', simulation.handled)
+    else:
+        Runtime(exchange, trader, backend).run(10)
+    event_log.close()
 
     sum_exch = 0
     for t in MyThread.list_of_threads:
@@ -886,6 +2231,8 @@ if __name__ == "__main__":
         if t.id == "NoID":
             for b in t.balance:
                 sum_exch += b
+    for action, latency in exchange.latency_report().items():
+        print('latency ns', action, latency)
     print(len(MyThread.list_of_threads))
     print('time taken: ', time.time()-a)
     print("Total Money Amount for All Traders after Trading Session: ", str(int(sum_exch)))